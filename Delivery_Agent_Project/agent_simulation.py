@@ -3,15 +3,20 @@ import time
 import random
 import os
 import json
+import threading
+from contextlib import contextmanager
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
+from order_store import open_store
+
 # --- Configuration ---
 BACKEND_URL = "http://127.0.0.1:8239/get_order_analysis/"
 IMAGE_BASE_DIR = "images"
 BASE_DIR = os.getcwd()
 LOG_FILE = os.path.join(BASE_DIR, "live_agent_log.csv")
+ORDER_ID_COUNTER_FILE = os.path.join(BASE_DIR, "order_id_counter.txt")
 
 # --- Helper to scan images ---
 def get_available_images():
@@ -28,29 +33,129 @@ def get_available_images():
 
 # --- NEW: Helper to get the next Order ID ---
 def get_next_order_id():
-    """Checks the log file to find the highest previous ID and increments it."""
+    """Looks up the highest previous ID in the order store and increments it."""
     start_id = 5000
-    if os.path.exists(LOG_FILE):
-        try:
-            df = pd.read_csv(LOG_FILE)
-            if not df.empty and 'order_id' in df.columns:
-                last_id = df['order_id'].max()
-                # Ensure it's a valid integer
-                if pd.notna(last_id):
-                    return int(last_id) + 1
-        except Exception as e:
-            print(f"⚠️ Could not read history: {e}. Starting fresh from {start_id}.")
-    
+    try:
+        last_id = open_store(legacy_csv=LOG_FILE).max_order_id()
+        if last_id is not None:
+            return int(last_id) + 1
+    except Exception as e:
+        print(f"⚠️ Could not read history: {e}. Starting fresh from {start_id}.")
+
     return start_id
 
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock on `path` shared across processes (fcntl on POSIX, msvcrt on Windows)."""
+    with open(path, "a+") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:   # LK_LOCK gives up after ~10 s; keep waiting
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class OrderIdCounter:
+    """Hands out order ids from a small persisted high-water mark.
+
+    Ids are reserved in blocks: the file only records the end of the current
+    block, so allocation is a lock + increment and the file is rewritten once
+    per `block_size` ids. Reservations re-read the file under a cross-process
+    lock, so agent_simulation.py and load_generator.py can share it without
+    issuing the same ids. After a crash the unused rest of a block is skipped,
+    never reissued. The store is consulted only when the counter file is new.
+    """
+
+    def __init__(self, path=ORDER_ID_COUNTER_FILE, block_size=1000):
+        self.path = path
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.next_id = self._read() or get_next_order_id()
+        self.block_end = self.next_id
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _reserve(self):
+        with _file_lock(self.path + ".lock"):
+            # Another process may have reserved blocks since we last looked.
+            self.next_id = max(self._read() or 0, self.next_id)
+            self.block_end = self.next_id + self.block_size
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(self.block_end))
+            os.replace(tmp_path, self.path)
+
+    def allocate(self):
+        with self.lock:
+            if self.next_id >= self.block_end:
+                self._reserve()
+            order_id = self.next_id
+            self.next_id += 1
+            return order_id
+
+# --- Helper to build a realistic order ---
+def generate_order(order_id, ok_images, damaged_images, rng=random):
+    """Returns the form payload for one simulated order (pass a seeded rng to reproduce it)."""
+    # Generate random realistic features
+    distance_km = round(rng.uniform(1.0, 18.0), 2)
+    estimated_time = datetime.now()
+
+    # Simulate delays
+    base_lateness = rng.randint(-15, 35)
+    actual_time = estimated_time + timedelta(minutes=base_lateness)
+
+    weather = rng.choices(['Clear', 'Rain', 'Fog'], weights=[0.70, 0.25, 0.05])[0]
+    restaurant_load = rng.choices(['Low', 'Medium', 'High'], weights=[0.4, 0.4, 0.2])[0]
+
+    # Pick an image
+    if base_lateness > 20 and rng.random() < 0.7:
+        image_filename = rng.choice(damaged_images)
+    else:
+        image_filename = rng.choice(ok_images)
+
+    order_data = {
+        "order_id": order_id,
+        "estimated_delivery_time": estimated_time.isoformat(),
+        "actual_delivery_time": actual_time.isoformat(),
+        "distance_km": distance_km,
+        "weather": weather,
+        "restaurant_load": restaurant_load
+    }
+
+    return {
+        'image_filename': image_filename,
+        'order_data_json': json.dumps(order_data)
+    }
+
 # --- The Agent Logic ---
 def run_autonomous_agent(interval_seconds=5):
     print("🚀 INITIALIZING AUTONOMOUS AGENT...")
     print(f"📡 Connecting to Brain at: {BACKEND_URL}")
     
     # 1. Determine Starting ID
-    order_counter = get_next_order_id()
-    print(f"🔢 Continuing sequence from Order ID: #{order_counter}")
+    id_counter = OrderIdCounter()
+    print(f"🔢 Continuing sequence from Order ID: #{id_counter.next_id}")
     print("----------------------------------------------------------------")
     
     ok_images, damaged_images = get_available_images()
@@ -60,43 +165,13 @@ def run_autonomous_agent(interval_seconds=5):
         return
 
     while True:
+        order_counter = id_counter.allocate()
         try:
             # 2. GENERATE LIVE EVENT
             print(f"\n🔔 EVENT DETECTED: New Order #{order_counter}")
-            
-            # Generate random realistic features
-            distance_km = round(random.uniform(1.0, 18.0), 2)
-            estimated_time = datetime.now()
-            
-            # Simulate delays
-            base_lateness = random.randint(-15, 35) 
-            actual_time = estimated_time + timedelta(minutes=base_lateness)
-            
-            weather = random.choices(['Clear', 'Rain', 'Fog'], weights=[0.70, 0.25, 0.05])[0]
-            restaurant_load = random.choices(['Low', 'Medium', 'High'], weights=[0.4, 0.4, 0.2])[0]
-            
-            # Pick an image
-            if base_lateness > 20 and random.random() < 0.7:
-                image_filename = random.choice(damaged_images)
-            else:
-                image_filename = random.choice(ok_images)
-
-            # Create payload (Using pandas Series for easy JSON conversion like before)
-            order_data = pd.Series({
-                "order_id": order_counter,
-                "estimated_delivery_time": estimated_time.isoformat(),
-                "actual_delivery_time": actual_time.isoformat(),
-                "distance_km": distance_km,
-                "weather": weather,
-                "restaurant_load": restaurant_load
-            })
+            payload = generate_order(order_counter, ok_images, damaged_images)
             
             # 3. SEND TO BRAIN
-            payload = {
-                'image_filename': image_filename,
-                'order_data_json': order_data.to_json(date_format='iso')
-            }
-            
             response = requests.post(BACKEND_URL, data=payload)
             
             if response.status_code == 200:
@@ -124,7 +199,6 @@ def run_autonomous_agent(interval_seconds=5):
             print(f"   ❌ UNEXPECTED ERROR: {e}")
 
         print("----------------------------------------------------------------")
-        order_counter += 1
         time.sleep(interval_seconds)
 
 if __name__ == "__main__":
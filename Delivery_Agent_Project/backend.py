@@ -1,13 +1,25 @@
 import os
-import csv
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import List
 from fastapi import FastAPI, HTTPException, Form
 from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel
 import torch
-from torchvision import models, transforms
-from PIL import Image
-import io
-import pandas as pd
+from torchvision import models
+import time
+
+from prediction_cache import PredictionCache, file_digest
+from micro_batcher import MicroBatcher
+import image_pipeline
+import model_backends
+from log_writer import OrderLogWriter
+from order_store import open_store
+from order_record import OrderRecord
+import scoring_rules
 
 app = FastAPI(title="Satisfaction Insight AI Backend", version="2.2.0")
 
@@ -25,29 +37,65 @@ CSV_HEADERS = [
     "analysis_text", "recommendation", "lateness_min"
 ]
 
-if not os.path.exists(LOG_FILE):
-    with open(LOG_FILE, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(CSV_HEADERS)
-
-def log_full_details(order_series, final_score, summary, action, image_filename, analysis_text, recommendation, lateness):
-    """Logs rich data including lateness."""
-    with open(LOG_FILE, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([
-            datetime.now().isoformat(),
-            int(order_series['order_id']),
-            round(final_score, 2),
-            summary,
-            action,
-            order_series.get('distance_km'),
-            order_series.get('weather'),
-            order_series.get('restaurant_load'),
-            image_filename,
-            analysis_text,
-            recommendation,
-            round(lateness, 1) # Log the calculated lateness
-        ])
+# The indexed order store is the system of record (see order_store.py); an
+# existing CSV log is imported into it once, then kept as an export.
+order_store = open_store(legacy_csv=LOG_FILE)
+
+# Orders are group-committed to the store by one writer thread: concurrent
+# requests share a transaction, a locked database is retried, and a request
+# only succeeds once its order is stored (a failed write is a 500, never a
+# silent gap). Stored rows are then appended to the CSV export by a background
+# writer that batches, rotates and fsyncs per LOG_* settings; a CSV failure
+# cannot lose an order.
+STORE_BATCH_MAX_SIZE = int(os.getenv("STORE_BATCH_MAX_SIZE", "256"))
+STORE_BATCH_MAX_WAIT_MS = float(os.getenv("STORE_BATCH_MAX_WAIT_MS", "5"))
+STORE_WRITE_ATTEMPTS = int(os.getenv("STORE_WRITE_ATTEMPTS", "3"))
+STORE_RETRY_BACKOFF_S = float(os.getenv("STORE_RETRY_BACKOFF_S", "0.5"))
+
+order_log = OrderLogWriter(LOG_FILE, CSV_HEADERS)
+
+def store_orders(rows):
+    """Commits rows to the order store, retrying while SQLite reports it locked, then exports them to CSV."""
+    for attempt in range(1, STORE_WRITE_ATTEMPTS + 1):
+        try:
+            order_store.insert_many(rows)
+            break
+        except sqlite3.OperationalError as e:
+            if attempt == STORE_WRITE_ATTEMPTS or "locked" not in str(e):
+                raise
+            print(f"⚠️ Order store busy ({e}); retrying {len(rows)} orders (attempt {attempt + 1})")
+            time.sleep(STORE_RETRY_BACKOFF_S * attempt)
+    for row in rows:
+        order_log.write(row[:-1] + [round(row[-1], 1)])   # the CSV export keeps lateness to 1 decimal
+    return [None] * len(rows)
+
+order_writer = MicroBatcher(store_orders, STORE_BATCH_MAX_SIZE, STORE_BATCH_MAX_WAIT_MS, name="order-store-writer")
+
+@app.on_event("shutdown")
+def close_order_log():
+    order_writer.close()   # first: it feeds the CSV export
+    order_log.close()
+
+def log_full_details(order, final_score, summary, action, image_filename, analysis_text, recommendation, lateness):
+    """Queues the order for the store; the returned Future resolves once it is committed."""
+    return order_writer.submit([
+        datetime.now().isoformat(),
+        order.order_id,
+        round(final_score, 2),
+        summary,
+        action,
+        order.distance_km,
+        order.weather,
+        order.restaurant_load,
+        image_filename,
+        analysis_text,
+        recommendation,
+        lateness # unrounded, so rescoring.py reproduces the live timeliness bucket
+    ])
+
+async def orders_stored(futures):
+    """Waits for store commits. Shielded: a dropped client or cancelled handler cannot withdraw its order."""
+    await asyncio.shield(asyncio.gather(*(asyncio.wrap_future(f) for f in futures)))
 
 # --- Model Loading ---
 MODEL_PATH = 'packaging_classifier_model.pth'
@@ -67,98 +115,247 @@ def load_packaging_model():
     model.eval()
     return model
 
-packaging_model = load_packaging_model()
-image_transforms = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
+# PACKAGING_BACKEND picks eager / channels_last / torchscript / int8 (see model_backends.py)
+packaging_model = model_backends.optimise(load_packaging_model(), model_backends.PACKAGING_BACKEND, device)
 
 # --- Core Logic ---
-def calculate_lateness(order_data):
-    estimated = pd.to_datetime(order_data['estimated_delivery_time'])
-    actual = pd.to_datetime(order_data['actual_delivery_time'])
-    lateness = (actual - estimated).total_seconds() / 60
-    return lateness
+def calculate_lateness(order):
+    # Timestamps are parsed once, when the OrderRecord is built (see order_record.py)
+    return order.lateness_min
 
 def get_timeliness_status(lateness):
-    if lateness <= 0: return 5.0, "Excellent"
-    elif lateness <= 5: return 4.0, "Good"
-    elif lateness <= 15: return 3.0, "Average"
-    elif lateness <= 30: return 2.0, "Poor"
-    else: return 1.0, "Very Poor"
+    return scoring_rules.timeliness_status(lateness)
+
+# --- Micro-Batching ---
+# Concurrent requests hand their image tensors to a single worker thread that
+# stacks them into one forward pass instead of running ResNet at batch size 1
+# (see micro_batcher.py).
+BATCH_MAX_SIZE = int(os.getenv("PACKAGING_BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.getenv("PACKAGING_BATCH_MAX_WAIT_MS", "5"))
+
+def classify_tensors(model, tensors):
+    """Runs one forward pass over a list of image tensors; returns (class name, logits) pairs."""
+    batch_t = torch.stack(tensors).to(device)
+    with torch.no_grad():
+        out = model(batch_t)
+        _, preds = torch.max(out, 1)
+    return [(CLASS_NAMES[i], logits) for i, logits in zip(preds.tolist(), out.tolist())]
+
+def load_image_tensor(image_path):
+    # Draft-mode decode / pre-resized tensor cache; see image_pipeline.py
+    return image_pipeline.load_tensor(image_path)
+
+def packaging_status(cls):
+    return scoring_rules.packaging_status(cls)
+
+# submit() takes a single [3, 224, 224] tensor and resolves to (class name, logits)
+packaging_batcher = MicroBatcher(lambda tensors: classify_tensors(packaging_model, tensors),
+                                 BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name="packaging-batcher")
+
+# --- Prediction Cache ---
+# Repeat images (re-submitted complaint photos, the simulator's sample set) skip
+# decode and inference entirely. Set PREDICTION_CACHE_PATH="" to keep it in memory only.
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH", "prediction_cache.json")
+
+prediction_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_SIZE,
+    persist_path=PREDICTION_CACHE_PATH or None,
+    model_tag=f"{file_digest(MODEL_PATH)}:{model_backends.PACKAGING_BACKEND}",
+)
+
+@app.on_event("shutdown")
+def save_prediction_cache():
+    prediction_cache.save()
 
 def predict_packaging(image_path):
     try:
-        img = Image.open(image_path).convert("RGB")
-        img_t = image_transforms(img).unsqueeze(0).to(device)
-        with torch.no_grad():
-            out = packaging_model(img_t)
-            _, pred = torch.max(out, 1)
-            cls = CLASS_NAMES[pred.item()]
-        return (5.0, "Excellent") if cls == 'ok' else (1.0, "Damaged")
+        cached = prediction_cache.get(image_path)
+        if cached is not None:
+            return packaging_status(cached["cls"])
+        img_t = load_image_tensor(image_path)
+        cls, logits = packaging_batcher.submit(img_t).result()
+        prediction_cache.put(image_path, cls, logits)
+        return packaging_status(cls)
     except:
         return 1.0, "Error"
 
+# --- Concurrency ---
+# Decode (and cache hashing) runs on a bounded pool so the event loop stays free;
+# requests beyond MAX_INFLIGHT_ORDERS are shed with a 503 instead of queuing.
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", str(min(8, os.cpu_count() or 1))))
+MAX_INFLIGHT_ORDERS = int(os.getenv("MAX_INFLIGHT_ORDERS", "64"))
+
+decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="packaging-decode")
+
+class AdmissionController:
+    """Counts in-flight orders and refuses new ones once the limit is reached."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.inflight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, n=1):
+        with self._lock:
+            if self.inflight + n > self.limit:
+                self.rejected += n
+                return False
+            self.inflight += n
+            return True
+
+    def release(self, n=1):
+        with self._lock:
+            self.inflight -= n
+
+admission = AdmissionController(MAX_INFLIGHT_ORDERS)
+
+def prepare_packaging(image_path):
+    """Returns ("cached", class name) on a cache hit, else ("tensor", image tensor)."""
+    cached = prediction_cache.get(image_path)
+    if cached is not None:
+        return "cached", cached["cls"]
+    return "tensor", load_image_tensor(image_path)
+
+async def predict_packaging_async(image_path):
+    """Like predict_packaging, but never blocks the event loop on decode or inference."""
+    try:
+        loop = asyncio.get_running_loop()
+        kind, value = await loop.run_in_executor(decode_pool, prepare_packaging, image_path)
+        if kind == "cached":
+            return packaging_status(value)
+        cls, logits = await asyncio.wrap_future(packaging_batcher.submit(value))
+        prediction_cache.put(image_path, cls, logits)
+        return packaging_status(cls)
+    except:
+        return 1.0, "Error"
+
+def predict_packaging_batch(image_paths):
+    """Classifies many images directly, in chunks of BATCH_MAX_SIZE."""
+    results = [(1.0, "Error")] * len(image_paths)
+    misses = []
+    for i, path in enumerate(image_paths):
+        cached = prediction_cache.get(path)
+        if cached is not None:
+            results[i] = packaging_status(cached["cls"])
+        else:
+            misses.append(i)
+
+    tensors = image_pipeline.decode_many([image_paths[i] for i in misses])
+    loaded = [(i, t) for i, t in zip(misses, tensors) if t is not None]
+
+    for start in range(0, len(loaded), BATCH_MAX_SIZE):
+        chunk = loaded[start:start + BATCH_MAX_SIZE]
+        try:
+            predictions = classify_tensors(packaging_model, [t for _, t in chunk])
+        except Exception:
+            continue
+        for (i, _), (cls, logits) in zip(chunk, predictions):
+            prediction_cache.put(image_paths[i], cls, logits)
+            results[i] = packaging_status(cls)
+    return results
+
 def generate_insights(final_score, t_status, p_status, weather, load):
-    reasons = []
-    if p_status == "Damaged": reasons.append("packaging damage")
-    if t_status in ["Poor", "Very Poor"]: reasons.append("significant delay")
-    
-    context = []
-    if weather in ["Rain", "Fog"]: context.append(f"adverse weather ({weather})")
-    if load == "High": context.append("high restaurant load")
-        
-    text = f"Score: {final_score:.1f}/5.0. "
-    if reasons: text += f"Impacted by {', '.join(reasons)}. "
-    if context: text += f"Context: {', '.join(context)}."
-    
-    rec = "Standard Protocol"
-    if final_score < 4.0:
-        if p_status == "Damaged": rec = "Check Handling"
-        elif t_status in ["Poor", "Very Poor"]: rec = "Review Route / Adjust ETA"
-        
-    return text, rec
-
-# --- Endpoint ---
+    return scoring_rules.generate_insights(final_score, t_status, p_status, weather, load)
+
+def analyze_order(order, image_filename, p_score, p_status):
+    """Fuses timeliness and packaging into a score, action and insight, and logs it."""
+    # 1. Analyze
+    lateness = calculate_lateness(order)
+    t_score, t_status = get_timeliness_status(lateness)
+
+    # 2. Fuse (weights and cut-offs live in scoring_rules.py, shared with rescoring.py)
+    final_score = scoring_rules.fuse(t_score, p_score)
+    summary = scoring_rules.summary_text(t_status, p_status)
+
+    # 3. Action
+    action = scoring_rules.action_for(final_score)
+
+    # 4. Insights
+    analysis_text, recommendation = generate_insights(
+        final_score, t_status, p_status,
+        order.weather, order.restaurant_load
+    )
+
+    # 5. Log (to the order store; await the returned Future before answering)
+    stored = log_full_details(
+        order, final_score, summary, action, image_filename,
+        analysis_text, recommendation, lateness
+    )
+
+    return {
+        "order_id": order.order_id,
+        "final_score": round(final_score, 2),
+        "summary": summary,
+        "analysis_text": analysis_text
+    }, stored
+
+# --- Schemas ---
+class OrderAnalysisRequest(BaseModel):
+    image_filename: str
+    order_data: dict
+
+# --- Endpoints ---
+def reject_overload():
+    raise HTTPException(status_code=503, detail="Server busy, retry shortly", headers={"Retry-After": "1"})
+
 @app.post("/get_order_analysis/")
 async def get_order_analysis(image_filename: str = Form(...), order_data_json: str = Form(...)):
+    if not admission.try_acquire():
+        reject_overload()
     try:
-        order_series = pd.read_json(io.StringIO(order_data_json), typ='series')
-        
-        # 1. Analyze
-        lateness = calculate_lateness(order_series)
-        t_score, t_status = get_timeliness_status(lateness)
-        
+        order = OrderRecord.from_json(order_data_json)
+
         img_path = os.path.join("images", image_filename)
-        p_score, p_status = predict_packaging(img_path)
-        
-        # 2. Fuse
-        final_score = (t_score * 0.7) + (p_score * 0.3)
-        summary = f"Timeliness: {t_status}, Packaging: {p_status}"
-        
-        # 3. Action
-        if final_score >= 4.0: action = "No Action"
-        elif final_score >= 2.5: action = "Flagged for Review"
-        else: action = "CRITICAL: Refund Issued"
-        
-        # 4. Insights
-        analysis_text, recommendation = generate_insights(
-            final_score, t_status, p_status, 
-            order_series.get('weather'), order_series.get('restaurant_load')
-        )
-        
-        # 5. Log
-        log_full_details(
-            order_series, final_score, summary, action, image_filename, 
-            analysis_text, recommendation, lateness
+        p_score, p_status = await predict_packaging_async(img_path)
+
+        result, stored = analyze_order(order, image_filename, p_score, p_status)
+        await orders_stored([stored])
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        admission.release()
+
+@app.get("/packaging_cache/")
+def packaging_cache_stats():
+    return prediction_cache.stats()
+
+@app.get("/load/")
+def load_stats():
+    return {
+        "inflight_orders": admission.inflight,
+        "max_inflight_orders": admission.limit,
+        "rejected_orders": admission.rejected,
+        "order_store_writer": order_writer.stats(),
+        "order_log": order_log.stats(),
+    }
+
+@app.post("/get_order_analysis_batch/")
+async def get_order_analysis_batch(orders: List[OrderAnalysisRequest]):
+    """Analyzes many orders at once, classifying all their images in shared batches."""
+    n = max(1, len(orders))
+    if n > admission.limit:
+        # Could never be admitted, so a 503 "retry" would fail forever.
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {n} orders exceeds the maximum of {admission.limit} (MAX_INFLIGHT_ORDERS); split it",
         )
-        
-        return {
-            "order_id": int(order_series['order_id']),
-            "final_score": round(final_score, 2),
-            "summary": summary,
-            "analysis_text": analysis_text
-        }
+    if not admission.try_acquire(n):
+        reject_overload()
+    try:
+        records = [OrderRecord.from_dict(o.order_data) for o in orders]
+        img_paths = [os.path.join("images", o.image_filename) for o in orders]
+        loop = asyncio.get_running_loop()
+        packaging = await loop.run_in_executor(decode_pool, predict_packaging_batch, img_paths)
+
+        analyzed = [analyze_order(order, o.image_filename, p_score, p_status)
+                    for o, order, (p_score, p_status) in zip(orders, records, packaging)]
+        await orders_stored([stored for _, stored in analyzed])
+        results = [result for result, _ in analyzed]
+        return {"count": len(results), "results": results}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        admission.release(n)
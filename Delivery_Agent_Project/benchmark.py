@@ -0,0 +1,316 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+# --- End-to-End Backend Benchmark ---
+# Times every stage of an order's trip through backend.py, alone and chained:
+#   parse_order -> calculate_lateness -> image decode -> ResNet -> generate_insights -> CSV log
+# plus the pre-OrderRecord pandas parsing path (read_json_legacy, request_cpu_legacy)
+# so the CPU saved per request stays visible in every report.
+# The run happens in a scratch directory holding only a link to the image
+# corpus, so backend.py creates a fresh randomly initialised model, the tensor
+# cache and prediction cache are cold, and no real order log or store is touched.
+# The JSON report is meant to be committed/archived and compared with --compare.
+
+STAGES = ("read_json_legacy", "parse_order", "calculate_lateness", "image_decode", "resnet", "resnet_batch",
+          "generate_insights", "csv_log", "request_cpu_legacy", "request_cpu", "end_to_end")
+
+
+def make_orders(images, n, seed):
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1, 12, 0)
+    orders = []
+    for i in range(n):
+        estimated = now + timedelta(minutes=i)
+        order = {
+            "order_id": 100000 + i,
+            "estimated_delivery_time": estimated.isoformat(),
+            "actual_delivery_time": (estimated + timedelta(minutes=rng.randint(-15, 35))).isoformat(),
+            "distance_km": round(rng.uniform(1.0, 18.0), 2),
+            "weather": rng.choice(["Clear", "Rain", "Fog"]),
+            "restaurant_load": rng.choice(["Low", "Medium", "High"]),
+        }
+        orders.append((json.dumps(order), images[i % len(images)]))
+    return orders
+
+
+def summarize(samples_s):
+    ms = np.array(samples_s) * 1000.0
+    return {
+        "n": len(ms),
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "total_s": round(float(ms.sum()) / 1000.0, 4),
+    }
+
+
+def time_each(fn, items):
+    samples = []
+    results = []
+    for item in items:
+        start = time.perf_counter()
+        results.append(fn(item))
+        samples.append(time.perf_counter() - start)
+    return samples, results
+
+
+def peak_alloc_kb(fn, items):
+    """Peak Python heap growth while running fn over items (tracemalloc, so run separately from timing).
+
+    Tensor buffers allocated by torch/numpy outside the Python allocator are
+    not seen here; they show up in the report's max_rss_mb instead.
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    for item in items:
+        fn(item)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round((peak - base) / 1024, 1)
+
+
+def max_rss_mb():
+    """Peak resident memory of this process in MB (None if the platform does not report it)."""
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return round(counters.PeakWorkingSetSize / (1024 * 1024), 1)
+    except (AttributeError, OSError):
+        return None
+
+
+def link_dir(src, dst):
+    """Symlink, else (Windows without symlink rights) a directory junction, else a copy."""
+    try:
+        os.symlink(src, dst, target_is_directory=True)
+        return
+    except (OSError, NotImplementedError):
+        pass
+    if os.name == "nt":
+        import _winapi
+        _winapi.CreateJunction(src, dst)
+    else:
+        shutil.copytree(src, dst)
+
+
+def unlink_dir(path):
+    """Removes a link made by link_dir without touching the linked directory."""
+    if os.path.islink(path):
+        os.unlink(path)
+    elif os.name == "nt" and getattr(os.path, "isjunction", lambda p: False)(path):
+        os.rmdir(path)
+
+
+def run(images_root="images", n_orders=200, seed=0, memory_items=20, batch_size=16):
+    images_root = os.path.abspath(images_root)
+    workdir = tempfile.mkdtemp(prefix="delivery-bench-")
+    link_dir(images_root, os.path.join(workdir, "images"))
+    original_cwd = os.getcwd()
+    os.chdir(workdir)
+    # Always the scratch store: an inherited ORDER_STORE_PATH must not receive benchmark rows.
+    os.environ["ORDER_STORE_PATH"] = os.path.join(workdir, "orders.db")
+    os.environ["PREDICTION_CACHE_PATH"] = ""
+    os.environ["IMAGE_TENSOR_CACHE"] = os.path.join(workdir, "image_tensor_cache")
+
+    import torch
+    import pandas as pd
+    torch.manual_seed(seed)
+    rss_before = max_rss_mb()
+    start = time.perf_counter()
+    import backend
+    import image_pipeline
+    from order_record import OrderRecord
+    startup_s = time.perf_counter() - start
+
+    images = [os.path.relpath(p, "images") for p in image_pipeline.list_images("images")]
+    orders = make_orders(images, n_orders, seed)
+    payloads = [p for p, _ in orders]
+    image_paths = [os.path.join("images", f) for _, f in orders]
+
+    # Inputs for each isolated stage are produced by the previous stage once, up front.
+    records = [OrderRecord.from_json(p) for p in payloads]
+    lateness = [backend.calculate_lateness(r) for r in records]
+    tensors = [backend.load_image_tensor(p) for p in image_paths[:len(images)]]
+    timeliness = [backend.get_timeliness_status(l) for l in lateness]
+    insight_args = [
+        (t_score * 0.7 + 0.3, t_status, "Damaged", r.weather, r.restaurant_load)
+        for r, (t_score, t_status) in zip(records, timeliness)
+    ]
+    log_rows = list(zip(records, lateness, [f for _, f in orders]))
+    batches = [tensors[i:i + batch_size] for i in range(0, len(tensors) - batch_size + 1, batch_size)] or [tensors]
+
+    pending_writes = []
+
+    def log_one(item):
+        r, l, filename = item
+        pending_writes.append(backend.log_full_details(
+            r, 3.0, "Timeliness: Good, Packaging: ok", "Flagged for Review",
+            filename, "Score: 3.0/5.0. ", "Standard Protocol", l))
+
+    def request_cpu_legacy(payload):
+        # The per-request scoring work as it was done before order_record.py.
+        order_series = pd.read_json(io.StringIO(payload), typ='series')
+        estimated = pd.to_datetime(order_series['estimated_delivery_time'])
+        actual = pd.to_datetime(order_series['actual_delivery_time'])
+        t_score, t_status = backend.get_timeliness_status((actual - estimated).total_seconds() / 60)
+        return backend.generate_insights(t_score * 0.7 + 1.5, t_status, "Excellent",
+                                         order_series.get('weather'), order_series.get('restaurant_load'))
+
+    def request_cpu(payload):
+        order = OrderRecord.from_json(payload)
+        t_score, t_status = backend.get_timeliness_status(backend.calculate_lateness(order))
+        return backend.generate_insights(t_score * 0.7 + 1.5, t_status, "Excellent",
+                                         order.weather, order.restaurant_load)
+
+    def end_to_end(item):
+        payload, image_filename = item
+        order = OrderRecord.from_json(payload)
+        img_t = backend.load_image_tensor(os.path.join("images", image_filename))
+        cls, _ = backend.packaging_batcher.submit(img_t).result()
+        p_score, p_status = backend.packaging_status(cls)
+        result, stored = backend.analyze_order(order, image_filename, p_score, p_status)
+        pending_writes.append(stored)
+        return result
+
+    stage_fns = {
+        "read_json_legacy": (lambda p: pd.read_json(io.StringIO(p), typ='series'), payloads),
+        "parse_order": (OrderRecord.from_json, payloads),
+        "calculate_lateness": (backend.calculate_lateness, records),
+        "image_decode": (backend.load_image_tensor, image_paths),
+        "resnet": (lambda t: backend.classify_tensors(backend.packaging_model, [t]), tensors),
+        "resnet_batch": (lambda b: backend.classify_tensors(backend.packaging_model, b), batches),
+        "generate_insights": (lambda a: backend.generate_insights(*a), insight_args),
+        "csv_log": (log_one, log_rows),
+        "request_cpu_legacy": (request_cpu_legacy, payloads),
+        "request_cpu": (request_cpu, payloads),
+        "end_to_end": (end_to_end, orders),
+    }
+
+    # Warm-up: first forward pass / first decode carry one-off allocation costs.
+    backend.classify_tensors(backend.packaging_model, tensors[:1])
+    backend.load_image_tensor(image_paths[0])
+
+    report = {"stages": {}}
+    for name in STAGES:
+        fn, items = stage_fns[name]
+        samples, _ = time_each(fn, items)
+        entry = summarize(samples)
+        if name in ("csv_log", "end_to_end"):
+            # Rows are group-committed to the store (then the CSV export) by background
+            # writers; the drain (which includes their batching waits) is reported apart.
+            flush_start = time.perf_counter()
+            for f in pending_writes:
+                f.result()
+            pending_writes.clear()
+            backend.order_log.flush()
+            entry["log_drain_ms"] = round((time.perf_counter() - flush_start) * 1000, 4)
+        if name == "resnet_batch":
+            entry["batch_size"] = len(items[0])
+            entry["per_image_ms"] = round(entry["mean_ms"] / len(items[0]), 4)
+        entry["peak_alloc_kb"] = peak_alloc_kb(fn, items[:memory_items])
+        report["stages"][name] = entry
+    backend.close_order_log()
+    os.chdir(original_cwd)
+    unlink_dir(os.path.join(workdir, "images"))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    report["pipeline_sum_ms"] = round(sum(
+        report["stages"][s]["mean_ms"]
+        for s in ("parse_order", "calculate_lateness", "image_decode", "resnet", "generate_insights", "csv_log")
+    ), 4)
+    stages = report["stages"]
+    report["request_cpu_speedup"] = round(stages["request_cpu_legacy"]["mean_ms"] / stages["request_cpu"]["mean_ms"], 1)
+    report["startup_s"] = round(startup_s, 3)
+    report["max_rss_mb"] = {"before_import": rss_before, "after": max_rss_mb()}
+    report["environment"] = {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "pandas": pd.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "cpu_count": os.cpu_count(),
+        "machine": platform.machine(),
+        "packaging_backend": backend.model_backends.PACKAGING_BACKEND,
+        "device": str(backend.device),
+    }
+    report["config"] = {"orders": n_orders, "images": len(images), "seed": seed, "batch_size": batch_size}
+    report["created"] = datetime.now().isoformat(timespec="seconds")
+    return report
+
+
+def compare(report, baseline, tolerance=0.10):
+    """Per-stage mean_ms change vs a previous report; flags slowdowns beyond tolerance."""
+    rows = {}
+    regressions = []
+    for name, entry in report["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if not old or not old.get("mean_ms"):
+            continue
+        ratio = entry["mean_ms"] / old["mean_ms"]
+        rows[name] = {"baseline_ms": old["mean_ms"], "current_ms": entry["mean_ms"], "ratio": round(ratio, 3)}
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return {"tolerance": tolerance, "stages": rows, "regressions": regressions}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage and end-to-end benchmark of backend.py")
+    parser.add_argument("--images", default="images")
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--compare", help="previous report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+
+    report = run(args.images, args.orders, args.seed, batch_size=args.batch_size)
+    if baseline is not None:
+        report["comparison"] = compare(report, baseline, args.tolerance)
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"📦 Report written to {output}")
+    if baseline is not None and report["comparison"]["regressions"]:
+        print(f"⚠️ Slower than baseline: {', '.join(report['comparison']['regressions'])}")
+        sys.exit(1)
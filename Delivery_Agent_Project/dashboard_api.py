@@ -1,61 +1,155 @@
-from fastapi import FastAPI
-import pandas as pd
+from fastapi import FastAPI, HTTPException, Query
+from datetime import datetime, timedelta
+from typing import Optional
 import os
+import requests
+
+from order_store import open_store
+from sketches import DDSketch
 
 app = FastAPI()
 
 BASE_DIR = os.getcwd()
 LOG_FILE = os.path.join(BASE_DIR, "live_agent_log.csv")
 
+store = open_store(legacy_csv=LOG_FILE)
 
-def load_data():
-    if not os.path.exists(LOG_FILE):
-        return pd.DataFrame()
-
-    df = pd.read_csv(LOG_FILE)
-
-    if 'timestamp' in df.columns:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-    if 'final_score' in df.columns:
-        df['final_score'] = pd.to_numeric(df['final_score'], errors='coerce')
-
-    return df
+# Other dashboard_api instances (one per backend replica/store) whose
+# quantile sketches are merged into /percentiles, e.g. "http://10.0.0.2:9578".
+SKETCH_PEER_URLS = [u.strip().rstrip("/") for u in os.getenv("SKETCH_PEER_URLS", "").split(",") if u.strip()]
 
 
 @app.get("/")
 def dashboard_summary():
-    df = load_data()
+    # Running totals + the last 50 rows by primary key: O(1) in history size.
+    totals = store.totals()
 
-    if df.empty:
+    if not totals["count"]:
         return {"status": "no_data"}
 
-    df = df.sort_values("timestamp", ascending=False)
-
-    latest = df.iloc[0]
+    trend_df = store.recent(50)
+    latest = trend_df.iloc[0]
 
-    overall_avg = df['final_score'].mean()
-
-    critical_count = 0
-    if 'action_taken' in df.columns:
-        critical_count = df[
-            df['action_taken'].astype(str).str.contains("CRITICAL", na=False)
-        ].shape[0]
+    overall_avg = totals["score_sum"] / totals["scored_count"] if totals["scored_count"] else 0.0
+    critical_count = totals["critical_count"]
 
     # Holistic index (you can define logic however you want)
     holistic_index = round((overall_avg * 20) - (critical_count * 2), 2)
 
     # Trend data (last 50)
-    trend_df = df.sort_values("timestamp").tail(50)
+    trend_df = trend_df.iloc[::-1]
     trend_data = trend_df[['timestamp', 'final_score']].to_dict(orient="records")
 
+    overall = store.quantile_sketches()
+
     return {
         "kpis": {
-            "orders_processed": len(df),
+            "orders_processed": totals["count"],
             "overall_avg_score": round(overall_avg, 2),
             "critical_alerts": critical_count,
             "holistic_index": holistic_index
         },
+        "percentiles": {
+            metric: overall[(metric, "all")].percentiles()
+            for metric in ("lateness_min", "final_score") if (metric, "all") in overall
+        },
         "latest_order": latest.to_dict(),
         "trend_last_50": trend_data
     }
+
+
+# --- Streaming Percentiles (DDSketch, see sketches.py) ---
+def fetch_peer_sketches():
+    """Yields ((metric, segment), DDSketch) from every reachable peer."""
+    for url in SKETCH_PEER_URLS:
+        try:
+            resp = requests.get(f"{url}/sketches", params={"local": True}, timeout=2)
+            resp.raise_for_status()
+            entries = resp.json()["sketches"]
+        except Exception as e:
+            print(f"⚠️ Skipping sketch peer {url}: {e}")
+            continue
+        for entry in entries:
+            yield (entry["metric"], entry["segment"]), DDSketch.from_dict(entry["sketch"])
+
+
+def merged_sketches(include_peers=True):
+    sketches = store.quantile_sketches()
+    if include_peers:
+        for key, sketch in fetch_peer_sketches():
+            if key in sketches:
+                sketches[key].merge(sketch)
+            else:
+                sketches[key] = sketch
+    return sketches
+
+
+@app.get("/percentiles")
+def percentiles(local: bool = False):
+    """p50/p90/p99 of lateness and final score, overall and per weather/restaurant_load segment."""
+    sketches = merged_sketches(include_peers=not local)
+    result = {}
+    for (metric, segment), sketch in sorted(sketches.items()):
+        entry = sketch.percentiles()
+        entry["count"] = sketch.count
+        result.setdefault(metric, {})[segment] = entry
+    return {"peers": len(SKETCH_PEER_URLS) if not local else 0, "metrics": result}
+
+
+@app.get("/sketches")
+def export_sketches(local: bool = True):
+    """Raw sketches for merging on another instance (local only by default, to avoid peer loops)."""
+    sketches = merged_sketches(include_peers=not local)
+    return {
+        "sketches": [
+            {"metric": metric, "segment": segment, "sketch": sketch.to_dict()}
+            for (metric, segment), sketch in sorted(sketches.items())
+        ]
+    }
+
+
+# --- Time-Windowed Analytics (served from minute/hour/day rollups) ---
+def parse_window(start, end, default_hours=24):
+    try:
+        end_dt = datetime.fromisoformat(end) if end else datetime.now()
+        start_dt = datetime.fromisoformat(start) if start else end_dt - timedelta(hours=default_hours)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid timestamp: {e}")
+    if start_dt >= end_dt:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start_dt, end_dt
+
+
+@app.get("/analytics")
+def analytics_summary(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    group_by: str = Query("", description="comma-separated: weather, restaurant_load"),
+):
+    start_dt, end_dt = parse_window(start, end)
+    columns = tuple(c.strip() for c in group_by.split(",") if c.strip())
+    try:
+        groups = store.rollup_summary(start_dt, end_dt, columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "start": start_dt.isoformat(),
+        "end": end_dt.isoformat(),
+        "group_by": list(columns),
+        "groups": groups
+    }
+
+
+@app.get("/analytics/series")
+def analytics_series(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    granularity: str = Query("hour", pattern="^(minute|hour|day)$"),
+):
+    start_dt, end_dt = parse_window(start, end)
+    return {
+        "start": start_dt.isoformat(),
+        "end": end_dt.isoformat(),
+        "granularity": granularity,
+        "buckets": store.rollup_series(start_dt, end_dt, granularity)
+    }
@@ -2,6 +2,11 @@ import streamlit as st
 import pandas as pd
 import time
 import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from order_store import open_store
 
 # --- PAGE CONFIG ---
 st.set_page_config(page_title="Satisfaction Mission Control", page_icon="🚀", layout="wide")
@@ -12,24 +17,102 @@ LOG_FILE = os.path.join(BASE_DIR, "live_agent_log.csv")
 BACKEND_BASE_URL = "http://127.0.0.1:8239"
 
 # --- DATA LOADER ---
-def load_live_data():
-    if not os.path.exists(LOG_FILE):
-        return pd.DataFrame()
+# Each tab asks the indexed order store for just the rows/aggregates it shows.
+# Per-dimension aggregates over the whole history live in a LiveOrderView
+# shared by all sessions: it is seeded once from SQL and then only reads rows
+# appended since the last rerun, so a refresh costs the same at 2k orders or
+# 2M. Time series come from the store's minute/hour/day rollups, whose size
+# the chart bounds, so nothing here grows with uptime.
+EXPLORER_PAGE_SIZE = 500
+GROUP_COLUMNS = ("weather", "restaurant_load")
+MAX_HISTORY_POINTS = 2000
+MAX_SELECTOR_IDS = 1000
+
+class LiveOrderView:
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        snap = store.aggregate_snapshot(GROUP_COLUMNS)
+        self.last_row_id = snap["last_row_id"]
+        self.groups = snap["groups"]        # column -> {value: [score_sum, count]}
+        self.problem_ids = OrderedDict((i, None) for i in reversed(store.order_ids(max_score=3.0, limit=MAX_SELECTOR_IDS)))
+        self.all_ids = OrderedDict((i, None) for i in reversed(store.order_ids(limit=MAX_SELECTOR_IDS)))
+
+    @staticmethod
+    def _remember(ids, order_id):
+        ids[order_id] = None
+        ids.move_to_end(order_id)
+        while len(ids) > MAX_SELECTOR_IDS:
+            ids.popitem(last=False)
+
+    def refresh(self):
+        """Folds orders appended since the last call into the aggregates."""
+        with self.lock:
+            new = self.store.rows_after(
+                self.last_row_id, columns=["timestamp", "order_id", "final_score", *GROUP_COLUMNS]
+            )
+            if new.empty:
+                return
+            scored = new.dropna(subset=['final_score'])
+            for column in GROUP_COLUMNS:
+                agg = scored.dropna(subset=[column]).groupby(column)['final_score'].agg(['sum', 'count'])
+                bucket = self.groups.setdefault(column, {})
+                for value, row in agg.iterrows():
+                    entry = bucket.setdefault(value, [0.0, 0])
+                    entry[0] += row['sum']
+                    entry[1] += int(row['count'])
+            for order_id, score in zip(new['order_id'], new['final_score']):
+                if pd.isna(order_id):
+                    continue
+                self._remember(self.all_ids, int(order_id))
+                if score < 3.0:
+                    self._remember(self.problem_ids, int(order_id))
+            self.last_row_id = int(new['id'].max())
+
+    def group_mean(self, column):
+        with self.lock:
+            items = sorted(self.groups.get(column, {}).items())
+        means = {value: total / n for value, (total, n) in items if n}
+        return pd.Series(means, name='final_score', dtype=float).rename_axis(column)
+
+    def selector_ids(self):
+        """Recent problematic order ids (score < 3.0), newest first; all recent ids if none."""
+        with self.lock:
+            ids = self.problem_ids or self.all_ids
+            return list(reversed(ids))
+
+# Analysis tab windows: (span, rollup granularity for the trend chart)
+ANALYSIS_WINDOWS = {
+    "All Time": (None, None),
+    "Last Hour": (timedelta(hours=1), "minute"),
+    "Last 24 Hours": (timedelta(hours=24), "hour"),
+    "Last 7 Days": (timedelta(days=7), "day"),
+}
+
+def rollup_means(groups, column):
+    means = {g[column]: g['avg_score'] for g in groups if g['avg_score'] is not None}
+    return pd.Series(means, name='final_score', dtype=float).rename_axis(column)
+
+@st.cache_resource
+def get_store():
+    return open_store(legacy_csv=LOG_FILE)
+
+@st.cache_resource
+def get_live_view():
+    return LiveOrderView(get_store())
+
+store = get_store()
+live_view = get_live_view()
+
+def clean_orders(df):
+    if 'image_filename' in df.columns:
+        df['image_filename'] = df['image_filename'].astype(str).str.replace("\\", "/", regex=False)
+    return df
+
+def load_recent(limit=50):
+    """Newest orders first."""
     try:
-        df = pd.read_csv(LOG_FILE)
-        
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-        if 'final_score' in df.columns:
-            df['final_score'] = pd.to_numeric(df['final_score'], errors='coerce')
-        if 'image_filename' in df.columns:
-            df['image_filename'] = df['image_filename'].astype(str).str.replace("\\", "/", regex=False)
-        if 'lateness_min' in df.columns:
-            df['lateness_min'] = pd.to_numeric(df['lateness_min'], errors='coerce')
-
-        if not df.empty and 'timestamp' in df.columns:
-            df = df.sort_values(by="timestamp", ascending=False)
-        return df
+        return clean_orders(store.recent(limit))
     except Exception:
         return pd.DataFrame()
 
@@ -45,7 +128,8 @@ st.sidebar.caption("Pause updates to inspect orders.")
 
 # --- MAIN APP ---
 st.title("🚀 Delivery Agent Mission Control")
-df = load_live_data()
+live_view.refresh()
+df = load_recent(50)
 
 # TABS
 live_tab, deep_dive_tab, analysis_tab, explorer_tab = st.tabs([
@@ -61,21 +145,20 @@ with live_tab:
         st.info(f"Waiting for Agent... (Log: {LOG_FILE})")
     else:
         # KPIs
-        curr_avg = df['final_score'].mean()
+        summary = store.summary(skip_latest=10)
+        curr_avg = summary['avg_score']
         delta = 0.0
-        if len(df) > 10:
-            delta = curr_avg - df['final_score'].iloc[10:].mean()
+        if summary['count'] > 10:
+            delta = curr_avg - summary['avg_excluding_latest']
 
         k1, k2, k3, k4 = st.columns(4)
         latest = df.iloc[0]
         
-        k1.metric("Orders Processed", len(df))
+        k1.metric("Orders Processed", summary['count'])
         k2.metric("Latest Order ID", f"#{latest['order_id']}")
         k3.metric("Overall Avg Score", f"{curr_avg:.2f}", delta=f"{delta:.2f}")
         
-        crit_count = 0
-        if 'action_taken' in df.columns:
-            crit_count = df[df['action_taken'].astype(str).str.contains("CRITICAL", na=False)].shape[0]
+        crit_count = summary['critical_count']
         k4.metric("Critical Alerts", crit_count, delta_color="inverse")
 
         # Live Pulse Graph
@@ -107,8 +190,7 @@ with deep_dive_tab:
     if df.empty:
         st.warning("No data.")
     else:
-        problematic = df[df['final_score'] < 3.0]
-        options = problematic['order_id'].unique() if not problematic.empty else df['order_id'].unique()
+        options = live_view.selector_ids()
         
         idx_arg = 0
         if 'deep_dive_selector' in st.session_state:
@@ -117,7 +199,7 @@ with deep_dive_tab:
 
         selected_id = st.selectbox("Select Order:", options, index=idx_arg, key="deep_dive_selector")
         
-        record_list = df[df['order_id'] == selected_id]
+        record_list = clean_orders(store.get_order(selected_id))
         if not record_list.empty:
             record = record_list.iloc[0]
             
@@ -171,19 +253,38 @@ with analysis_tab:
     if df.empty:
         st.info("No data.")
     else:
+        window = st.selectbox("Time Window", list(ANALYSIS_WINDOWS), key="analysis_window")
+        span, granularity = ANALYSIS_WINDOWS[window]
+
         c1, c2 = st.columns(2)
+        if span is None:
+            weather_means = live_view.group_mean('weather')
+            load_means = live_view.group_mean('restaurant_load')
+        else:
+            # Windowed views merge minute/hour/day rollups rather than raw orders.
+            now = datetime.now()
+            weather_means = rollup_means(store.rollup_summary(now - span, now, ('weather',)), 'weather')
+            load_means = rollup_means(store.rollup_summary(now - span, now, ('restaurant_load',)), 'restaurant_load')
         with c1:
             st.subheader("Weather Impact")
-            if 'weather' in df.columns:
-                st.bar_chart(df.groupby('weather')['final_score'].mean(), color="#FF4B4B")
+            st.bar_chart(weather_means, color="#FF4B4B")
         with c2:
             st.subheader("Restaurant Load Impact")
-            if 'restaurant_load' in df.columns:
-                st.bar_chart(df.groupby('restaurant_load')['final_score'].mean(), color="#0068C9")
+            st.bar_chart(load_means, color="#0068C9")
         
-        st.subheader("Full History")
-        if 'timestamp' in df.columns:
-            st.line_chart(df.sort_values("timestamp"), x="timestamp", y="final_score")
+        if span is None:
+            # The finest rollup that fits MAX_HISTORY_POINTS: minutes, then hours, then days.
+            granularity, series = store.rollup_history(MAX_HISTORY_POINTS)
+            st.subheader(f"Full History (per {granularity})")
+            buckets = pd.DataFrame(series)
+        else:
+            st.subheader(f"Per-{granularity.capitalize()} Trend")
+            buckets = pd.DataFrame(store.rollup_series(now - span, now, granularity))
+        if buckets.empty:
+            st.info("No orders in this window.")
+        else:
+            buckets['bucket_start'] = pd.to_datetime(buckets['bucket_start'])
+            st.line_chart(buckets, x="bucket_start", y=["avg_score", "lateness_p90"])
 
 # ==========================================
 # TAB 4: EXPLORER
@@ -191,7 +292,22 @@ with analysis_tab:
 with explorer_tab:
     st.header("🗂️ Full Mission Log")
     if not df.empty:
-        st.dataframe(df, use_container_width=True)
+        totals = store.totals()
+        pages = max(1, -(-totals['count'] // EXPLORER_PAGE_SIZE))
+        # Keyset pagination on the row id: each older page starts below the smallest
+        # row id of the page before it (kept per session), so every page is an index
+        # range scan and gaps in the ids never skip or repeat orders.
+        cursors = st.session_state.setdefault("explorer_cursors", [None])
+        page_df = clean_orders(store.page(EXPLORER_PAGE_SIZE, before_row_id=cursors[-1]))
+        newer_col, older_col, page_col = st.columns([1, 1, 4])
+        if newer_col.button("⬅️ Newer", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        if older_col.button("Older ➡️", disabled=len(page_df) < EXPLORER_PAGE_SIZE or len(cursors) >= pages):
+            cursors.append(int(page_df['id'].min()))
+            st.rerun()
+        page_col.caption(f"Page {len(cursors)} of {pages}, newest first")
+        st.dataframe(page_df.set_index('id'), use_container_width=True)
 
 if auto_refresh:
     time.sleep(2)
@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from agent_simulation import BACKEND_URL, OrderIdCounter, generate_order, get_available_images
+
+# --- Open-Loop Load Generator ---
+# Orders arrive on a pre-computed schedule that does not wait for responses,
+# the way real customers do. The schedule is a Poisson process whose rate is
+# multiplied by BURST_FACTOR during randomly occurring burst phases (lunch
+# rush, promo push). Latency is measured from each order's *scheduled* arrival
+# time, so time spent waiting for a free worker counts against the backend
+# instead of silently lowering the offered load (coordinated omission).
+
+LOAD_RATE = float(os.getenv("LOAD_RATE", "20"))                  # mean orders/sec outside bursts
+LOAD_DURATION_S = float(os.getenv("LOAD_DURATION_S", "30"))
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "32"))
+BURST_FACTOR = float(os.getenv("LOAD_BURST_FACTOR", "4"))
+BURST_EVERY_S = float(os.getenv("LOAD_BURST_EVERY_S", "10"))     # mean calm period between bursts
+BURST_LENGTH_S = float(os.getenv("LOAD_BURST_LENGTH_S", "2"))    # mean burst length
+REQUEST_TIMEOUT_S = float(os.getenv("LOAD_TIMEOUT_S", "30"))
+
+
+def arrival_schedule(rate, duration, burst_factor=BURST_FACTOR, burst_every=BURST_EVERY_S,
+                     burst_length=BURST_LENGTH_S, seed=None):
+    """Arrival offsets (seconds) of a two-state Markov-modulated Poisson process."""
+    rng = random.Random(seed)
+    arrivals = []
+    t = 0.0
+    bursting = False
+    phase_end = rng.expovariate(1 / burst_every) if burst_every > 0 else duration
+    while t < duration:
+        current_rate = rate * (burst_factor if bursting else 1.0)
+        t_next = t + rng.expovariate(current_rate)
+        if t_next >= phase_end:
+            # Memoryless: restart the draw from the phase boundary at the new rate.
+            t = phase_end
+            bursting = not bursting and burst_every > 0
+            mean = burst_length if bursting else burst_every
+            phase_end = t + (rng.expovariate(1 / mean) if mean > 0 else duration)
+            continue
+        t = t_next
+        if t < duration:
+            arrivals.append(t)
+    return arrivals
+
+
+def make_session(workers):
+    """One shared session whose connection pool holds a keep-alive socket per worker."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def summarize(results, offered, wall_time, config):
+    latencies = np.array([r[1] for r in results]) * 1000.0
+    outcomes = Counter(r[0] for r in results)
+    ok = outcomes.pop("200", 0)
+    completed = len(results)
+
+    def pct(p):
+        return round(float(np.percentile(latencies, p)), 2) if completed else None
+
+    return {
+        "config": config,
+        "offered_orders": offered,
+        "completed": completed,
+        "ok": ok,
+        "errors": dict(outcomes),
+        "error_rate": round(1 - ok / completed, 4) if completed else None,
+        "achieved_rps": round(completed / wall_time, 2) if wall_time else None,
+        "latency_ms": {
+            "p50": pct(50),
+            "p90": pct(90),
+            "p99": pct(99),
+            "max": round(float(latencies.max()), 2) if completed else None,
+            "mean": round(float(latencies.mean()), 2) if completed else None,
+        },
+    }
+
+
+def run_load(url=BACKEND_URL, rate=LOAD_RATE, duration=LOAD_DURATION_S, workers=LOAD_WORKERS,
+             burst_factor=BURST_FACTOR, burst_every=BURST_EVERY_S, burst_length=BURST_LENGTH_S,
+             seed=None, timeout=REQUEST_TIMEOUT_S):
+    ok_images, damaged_images = get_available_images()
+    if not ok_images or not damaged_images:
+        raise SystemExit("❌ ERROR: Could not find images in 'images/ok' or 'images/damaged'.")
+
+    schedule = arrival_schedule(rate, duration, burst_factor, burst_every, burst_length, seed)
+    order_rng = random.Random(seed)
+    id_counter = OrderIdCounter()
+    session = make_session(workers)
+    results = []
+    results_lock = threading.Lock()
+
+    # Payloads are built up front so generation cost never delays an arrival.
+    payloads = [generate_order(id_counter.allocate(), ok_images, damaged_images, order_rng) for _ in schedule]
+
+    def send(payload, scheduled_at):
+        try:
+            response = session.post(url, data=payload, timeout=timeout)
+            outcome = str(response.status_code)
+        except requests.exceptions.RequestException as e:
+            outcome = type(e).__name__
+        latency = time.perf_counter() - scheduled_at
+        with results_lock:
+            results.append((outcome, latency))
+
+    print(f"🚦 Offering {len(schedule)} orders over {duration:.0f}s "
+          f"(~{rate:g}/s, x{burst_factor:g} bursts) with {workers} workers → {url}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="load") as pool:
+        for offset, payload in zip(schedule, payloads):
+            scheduled_at = start + offset
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, payload, scheduled_at)
+    wall_time = time.perf_counter() - start
+    session.close()
+
+    config = {
+        "url": url, "rate": rate, "duration_s": duration, "workers": workers,
+        "burst_factor": burst_factor, "burst_every_s": burst_every, "burst_length_s": burst_length,
+        "seed": seed,
+    }
+    return summarize(results, len(schedule), wall_time, config)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open-loop stress benchmark for backend.py")
+    parser.add_argument("--url", default=BACKEND_URL)
+    parser.add_argument("--rate", type=float, default=LOAD_RATE, help="mean orders/sec outside bursts")
+    parser.add_argument("--duration", type=float, default=LOAD_DURATION_S, help="seconds of offered load")
+    parser.add_argument("--workers", type=int, default=LOAD_WORKERS, help="concurrent connections")
+    parser.add_argument("--burst-factor", type=float, default=BURST_FACTOR, help="rate multiplier during bursts (1 = none)")
+    parser.add_argument("--burst-every", type=float, default=BURST_EVERY_S, help="mean seconds between bursts (0 = none)")
+    parser.add_argument("--burst-length", type=float, default=BURST_LENGTH_S, help="mean burst length in seconds")
+    parser.add_argument("--seed", type=int, default=None, help="fix the arrival schedule and orders")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT_S)
+    parser.add_argument("--report", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run_load(args.url, args.rate, args.duration, args.workers, args.burst_factor,
+                      args.burst_every, args.burst_length, args.seed, args.timeout)
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
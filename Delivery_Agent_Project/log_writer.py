@@ -0,0 +1,171 @@
+import os
+import io
+import csv
+import time
+import queue
+import threading
+from datetime import datetime
+
+# --- Group-Committed Order Log ---
+# One background thread owns the CSV file. Request handlers only enqueue rows;
+# the writer drains the queue into batches, renders each batch to a single
+# buffer of whole lines and appends it with one write() call, so a reader never
+# observes a partially written row from an interleaved writer.
+
+FSYNC_POLICIES = ("none", "batch", "interval")
+
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_FLUSH_INTERVAL_MS = float(os.getenv("LOG_FLUSH_INTERVAL_MS", "200"))
+LOG_FSYNC = os.getenv("LOG_FSYNC", "none")
+LOG_FSYNC_INTERVAL_S = float(os.getenv("LOG_FSYNC_INTERVAL_S", "1.0"))
+LOG_ROTATE_BYTES = int(os.getenv("LOG_ROTATE_BYTES", "0"))         # 0 = never rotate on size
+LOG_ROTATE_DAILY = os.getenv("LOG_ROTATE_DAILY", "0") == "1"
+
+_STOP = object()
+
+
+class OrderLogWriter:
+    """Background CSV appender with batching, fsync policy and size/day rotation."""
+
+    def __init__(self, path, headers, batch_size=LOG_BATCH_SIZE, flush_interval_ms=LOG_FLUSH_INTERVAL_MS,
+                 fsync=LOG_FSYNC, fsync_interval_s=LOG_FSYNC_INTERVAL_S,
+                 rotate_bytes=LOG_ROTATE_BYTES, rotate_daily=LOG_ROTATE_DAILY):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown LOG_FSYNC '{fsync}', expected one of {FSYNC_POLICIES}")
+        self.path = path
+        self.headers = list(headers)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval_ms) / 1000.0
+        self.fsync = fsync
+        self.fsync_interval_s = fsync_interval_s
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+
+        self.rows_written = 0
+        self.batches_written = 0
+        self.rotations = 0
+        self._queue = queue.Queue()
+        self._last_fsync = time.monotonic()
+        self._fd = None
+        self._open()
+        self._worker = threading.Thread(target=self._run, name="order-log-writer", daemon=True)
+        self._worker.start()
+
+    # --- Public API ---
+    def write(self, row):
+        """Enqueues one row; returns immediately."""
+        self._queue.put(row)
+
+    def flush(self):
+        """Blocks until every row enqueued so far has been written."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._worker.join()
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "rotations": self.rotations,
+            "fsync": self.fsync,
+        }
+
+    # --- File Handling ---
+    def _open(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        self._day = datetime.now().date()
+        if new_file:
+            self._append(self._render([self.headers]))
+        elif self._size and not self._ends_with_newline():
+            # A crash mid-write can only leave a partial last line; terminate it
+            # so the next batch starts on a fresh row.
+            self._append(b"\n")
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _should_rotate(self):
+        if self.rotate_bytes and self._size >= self.rotate_bytes:
+            return True
+        return self.rotate_daily and datetime.now().date() != self._day
+
+    def _rotate(self):
+        os.close(self._fd)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}.{stamp}{ext}"
+        suffix = 1
+        while os.path.exists(rotated):
+            rotated = f"{base}.{stamp}-{suffix}{ext}"
+            suffix += 1
+        os.replace(self.path, rotated)
+        self.rotations += 1
+        self._open()
+
+    @staticmethod
+    def _render(rows):
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerows(rows)
+        return buf.getvalue().encode("utf-8")
+
+    def _append(self, data):
+        view = memoryview(data)
+        while view:
+            n = os.write(self._fd, view)
+            view = view[n:]
+        self._size += len(data)
+
+    def _commit(self, rows):
+        if self._should_rotate():
+            self._rotate()
+        self._append(self._render(rows))
+        if self.fsync == "batch" or (
+            self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval_s
+        ):
+            os.fsync(self._fd)
+            self._last_fsync = time.monotonic()
+        self.rows_written += len(rows)
+        self.batches_written += 1
+
+    # --- Worker ---
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        if first is _STOP:
+            return batch
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            rows = [r for r in batch if r is not _STOP]
+            try:
+                if rows:
+                    self._commit(rows)
+            except Exception as e:
+                print(f"❌ Order log write failed ({len(rows)} rows): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if len(rows) != len(batch):
+                if self.fsync != "none":
+                    os.fsync(self._fd)
+                os.close(self._fd)
+                return
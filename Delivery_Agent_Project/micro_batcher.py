@@ -0,0 +1,105 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future, InvalidStateError
+
+# --- Micro-Batching ---
+# Concurrent requests hand their items to a single worker thread, which takes
+# the first waiting item, collects more for up to max_wait_ms (or until
+# max_batch_size) and processes them in one call. Used by backend.py for
+# packaging images and by FoodQualityAgent/food-quality-agent/app.py for
+# reviews (which finds it through DELIVERY_AGENT_DIR).
+#
+# A waiter can go away while its item is queued: cancelling an
+# asyncio.wrap_future() wrapper (client gone, handler timeout, server
+# shutdown) cancels the Future too. Such items are dropped before the batch
+# runs, and nothing a batch raises may end the worker, or every later
+# submit() would wait forever.
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Queues items and passes them to process_batch(items) -> results, in batches, on one worker thread."""
+
+    def __init__(self, process_batch, max_batch_size=16, max_wait_ms=5.0, name="micro-batcher"):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.batches = 0
+        self.items = 0
+        self.cancelled = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        """Queues one item; the returned Future resolves to its result."""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self):
+        """Processes everything submitted so far, then stops the worker."""
+        self._queue.put((_STOP, None))
+        self._worker.join()
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "cancelled": self.cancelled,
+            "queue_depth": self._queue.qsize(),
+        }
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size and batch[-1][0] is not _STOP:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = self._collect()
+            if batch[-1][0] is _STOP:
+                stopping = True
+                batch.pop()
+                if not batch:
+                    break
+            try:
+                self._process(batch)
+            except Exception as e:
+                print(f"⚠️ {self._worker.name}: batch of {len(batch)} failed: {e}")
+                for _, f in batch:
+                    try:
+                        f.set_exception(e)
+                    except InvalidStateError:
+                        pass   # already resolved or cancelled
+
+    def _process(self, batch):
+        # A running Future can no longer be cancelled, so the results below always land.
+        live = [(item, f) for item, f in batch if f.set_running_or_notify_cancel()]
+        self.cancelled += len(batch) - len(live)
+        if not live:
+            return
+        try:
+            results = list(self.process_batch([item for item, _ in live]))
+            if len(results) != len(live):
+                raise RuntimeError(f"process_batch returned {len(results)} results for {len(live)} items")
+        except Exception as e:
+            for _, f in live:
+                f.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(live)
+        for (_, f), result in zip(live, results):
+            f.set_result(result)
@@ -0,0 +1,163 @@
+import os
+import copy
+import json
+import time
+import argparse
+import warnings
+
+import torch
+from torchvision import models
+from torchvision.models import quantization as qmodels
+
+import image_pipeline
+
+# --- Optimised CPU Backends for the Packaging Classifier ---
+# Selected with PACKAGING_BACKEND:
+#   eager         plain FP32 ResNet-18 (reference)
+#   channels_last FP32 with NHWC weights/activations (faster oneDNN convolutions)
+#   torchscript   traced + frozen TorchScript graph, channels-last
+#   int8          post-training static quantization, calibrated on images/ok and images/damaged
+
+BACKENDS = ("eager", "channels_last", "torchscript", "int8")
+PACKAGING_BACKEND = os.getenv("PACKAGING_BACKEND", "eager")
+CALIBRATION_LIMIT = int(os.getenv("PACKAGING_INT8_CALIBRATION_LIMIT", "128"))
+
+
+class ChannelsLast(torch.nn.Module):
+    """Feeds NHWC-contiguous input to a model whose weights are channels-last."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model.to(memory_format=torch.channels_last)
+
+    def forward(self, x):
+        return self.model(x.contiguous(memory_format=torch.channels_last))
+
+
+def calibration_tensors(images_root="images", limit=CALIBRATION_LIMIT):
+    """Evenly interleaves ok/damaged images so both classes shape the activation ranges."""
+    per_class = {}
+    for path in image_pipeline.list_images(images_root):
+        label = os.path.basename(os.path.dirname(path))
+        per_class.setdefault(label, []).append(path)
+
+    paths = []
+    queues = list(per_class.values())
+    while queues and len(paths) < limit:
+        for q in list(queues):
+            if not q:
+                queues.remove(q)
+                continue
+            paths.append(q.pop(0))
+    return [t for t in image_pipeline.decode_many(paths[:limit]) if t is not None]
+
+
+def build_channels_last(fp32_model):
+    return ChannelsLast(fp32_model).eval()
+
+
+def build_torchscript(fp32_model):
+    model = ChannelsLast(fp32_model).eval()
+    example = torch.randn(1, 3, image_pipeline.IMAGE_SIZE, image_pipeline.IMAGE_SIZE)
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        traced = torch.jit.trace(model, example)
+        frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        # Two warm-up runs let the profiling executor settle on the optimised graph.
+        frozen(example)
+        frozen(example)
+    return frozen
+
+
+def build_int8(fp32_model, images_root="images"):
+    engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "qnnpack"
+    torch.backends.quantized.engine = engine
+
+    model = qmodels.resnet18(weights=None, quantize=False)
+    model.fc = torch.nn.Linear(model.fc.in_features, 2)
+    model.load_state_dict(fp32_model.state_dict())
+    model.eval()
+    model.fuse_model(is_qat=False)
+    model.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        torch.ao.quantization.prepare(model, inplace=True)
+        calib = calibration_tensors(images_root)
+        with torch.no_grad():
+            for start in range(0, len(calib), 16):
+                model(torch.stack(calib[start:start + 16]))
+        torch.ao.quantization.convert(model, inplace=True)
+    return model
+
+
+def optimise(fp32_model, backend=PACKAGING_BACKEND, device=torch.device("cpu")):
+    """Returns the packaging model rebuilt for the requested backend."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown PACKAGING_BACKEND '{backend}', expected one of {BACKENDS}")
+    if backend == "eager":
+        return fp32_model
+    if device.type != "cpu":
+        print(f"⚠️ PACKAGING_BACKEND={backend} targets CPU; using eager on {device}.")
+        return fp32_model
+
+    fp32_model = fp32_model.cpu().eval()
+    if backend == "channels_last":
+        return build_channels_last(fp32_model)
+    if backend == "torchscript":
+        return build_torchscript(fp32_model)
+    return build_int8(fp32_model)
+
+
+# --- Agreement & Latency Report ---
+def report(fp32_model, backends=BACKENDS, images_root="images", batch_sizes=(1, 16), repeats=5):
+    """Classification agreement against FP32 on the bundled corpus plus per-backend latency."""
+    tensors = [t for t in image_pipeline.decode_many(image_pipeline.list_images(images_root)) if t is not None]
+    corpus = torch.stack(tensors)
+
+    def predict(model):
+        with torch.no_grad():
+            outs = [model(corpus[i:i + 32]) for i in range(0, len(corpus), 32)]
+        return torch.cat(outs)
+
+    reference = predict(fp32_model)
+    ref_classes = reference.argmax(1)
+
+    results = {"images": len(tensors), "threads": torch.get_num_threads(), "backends": {}}
+    for backend in backends:
+        model = optimise(copy.deepcopy(fp32_model), backend)
+        logits = predict(model)
+        entry = {
+            "agreement": round(float((logits.argmax(1) == ref_classes).float().mean()), 4),
+            "max_logit_diff": round(float((logits - reference).abs().max()), 4),
+        }
+        for bs in batch_sizes:
+            x = corpus[:bs]
+            with torch.no_grad():
+                model(x)
+                best = float("inf")
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    model(x)
+                    best = min(best, time.perf_counter() - start)
+            entry[f"ms_per_image_bs{bs}"] = round(best / bs * 1000, 2)
+        results["backends"][backend] = entry
+    return results
+
+
+def load_fp32(model_path="packaging_classifier_model.pth"):
+    model = models.resnet18(weights=None)
+    model.fc = torch.nn.Linear(model.fc.in_features, 2)
+    model.load_state_dict(torch.load(model_path, map_location="cpu"))
+    return model.eval()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare packaging model backends against FP32")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--images", default="images")
+    parser.add_argument("--model", default="packaging_classifier_model.pth")
+    args = parser.parse_args()
+
+    fp32 = load_fp32(args.model)
+    print(json.dumps(report(fp32, args.backends.split(","), args.images), indent=2))
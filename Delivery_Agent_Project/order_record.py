@@ -0,0 +1,69 @@
+import json
+from datetime import datetime
+
+# --- Typed Order Record ---
+# The request path used to build a pandas Series per order just to read six
+# fields and subtract two timestamps. OrderRecord is a plain __slots__ object
+# filled straight from the decoded JSON, with timestamps parsed by
+# datetime.fromisoformat; analyze_order, the insights and the order log all
+# read from it. The wire format (form field order_data_json) is unchanged.
+
+
+def parse_timestamp(value):
+    """ISO-8601 string (or datetime) -> datetime. A trailing 'Z' is read as UTC."""
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"Expected an ISO-8601 timestamp, got {value!r}")
+    text = value.strip()
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    return datetime.fromisoformat(text)
+
+
+def _optional_float(value):
+    return None if value is None or value == "" else float(value)
+
+
+def _optional_str(value):
+    return None if value is None else str(value)
+
+
+class OrderRecord:
+    __slots__ = ("order_id", "estimated_delivery_time", "actual_delivery_time",
+                 "distance_km", "weather", "restaurant_load")
+
+    def __init__(self, order_id: int, estimated_delivery_time: datetime, actual_delivery_time: datetime,
+                 distance_km: float = None, weather: str = None, restaurant_load: str = None):
+        self.order_id = order_id
+        self.estimated_delivery_time = estimated_delivery_time
+        self.actual_delivery_time = actual_delivery_time
+        self.distance_km = distance_km
+        self.weather = weather
+        self.restaurant_load = restaurant_load
+
+    @classmethod
+    def from_dict(cls, data):
+        """Validates and converts a decoded order payload; raises KeyError/ValueError on bad input."""
+        return cls(
+            int(data["order_id"]),
+            parse_timestamp(data["estimated_delivery_time"]),
+            parse_timestamp(data["actual_delivery_time"]),
+            _optional_float(data.get("distance_km")),
+            _optional_str(data.get("weather")),
+            _optional_str(data.get("restaurant_load")),
+        )
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        if not isinstance(data, dict):
+            raise ValueError("order_data_json must be a JSON object")
+        return cls.from_dict(data)
+
+    @property
+    def lateness_min(self):
+        return (self.actual_delivery_time - self.estimated_delivery_time).total_seconds() / 60
+
+    def __repr__(self):
+        return f"OrderRecord(order_id={self.order_id}, lateness_min={self.lateness_min:.1f})"
@@ -0,0 +1,455 @@
+import os
+import csv
+import sqlite3
+import argparse
+from contextlib import contextmanager
+
+import pandas as pd
+
+import rollups
+import sketches
+import rescoring
+
+# --- Order Store ---
+# Indexed SQLite system of record for analysed orders. live_agent_log.csv is
+# still written by the backend as a compatibility export, and an existing log
+# is imported once on first open.
+
+BASE_DIR = os.getcwd()
+ORDER_STORE_PATH = os.getenv("ORDER_STORE_PATH", os.path.join(BASE_DIR, "orders.db"))
+LEGACY_LOG_FILE = os.path.join(BASE_DIR, "live_agent_log.csv")
+
+COLUMNS = [
+    "timestamp", "order_id", "final_score", "status", "action_taken",
+    "distance_km", "weather", "restaurant_load", "image_filename",
+    "analysis_text", "recommendation", "lateness_min"
+]
+ROLLUP_INPUT_COLUMNS = ("timestamp", "final_score", "action_taken", "weather", "restaurant_load", "lateness_min")
+SKETCH_INPUT_COLUMNS = ("final_score", "lateness_min", "weather", "restaurant_load")
+INT_COLUMNS = {"order_id"}
+REAL_COLUMNS = {"final_score", "distance_km", "lateness_min"}
+
+
+def _coerce(column, value):
+    if value is None or value == "":
+        return None
+    try:
+        if column in INT_COLUMNS:
+            return int(float(value))
+        if column in REAL_COLUMNS:
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+
+def normalise_row(row):
+    """Maps a CSV-ordered row (list) or dict onto typed store columns."""
+    if isinstance(row, dict):
+        return tuple(_coerce(c, row.get(c)) for c in COLUMNS)
+    padded = list(row) + [None] * (len(COLUMNS) - len(row))
+    return tuple(_coerce(c, v) for c, v in zip(COLUMNS, padded))
+
+
+class OrderStore:
+    def __init__(self, db_path=ORDER_STORE_PATH):
+        self.db_path = db_path
+        self.init_db()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def init_db(self):
+        """Creates the orders table and its indexes."""
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS orders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT,
+                    order_id INTEGER,
+                    final_score REAL,
+                    status TEXT,
+                    action_taken TEXT,
+                    distance_km REAL,
+                    weather TEXT,
+                    restaurant_load TEXT,
+                    image_filename TEXT,
+                    analysis_text TEXT,
+                    recommendation TEXT,
+                    lateness_min REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_timestamp ON orders (timestamp)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_order_id ON orders (order_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_action ON orders (action_taken)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            # Running KPI totals, updated in the same transaction as every insert
+            # so summaries never have to scan the orders table.
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS order_totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    order_count INTEGER,
+                    scored_count INTEGER,
+                    score_sum REAL,
+                    critical_count INTEGER,
+                    last_row_id INTEGER
+                )
+            ''')
+            if conn.execute('SELECT COUNT(*) FROM order_totals').fetchone()[0] == 0:
+                self._rebuild_totals(conn)
+            # Minute/hour/day rollups per weather x restaurant_load (see rollups.py).
+            conn.execute(rollups.ROLLUP_SCHEMA)
+            if not conn.execute("SELECT 1 FROM meta WHERE key = 'rollups_built'").fetchone():
+                self._rebuild_rollups(conn)
+            # Mergeable lateness/score quantile sketches, global and per segment (see sketches.py).
+            conn.execute(sketches.SKETCH_SCHEMA)
+            if not conn.execute("SELECT 1 FROM meta WHERE key = 'sketches_built'").fetchone():
+                self._rebuild_sketches(conn)
+            # Versioned offline re-scoring results (see rescoring.py).
+            for statement in rescoring.RESCORE_SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+
+    @staticmethod
+    def _rebuild_totals(conn):
+        conn.execute('''
+            INSERT OR REPLACE INTO order_totals
+                (id, order_count, scored_count, score_sum, critical_count, last_row_id)
+            SELECT 1, COUNT(*), COUNT(final_score), COALESCE(SUM(final_score), 0),
+                   COALESCE(SUM(CASE WHEN action_taken LIKE '%CRITICAL%' THEN 1 ELSE 0 END), 0),
+                   COALESCE(MAX(id), 0)
+            FROM orders
+        ''')
+
+    @staticmethod
+    def _rebuild_rollups(conn, chunk_size=5000):
+        conn.execute('DELETE FROM order_rollups')
+        cursor = conn.execute(
+            'SELECT timestamp, final_score, action_taken, weather, restaurant_load, lateness_min FROM orders'
+        )
+        acc = rollups.RollupAccumulator()
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                acc.add(*row)
+        acc.apply(conn)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollups_built', '1')")
+
+    @staticmethod
+    def _rebuild_sketches(conn, chunk_size=5000):
+        conn.execute('DELETE FROM order_sketches')
+        cursor = conn.execute('SELECT final_score, lateness_min, weather, restaurant_load FROM orders')
+        acc = sketches.SketchAccumulator()
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                acc.add(*row)
+        acc.apply(conn)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('sketches_built', '1')")
+
+    # --- Writes ---
+    def insert_many(self, rows):
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        records = [normalise_row(r) for r in rows]
+        score_idx, action_idx = COLUMNS.index("final_score"), COLUMNS.index("action_taken")
+        scores = [r[score_idx] for r in records if r[score_idx] is not None]
+        critical = sum(1 for r in records if r[action_idx] and "CRITICAL" in r[action_idx])
+        acc = rollups.RollupAccumulator()
+        sketch_acc = sketches.SketchAccumulator()
+        for r in records:
+            acc.add(*(r[COLUMNS.index(c)] for c in ROLLUP_INPUT_COLUMNS))
+            sketch_acc.add(*(r[COLUMNS.index(c)] for c in SKETCH_INPUT_COLUMNS))
+        with self._connect() as conn:
+            conn.executemany(
+                f'INSERT INTO orders ({", ".join(COLUMNS)}) VALUES ({placeholders})',
+                records
+            )
+            acc.apply(conn)
+            sketch_acc.apply(conn)
+            conn.execute('''
+                UPDATE order_totals SET
+                    order_count = order_count + ?,
+                    scored_count = scored_count + ?,
+                    score_sum = score_sum + ?,
+                    critical_count = critical_count + ?,
+                    last_row_id = (SELECT MAX(id) FROM orders)
+                WHERE id = 1
+            ''', (len(records), len(scores), sum(scores), critical))
+            conn.commit()
+
+    def migrate_from_csv(self, csv_path=LEGACY_LOG_FILE, chunk_size=5000, force=False):
+        """One-shot import of an existing order log. Returns the number of rows imported.
+
+        The store is marked as migrated even when there is no log yet, so a CSV
+        the backend writes later (as an export) is never imported on top of it.
+        With force=True the log is imported again, but rows already in the
+        store (same timestamp and order_id) are skipped, so re-running it on
+        the backend's own CSV export only adds the orders that are missing.
+        """
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        insert_sql = f'INSERT INTO orders ({", ".join(COLUMNS)}) VALUES ({placeholders})'
+        imported = 0
+        with self._connect() as conn:
+            # IMMEDIATE takes the write lock up front, so concurrent openers
+            # cannot both see "not migrated" and import the log twice.
+            conn.execute("BEGIN IMMEDIATE")
+            done = conn.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone()
+            if done and not force:
+                conn.rollback()
+                return 0
+            if not os.path.exists(csv_path):
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', '')")
+                conn.commit()
+                return 0
+            ts_idx, id_idx = COLUMNS.index("timestamp"), COLUMNS.index("order_id")
+            seen = set(conn.execute('SELECT timestamp, order_id FROM orders'))
+            with open(csv_path, newline='') as f:
+                reader = csv.DictReader(f)
+                chunk = []
+                for row in reader:
+                    record = normalise_row(row)
+                    key = (record[ts_idx], record[id_idx])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    chunk.append(record)
+                    if len(chunk) >= chunk_size:
+                        conn.executemany(insert_sql, chunk)
+                        imported += len(chunk)
+                        chunk = []
+                if chunk:
+                    conn.executemany(insert_sql, chunk)
+                    imported += len(chunk)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)",
+                (os.path.abspath(csv_path),)
+            )
+            self._rebuild_totals(conn)
+            self._rebuild_rollups(conn)
+            self._rebuild_sketches(conn)
+            conn.commit()
+        return imported
+
+    def export_csv(self, csv_path):
+        """Writes the full store back out in the legacy CSV layout."""
+        with self._connect() as conn, open(csv_path, "w", newline='') as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(COLUMNS)
+            cursor = conn.execute(f'SELECT {", ".join(COLUMNS)} FROM orders ORDER BY id')
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                writer.writerows(rows)
+
+    # --- Reads ---
+    def query_df(self, sql, params=()):
+        with self._connect() as conn:
+            df = pd.read_sql_query(sql, conn, params=params)
+        if 'timestamp' in df.columns:
+            df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        return df
+
+    def _scalar(self, sql, params=()):
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchone()[0]
+
+    def count(self):
+        return self._scalar('SELECT COUNT(*) FROM orders')
+
+    def max_order_id(self):
+        return self._scalar('SELECT MAX(order_id) FROM orders')
+
+    def totals(self):
+        """Running KPI totals: O(1) regardless of history size."""
+        with self._connect() as conn:
+            row = conn.execute('''
+                SELECT order_count, scored_count, score_sum, critical_count, last_row_id
+                FROM order_totals WHERE id = 1
+            ''').fetchone()
+        keys = ("count", "scored_count", "score_sum", "critical_count", "last_row_id")
+        return dict(zip(keys, row))
+
+    def summary(self, skip_latest=0):
+        """Count, mean score and critical count; avg_excluding_latest skips the newest N orders."""
+        totals = self.totals()
+        avg = totals["score_sum"] / totals["scored_count"] if totals["scored_count"] else None
+        older_avg = None
+        if skip_latest:
+            with self._connect() as conn:
+                n, s = conn.execute('''
+                    SELECT COUNT(final_score), COALESCE(SUM(final_score), 0) FROM (
+                        SELECT final_score FROM orders ORDER BY id DESC LIMIT ?
+                    )
+                ''', (skip_latest,)).fetchone()
+            if totals["scored_count"] > n:
+                older_avg = (totals["score_sum"] - s) / (totals["scored_count"] - n)
+        return {
+            "count": totals["count"],
+            "avg_score": avg,
+            "critical_count": totals["critical_count"],
+            "avg_excluding_latest": older_avg,
+        }
+
+    def latest(self, limit=50, offset=0, columns=None):
+        """Newest orders first."""
+        cols = ", ".join(columns or COLUMNS)
+        return self.query_df(
+            f'SELECT {cols} FROM orders ORDER BY timestamp DESC LIMIT ? OFFSET ?', (limit, offset)
+        )
+
+    def recent(self, limit=50, columns=None):
+        """Last `limit` orders in arrival order, newest first, read straight off the primary key."""
+        cols = ", ".join(columns or COLUMNS)
+        return self.query_df(f'SELECT {cols} FROM orders ORDER BY id DESC LIMIT ?', (limit,))
+
+    def rows_after(self, last_row_id, columns=None, limit=None):
+        """Orders appended since `last_row_id` (the store's tail), oldest first, including their row id."""
+        cols = ", ".join(["id"] + list(columns or COLUMNS))
+        sql = f'SELECT {cols} FROM orders WHERE id > ? ORDER BY id'
+        params = (last_row_id,)
+        if limit:
+            sql += ' LIMIT ?'
+            params += (limit,)
+        return self.query_df(sql, params)
+
+    def page(self, limit, before_row_id=None):
+        """Keyset page of newest-first orders with row id < before_row_id, including their row id.
+
+        Pass the smallest id of the previous page to get the next one (no OFFSET
+        scan, and gaps in the ids cannot skip or repeat rows).
+        """
+        cols = ", ".join(["id"] + list(COLUMNS))
+        if before_row_id is None:
+            return self.query_df(f'SELECT {cols} FROM orders ORDER BY id DESC LIMIT ?', (limit,))
+        return self.query_df(
+            f'SELECT {cols} FROM orders WHERE id < ? ORDER BY id DESC LIMIT ?', (before_row_id, limit)
+        )
+
+    def aggregate_snapshot(self, group_columns=("weather", "restaurant_load")):
+        """Per-dimension (score_sum, scored_count) totals plus the row id they cover.
+
+        Everything is read inside one transaction, so a caller can continue from
+        `last_row_id` with rows_after() without double counting or gaps.
+        """
+        for column in group_columns:
+            if column not in ("weather", "restaurant_load", "action_taken"):
+                raise ValueError(f"Cannot group by {column}")
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            last_row_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM orders').fetchone()[0]
+            groups = {}
+            for column in group_columns:
+                rows = conn.execute(
+                    f'SELECT {column}, COALESCE(SUM(final_score), 0), COUNT(final_score) FROM orders '
+                    f'WHERE id <= ? AND {column} IS NOT NULL GROUP BY {column}', (last_row_id,)
+                ).fetchall()
+                groups[column] = {value: [total, n] for value, total, n in rows}
+            conn.rollback()
+        return {"last_row_id": last_row_id, "groups": groups}
+
+    def rollup_summary(self, start, end, group_by=()):
+        """Metrics over [start, end) merged from rollups, optionally per weather/restaurant_load."""
+        with self._connect() as conn:
+            return rollups.summarize(conn, start, end, group_by)
+
+    def rollup_series(self, start, end, granularity="hour"):
+        with self._connect() as conn:
+            return rollups.series(conn, start, end, granularity)
+
+    def rollup_history(self, max_points=2000):
+        """(granularity, series) covering every order in at most max_points rollup buckets."""
+        with self._connect() as conn:
+            return rollups.history(conn, max_points)
+
+    def quantile_sketches(self, metric=None):
+        """{(metric, segment): DDSketch}; each sketch is bounded in size, so this is O(1) in history."""
+        with self._connect() as conn:
+            return sketches.load_sketches(conn, metric)
+
+    def rescore(self, cache, images_root="images", chunk_size=rescoring.RESCORE_CHUNK_SIZE, note=None):
+        """Re-scores every stored order into a new order_rescores version; returns the run summary."""
+        with self._connect() as reader, self._connect() as writer:
+            return rescoring.run(reader, writer, cache, images_root, chunk_size, note)
+
+    def rescore_runs(self):
+        return self.query_df('SELECT * FROM rescore_runs ORDER BY version')
+
+    def rescore_results(self, version=None):
+        """Rows of one re-scoring run (the latest completed one by default)."""
+        if version is None:
+            version = self._scalar('SELECT MAX(version) FROM rescore_runs WHERE row_count IS NOT NULL')
+        return self.query_df(
+            'SELECT * FROM order_rescores WHERE version = ? ORDER BY order_row_id', (version,)
+        )
+
+    def get_order(self, order_id):
+        return self.query_df(
+            'SELECT * FROM orders WHERE order_id = ? ORDER BY timestamp DESC LIMIT 1', (int(order_id),)
+        )
+
+    def order_ids(self, max_score=None, limit=1000):
+        """Most recent distinct order ids, optionally only those scoring below max_score."""
+        where, params = "", []
+        if max_score is not None:
+            where, params = "WHERE final_score < ?", [max_score]
+        with self._connect() as conn:
+            rows = conn.execute(f'''
+                SELECT order_id FROM orders {where}
+                GROUP BY order_id ORDER BY MAX(timestamp) DESC LIMIT ?
+            ''', (*params, limit)).fetchall()
+        return [r[0] for r in rows]
+
+    def group_mean(self, column):
+        if column not in ("weather", "restaurant_load", "action_taken"):
+            raise ValueError(f"Cannot group by {column}")
+        df = self.query_df(
+            f'SELECT {column}, AVG(final_score) AS final_score FROM orders '
+            f'WHERE {column} IS NOT NULL GROUP BY {column}'
+        )
+        return df.set_index(column)['final_score']
+
+    def score_history(self):
+        return self.query_df('SELECT timestamp, final_score FROM orders ORDER BY timestamp')
+
+
+def open_store(db_path=ORDER_STORE_PATH, legacy_csv=LEGACY_LOG_FILE):
+    """Opens the store, importing the legacy CSV log the first time."""
+    store = OrderStore(db_path)
+    imported = store.migrate_from_csv(legacy_csv)
+    if imported:
+        print(f"📦 Migrated {imported} orders from {legacy_csv} into {db_path}")
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delivery order store tools")
+    parser.add_argument("--migrate", metavar="CSV", nargs="?", const=LEGACY_LOG_FILE,
+                        help="import a legacy order log (default: live_agent_log.csv)")
+    parser.add_argument("--force", action="store_true",
+                        help="with --migrate: import again even if already migrated (existing orders are skipped)")
+    parser.add_argument("--export", metavar="CSV", help="export the store in the legacy CSV layout")
+    parser.add_argument("--db", default=ORDER_STORE_PATH)
+    args = parser.parse_args()
+
+    store = OrderStore(args.db)
+    if args.migrate:
+        imported = store.migrate_from_csv(args.migrate, force=args.force)
+        print(f"Imported {imported} rows from {args.migrate}")
+        if not imported and not args.force:
+            print("The store was already migrated; use --force to import orders missing from it.")
+    if args.export:
+        store.export_csv(args.export)
+        print(f"Exported {store.count()} rows to {args.export}")
+    if not args.migrate and not args.export:
+        print(f"{args.db}: {store.count()} orders")
@@ -0,0 +1,133 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --- Packaging Prediction Cache ---
+# Predictions are keyed by the SHA-256 of the image bytes, so the same photo is
+# recognised under any filename. A (path, mtime, size) fast-path avoids even
+# re-hashing files that have not changed since they were last seen.
+
+CACHE_FORMAT_VERSION = 1
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class PredictionCache:
+    """Bounded LRU cache of packaging predictions (class + logits) per image content."""
+
+    def __init__(self, max_entries=4096, persist_path=None, model_tag=""):
+        self.max_entries = max(1, max_entries)
+        self.persist_path = persist_path
+        self.model_tag = model_tag
+        self._entries = OrderedDict()      # digest -> {"cls": str, "logits": [float, ...]}
+        self._stat_index = OrderedDict()   # "path|mtime_ns|size" -> digest
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if persist_path:
+            self.load()
+
+    # --- Keys ---
+    @staticmethod
+    def _stat_key(path):
+        st = os.stat(path)
+        return f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}"
+
+    def digest_for(self, path):
+        """Returns the content digest for a file, hashing it only if its stat changed."""
+        stat_key = self._stat_key(path)
+        with self._lock:
+            digest = self._stat_index.get(stat_key)
+            if digest is not None:
+                self._stat_index.move_to_end(stat_key)
+                return digest
+
+        digest = file_digest(path)
+        with self._lock:
+            self._stat_index[stat_key] = digest
+            while len(self._stat_index) > self.max_entries:
+                self._stat_index.popitem(last=False)
+        return digest
+
+    # --- Lookup / Insert ---
+    def get(self, path):
+        """Returns {"cls", "logits"} for a cached image, or None on a miss."""
+        try:
+            digest = self.digest_for(path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry
+
+    def put(self, path, cls, logits):
+        try:
+            digest = self.digest_for(path)
+        except OSError:
+            return
+        with self._lock:
+            self._entries[digest] = {"cls": cls, "logits": [round(float(x), 6) for x in logits]}
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "persist_path": self.persist_path,
+            }
+
+    # --- Persistence ---
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read prediction cache: {e}. Starting empty.")
+            return
+        # Predictions from a different model (or cache layout) are not reusable.
+        if data.get("version") != CACHE_FORMAT_VERSION or data.get("model_tag") != self.model_tag:
+            return
+        with self._lock:
+            self._entries = OrderedDict(data.get("entries", []))
+            self._stat_index = OrderedDict(data.get("stat_index", []))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            while len(self._stat_index) > self.max_entries:
+                self._stat_index.popitem(last=False)
+
+    def save(self):
+        if not self.persist_path:
+            return
+        with self._lock:
+            data = {
+                "version": CACHE_FORMAT_VERSION,
+                "model_tag": self.model_tag,
+                "entries": list(self._entries.items()),
+                "stat_index": list(self._stat_index.items()),
+            }
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.persist_path)
@@ -0,0 +1,235 @@
+import os
+import json
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from prediction_cache import PredictionCache, file_digest
+import scoring_rules as rules
+
+# --- Vectorised Bulk Re-Scoring ---
+# Recomputes every stored order's timeliness bucket, fused score, action,
+# recommendation and insight text with NumPy/pandas column operations (the
+# rules in scoring_rules.py that backend.py applies per order, one chunk of
+# orders at a time instead of one order at a time). Packaging verdicts come
+# from the backend's prediction cache; images it has never classified keep the
+# packaging status that was logged with the order. Each run is written to
+# order_rescores under a new version number, leaving the orders table untouched.
+#
+# Lateness is the stored lateness_min. The backend stores it unrounded (only
+# the CSV export keeps one decimal), so with unchanged rules a re-score puts
+# every order in the bucket the live path chose. Orders imported from a legacy
+# CSV log only have the one-decimal value: one that was up to 0.05 min past a
+# bucket limit (e.g. 5.04 min, "Average" live) rounds onto the limit and
+# re-scores one bucket better ("Good"). test_rescoring.py pins both cases.
+
+MODEL_PATH = "packaging_classifier_model.pth"
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH", "prediction_cache.json")
+RESCORE_CHUNK_SIZE = int(os.getenv("RESCORE_CHUNK_SIZE", "50000"))
+
+RESCORE_SCHEMA = ('''
+    CREATE TABLE IF NOT EXISTS rescore_runs (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        created TEXT,
+        model_tag TEXT,
+        source_last_row_id INTEGER,
+        row_count INTEGER,
+        note TEXT
+    )
+''', '''
+    CREATE TABLE IF NOT EXISTS order_rescores (
+        version INTEGER,
+        order_row_id INTEGER,
+        order_id INTEGER,
+        lateness_min REAL,
+        timeliness_status TEXT,
+        packaging_status TEXT,
+        packaging_source TEXT,
+        final_score REAL,
+        action_taken TEXT,
+        recommendation TEXT,
+        analysis_text TEXT,
+        PRIMARY KEY (version, order_row_id)
+    )
+''')
+
+RESULT_COLUMNS = [
+    "order_row_id", "order_id", "lateness_min", "timeliness_status", "packaging_status", "packaging_source",
+    "final_score", "action_taken", "recommendation", "analysis_text"
+]
+
+
+# --- Packaging from the Prediction Cache ---
+def default_model_tag(model_path=MODEL_PATH):
+    """The tag backend.py stamps on its prediction cache (model digest + backend)."""
+    return f"{file_digest(model_path)}:{os.getenv('PACKAGING_BACKEND', 'eager')}"
+
+
+def load_prediction_cache(cache_path=PREDICTION_CACHE_PATH, model_tag=None):
+    if model_tag is None:
+        model_tag = default_model_tag() if os.path.exists(MODEL_PATH) else ""
+    return PredictionCache(max_entries=1 << 30, persist_path=cache_path, model_tag=model_tag)
+
+
+def cached_packaging(image_filenames, cache, images_root="images"):
+    """{image_filename: "Excellent"/"Damaged"} for every image the cache has a verdict for."""
+    verdicts = {}
+    for filename in image_filenames:
+        if not filename:
+            continue
+        entry = cache.get(os.path.join(images_root, filename))
+        if entry is not None:
+            verdicts[filename] = rules.packaging_status(entry["cls"])[1]
+    return verdicts
+
+
+# --- Vectorised Scoring Rules ---
+def timeliness(lateness):
+    return rules.timeliness_arrays(lateness)
+
+
+def logged_packaging(status):
+    """Packaging status parsed from the stored 'Timeliness: X, Packaging: Y' summary."""
+    return status.fillna("").str.extract(r"Packaging: (\w+)", expand=False).fillna("Error")
+
+
+def insights(final_score, t_status, p_status, weather, load):
+    """Column-wise generate_insights(): returns (analysis_text, recommendation) Series.
+
+    Each text part has only a handful of distinct inputs, so the scalar rules
+    are evaluated once per distinct value and broadcast back.
+    """
+    damaged = (p_status == rules.PACKAGING_DAMAGED[1]).to_numpy()
+    delayed = np.isin(t_status, rules.DELAYED_STATUSES)
+
+    scores, score_idx = np.unique(final_score, return_inverse=True)
+    score_part = np.array([rules.score_text(v) for v in scores], dtype=object)[score_idx]
+    reasons_part = np.select(
+        [damaged & delayed, damaged, delayed],
+        [rules.reasons_text(True, True), rules.reasons_text(True, False), rules.reasons_text(False, True)],
+        rules.reasons_text(False, False)
+    ).astype(object)
+    context_keys = pd.Series(list(zip(weather.fillna(""), load.fillna(""))), index=weather.index)
+    context_part = context_keys.map({k: rules.context_text(*k) for k in context_keys.unique()}).to_numpy()
+
+    text = score_part + reasons_part + context_part
+    recommendation = rules.recommendation_arrays(final_score, damaged, delayed)
+    return pd.Series(text, index=weather.index), pd.Series(recommendation, index=weather.index)
+
+
+def rescore_frame(orders, packaging):
+    """Scores a DataFrame of stored orders (id, order_id, status, weather, restaurant_load,
+    image_filename, lateness_min). Rows without a lateness are dropped."""
+    orders = orders[orders["lateness_min"].notna()]
+    lateness = orders["lateness_min"].to_numpy(dtype=float)
+    t_score, t_status = timeliness(lateness)
+
+    from_cache = orders["image_filename"].map(packaging)
+    p_status = from_cache.fillna(logged_packaging(orders["status"]))
+    p_score = np.where(p_status == rules.PACKAGING_OK[1], rules.PACKAGING_OK[0], rules.PACKAGING_DAMAGED[0])
+
+    final_score = rules.fuse(t_score, p_score)
+    action = rules.action_arrays(final_score)
+    analysis_text, recommendation = insights(
+        final_score, t_status, p_status, orders["weather"], orders["restaurant_load"]
+    )
+
+    return pd.DataFrame({
+        "order_row_id": orders["id"].to_numpy(),
+        "order_id": orders["order_id"].to_numpy(),
+        "lateness_min": lateness,
+        "timeliness_status": t_status,
+        "packaging_status": p_status.to_numpy(),
+        "packaging_source": np.where(from_cache.notna(), "cache", "logged"),
+        "final_score": np.round(final_score, 2),
+        "action_taken": action,
+        "recommendation": recommendation.to_numpy(),
+        "analysis_text": analysis_text.to_numpy(),
+    })
+
+
+# --- Runs ---
+def run(reader, writer, cache, images_root="images", chunk_size=RESCORE_CHUNK_SIZE, note=None):
+    """Rescores every order up to the current tail into a new version. Returns a run summary.
+
+    Orders are read inside one deferred transaction on `reader` (a WAL
+    snapshot, no write lock); results are committed chunk by chunk on
+    `writer`, so the backend's inserts only ever wait for one chunk. The run's
+    row_count stays NULL until every chunk is in, and a failed run removes
+    its partial rows.
+    """
+    reader.execute("BEGIN")
+    try:
+        last_row_id = reader.execute('SELECT COALESCE(MAX(id), 0) FROM orders').fetchone()[0]
+        images = [r[0] for r in reader.execute('SELECT DISTINCT image_filename FROM orders WHERE id <= ?',
+                                               (last_row_id,))]
+        packaging = cached_packaging(images, cache, images_root)
+        with writer:
+            version = writer.execute(
+                'INSERT INTO rescore_runs (created, model_tag, source_last_row_id, row_count, note) '
+                'VALUES (?, ?, ?, NULL, ?)',
+                (datetime.now().isoformat(), cache.model_tag, last_row_id, note)
+            ).lastrowid
+
+        summary = {"version": version, "source_last_row_id": last_row_id, "rows": 0, "skipped": 0,
+                   "score_changed": 0, "action_changed": 0, "packaging_from_cache": 0,
+                   "images_with_cached_verdict": len(packaging)}
+        try:
+            after = 0
+            placeholders = ", ".join("?" * (len(RESULT_COLUMNS) + 1))
+            while after < last_row_id:
+                chunk = pd.read_sql_query(
+                    'SELECT id, order_id, final_score, status, action_taken, weather, restaurant_load, '
+                    'image_filename, lateness_min FROM orders WHERE id > ? AND id <= ? ORDER BY id LIMIT ?',
+                    reader, params=(after, last_row_id, chunk_size)
+                )
+                if chunk.empty:
+                    break
+                after = int(chunk["id"].iloc[-1])
+                scored = rescore_frame(chunk, packaging)
+                summary["rows"] += len(scored)
+                summary["skipped"] += len(chunk) - len(scored)
+                old = chunk.set_index("id").loc[scored["order_row_id"]]
+                summary["score_changed"] += int((old["final_score"].round(2).to_numpy() != scored["final_score"]).sum())
+                summary["action_changed"] += int((old["action_taken"].to_numpy() != scored["action_taken"]).sum())
+                summary["packaging_from_cache"] += int((scored["packaging_source"] == "cache").sum())
+
+                with writer:
+                    writer.executemany(
+                        f'INSERT INTO order_rescores (version, {", ".join(RESULT_COLUMNS)}) VALUES ({placeholders})',
+                        ((version, *row) for row in scored[RESULT_COLUMNS].itertuples(index=False, name=None))
+                    )
+
+            with writer:
+                writer.execute('UPDATE rescore_runs SET row_count = ? WHERE version = ?', (summary["rows"], version))
+        except Exception:
+            with writer:
+                writer.execute('DELETE FROM order_rescores WHERE version = ?', (version,))
+                writer.execute('DELETE FROM rescore_runs WHERE version = ?', (version,))
+            raise
+    finally:
+        reader.rollback()   # ends the read snapshot; nothing was written through it
+    return summary
+
+
+if __name__ == "__main__":
+    from order_store import ORDER_STORE_PATH, OrderStore
+
+    parser = argparse.ArgumentParser(description="Re-score all stored orders into a new versioned table")
+    parser.add_argument("--db", default=ORDER_STORE_PATH)
+    parser.add_argument("--cache", default=PREDICTION_CACHE_PATH, help="backend prediction cache file")
+    parser.add_argument("--model-tag", help="prediction cache model tag (default: as backend.py computes it)")
+    parser.add_argument("--images", default="images")
+    parser.add_argument("--chunk-size", type=int, default=RESCORE_CHUNK_SIZE)
+    parser.add_argument("--note")
+    parser.add_argument("--list", action="store_true", help="list previous runs instead")
+    args = parser.parse_args()
+
+    store = OrderStore(args.db)
+    if args.list:
+        print(store.rescore_runs().to_string(index=False))
+    else:
+        cache = load_prediction_cache(args.cache, args.model_tag)
+        print(json.dumps(store.rescore(cache, args.images, args.chunk_size, args.note), indent=2))
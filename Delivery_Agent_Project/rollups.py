@@ -0,0 +1,264 @@
+import json
+import math
+from datetime import datetime, timedelta
+
+# --- Time-Bucketed Order Rollups ---
+# Every order is folded into one minute, one hour and one day bucket per
+# (weather, restaurant_load) pair. A bucket row keeps count, score sum,
+# critical count, lateness sum and a 1-minute lateness histogram, which are all
+# additive, so any time range is answered by merging the coarsest buckets that
+# tile it instead of touching raw orders.
+
+GRANULARITIES = ("day", "hour", "minute")   # coarsest first
+LATENESS_MIN_BIN = -60
+LATENESS_MAX_BIN = 180
+PERCENTILES = (50, 90, 99)
+
+
+def bucket_start(timestamp, granularity):
+    """ISO bucket key 'YYYY-MM-DDTHH:MM' for an ISO timestamp string or datetime."""
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    ts = str(timestamp)
+    if granularity == "minute":
+        return ts[:16]
+    if granularity == "hour":
+        return ts[:13] + ":00"
+    if granularity == "day":
+        return ts[:10] + "T00:00"
+    raise ValueError(f"Unknown granularity '{granularity}'")
+
+
+def lateness_bin(lateness):
+    return str(max(LATENESS_MIN_BIN, min(LATENESS_MAX_BIN, math.floor(lateness))))
+
+
+def merge_hist(into, other):
+    for k, v in other.items():
+        into[k] = into.get(k, 0) + v
+    return into
+
+
+def hist_percentiles(hist, percentiles=PERCENTILES):
+    """Percentiles (to 1-minute resolution) from a {bin: count} lateness histogram."""
+    total = sum(hist.values())
+    if not total:
+        return {f"p{p}": None for p in percentiles}
+    bins = sorted((int(k), v) for k, v in hist.items())
+    out = {}
+    for p in percentiles:
+        rank = max(1, math.ceil(p / 100 * total))
+        seen = 0
+        for value, count in bins:
+            seen += count
+            if seen >= rank:
+                out[f"p{p}"] = value
+                break
+    return out
+
+
+class RollupCell:
+    __slots__ = ("order_count", "scored_count", "score_sum", "critical_count",
+                 "lateness_count", "lateness_sum", "lateness_hist")
+
+    def __init__(self):
+        self.order_count = 0
+        self.scored_count = 0
+        self.score_sum = 0.0
+        self.critical_count = 0
+        self.lateness_count = 0
+        self.lateness_sum = 0.0
+        self.lateness_hist = {}
+
+    def add_order(self, final_score, action, lateness):
+        self.order_count += 1
+        if final_score is not None:
+            self.scored_count += 1
+            self.score_sum += final_score
+        if action and "CRITICAL" in action:
+            self.critical_count += 1
+        if lateness is not None:
+            self.lateness_count += 1
+            self.lateness_sum += lateness
+            b = lateness_bin(lateness)
+            self.lateness_hist[b] = self.lateness_hist.get(b, 0) + 1
+
+    def add_row(self, order_count, scored_count, score_sum, critical_count,
+                lateness_count, lateness_sum, lateness_hist):
+        self.order_count += order_count
+        self.scored_count += scored_count
+        self.score_sum += score_sum
+        self.critical_count += critical_count
+        self.lateness_count += lateness_count
+        self.lateness_sum += lateness_sum
+        merge_hist(self.lateness_hist, json.loads(lateness_hist) if isinstance(lateness_hist, str) else lateness_hist)
+
+    def to_dict(self):
+        out = {
+            "orders": self.order_count,
+            "avg_score": round(self.score_sum / self.scored_count, 3) if self.scored_count else None,
+            "critical_count": self.critical_count,
+            "avg_lateness_min": round(self.lateness_sum / self.lateness_count, 2) if self.lateness_count else None,
+        }
+        out.update({f"lateness_{k}": v for k, v in hist_percentiles(self.lateness_hist).items()})
+        return out
+
+
+class RollupAccumulator:
+    """Collects a batch of orders into rollup deltas, then upserts them in one go."""
+
+    def __init__(self):
+        self.cells = {}
+
+    def add(self, timestamp, final_score, action, weather, load, lateness):
+        if not timestamp:
+            return
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(timestamp, granularity), weather or "", load or "")
+            cell = self.cells.get(key)
+            if cell is None:
+                cell = self.cells[key] = RollupCell()
+            cell.add_order(final_score, action, lateness)
+
+    def apply(self, conn):
+        for (granularity, bucket, weather, load), cell in self.cells.items():
+            row = conn.execute('''
+                SELECT lateness_hist FROM order_rollups
+                WHERE granularity = ? AND bucket_start = ? AND weather = ? AND restaurant_load = ?
+            ''', (granularity, bucket, weather, load)).fetchone()
+            hist = merge_hist(json.loads(row[0]) if row else {}, cell.lateness_hist)
+            conn.execute('''
+                INSERT INTO order_rollups (granularity, bucket_start, weather, restaurant_load,
+                    order_count, scored_count, score_sum, critical_count,
+                    lateness_count, lateness_sum, lateness_hist)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (granularity, bucket_start, weather, restaurant_load) DO UPDATE SET
+                    order_count = order_count + excluded.order_count,
+                    scored_count = scored_count + excluded.scored_count,
+                    score_sum = score_sum + excluded.score_sum,
+                    critical_count = critical_count + excluded.critical_count,
+                    lateness_count = lateness_count + excluded.lateness_count,
+                    lateness_sum = lateness_sum + excluded.lateness_sum,
+                    lateness_hist = excluded.lateness_hist
+            ''', (granularity, bucket, weather, load,
+                  cell.order_count, cell.scored_count, cell.score_sum, cell.critical_count,
+                  cell.lateness_count, cell.lateness_sum, json.dumps(hist)))
+        self.cells = {}
+
+
+ROLLUP_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS order_rollups (
+        granularity TEXT,
+        bucket_start TEXT,
+        weather TEXT,
+        restaurant_load TEXT,
+        order_count INTEGER,
+        scored_count INTEGER,
+        score_sum REAL,
+        critical_count INTEGER,
+        lateness_count INTEGER,
+        lateness_sum REAL,
+        lateness_hist TEXT,
+        PRIMARY KEY (granularity, bucket_start, weather, restaurant_load)
+    )
+'''
+
+
+# --- Range Planning ---
+STEP = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+
+def _floor(dt, granularity):
+    if granularity == "minute":
+        return dt.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _ceil(dt, granularity):
+    floored = _floor(dt, granularity)
+    return floored if floored == dt else floored + STEP[granularity]
+
+
+def plan_segments(start, end, granularities=GRANULARITIES):
+    """Tiles [start, end) with the fewest day/hour/minute buckets.
+
+    Returns (granularity, lo_key, hi_key) triples selecting buckets with
+    lo_key <= bucket_start < hi_key. The range is widened to whole minutes.
+    """
+    start, end = _floor(start, "minute"), _ceil(end, "minute")
+    if start >= end:
+        return []
+    granularity, finer = granularities[0], granularities[1:]
+    if not finer:
+        return [(granularity, bucket_start(start, granularity), bucket_start(end, granularity))]
+
+    lo, hi = _ceil(start, granularity), _floor(end, granularity)
+    if lo >= hi:
+        return plan_segments(start, end, finer)
+    return (
+        plan_segments(start, lo, finer)
+        + [(granularity, bucket_start(lo, granularity), bucket_start(hi, granularity))]
+        + plan_segments(hi, end, finer)
+    )
+
+
+def summarize(conn, start, end, group_by=()):
+    """Merged metrics over [start, end), optionally split by weather and/or restaurant_load."""
+    for column in group_by:
+        if column not in ("weather", "restaurant_load"):
+            raise ValueError(f"Cannot group by {column}")
+    groups = {}
+    for granularity, lo, hi in plan_segments(start, end):
+        rows = conn.execute('''
+            SELECT weather, restaurant_load, order_count, scored_count, score_sum, critical_count,
+                   lateness_count, lateness_sum, lateness_hist
+            FROM order_rollups
+            WHERE granularity = ? AND bucket_start >= ? AND bucket_start < ?
+        ''', (granularity, lo, hi)).fetchall()
+        for weather, load, *metrics in rows:
+            dims = {"weather": weather, "restaurant_load": load}
+            key = tuple(dims[c] for c in group_by)
+            cell = groups.get(key)
+            if cell is None:
+                cell = groups[key] = RollupCell()
+            cell.add_row(*metrics)
+
+    results = []
+    for key, cell in sorted(groups.items()):
+        entry = dict(zip(group_by, key))
+        entry.update(cell.to_dict())
+        results.append(entry)
+    return results
+
+
+def series(conn, start, end, granularity="hour"):
+    """One merged metrics row per bucket of `granularity` within [start, end)."""
+    rows = conn.execute('''
+        SELECT bucket_start, order_count, scored_count, score_sum, critical_count,
+               lateness_count, lateness_sum, lateness_hist
+        FROM order_rollups
+        WHERE granularity = ? AND bucket_start >= ? AND bucket_start < ?
+        ORDER BY bucket_start
+    ''', (granularity, bucket_start(_floor(start, granularity), granularity),
+          bucket_start(_ceil(end, granularity), granularity))).fetchall()
+    buckets = {}
+    for bucket, *metrics in rows:
+        cell = buckets.get(bucket)
+        if cell is None:
+            cell = buckets[bucket] = RollupCell()
+        cell.add_row(*metrics)
+    return [dict(bucket_start=bucket, **cell.to_dict()) for bucket, cell in buckets.items()]
+
+
+def history(conn, max_points):
+    """(granularity, series) over the whole history at the finest granularity with at most max_points buckets."""
+    first, last = conn.execute(
+        "SELECT MIN(bucket_start), MAX(bucket_start) FROM order_rollups WHERE granularity = 'day'"
+    ).fetchone()
+    if first is None:
+        return "day", []
+    start, end = datetime.fromisoformat(first), datetime.fromisoformat(last) + STEP["day"]
+    granularity = next((g for g in reversed(GRANULARITIES) if (end - start) / STEP[g] <= max_points), "day")
+    return granularity, series(conn, start, end, granularity)
@@ -0,0 +1,119 @@
+import numpy as np
+
+# --- Order Scoring Rules ---
+# The single definition of how an order is scored: timeliness buckets, the
+# timeliness/packaging weights, action cut-offs and insight wording.
+# backend.py applies them to one order at a time, rescoring.py column-wise to
+# the whole store, so a rule change here reaches both.
+
+TIMELINESS_WEIGHT = 0.7
+PACKAGING_WEIGHT = 0.3
+
+# (lateness up to N minutes, score, status); anything later is LATE_SCORE / LATE_STATUS
+TIMELINESS_BUCKETS = (
+    (0, 5.0, "Excellent"),
+    (5, 4.0, "Good"),
+    (15, 3.0, "Average"),
+    (30, 2.0, "Poor"),
+)
+LATE_SCORE, LATE_STATUS = 1.0, "Very Poor"
+DELAYED_STATUSES = ("Poor", "Very Poor")
+
+PACKAGING_OK = (5.0, "Excellent")
+PACKAGING_DAMAGED = (1.0, "Damaged")
+
+# (final score at least, action); below every threshold is CRITICAL_ACTION
+ACTION_THRESHOLDS = (
+    (4.0, "No Action"),
+    (2.5, "Flagged for Review"),
+)
+CRITICAL_ACTION = "CRITICAL: Refund Issued"
+
+# Insights
+RECOMMEND_BELOW = 4.0
+ADVERSE_WEATHER = ("Rain", "Fog")
+HIGH_LOAD = "High"
+REASON_DAMAGE = "packaging damage"
+REASON_DELAY = "significant delay"
+CONTEXT_LOAD = "high restaurant load"
+REC_DAMAGED = "Check Handling"
+REC_DELAYED = "Review Route / Adjust ETA"
+REC_STANDARD = "Standard Protocol"
+
+
+# --- Scalar rules (one order) ---
+def timeliness_status(lateness):
+    for limit, score, status in TIMELINESS_BUCKETS:
+        if lateness <= limit:
+            return score, status
+    return LATE_SCORE, LATE_STATUS
+
+
+def packaging_status(cls):
+    return PACKAGING_OK if cls == 'ok' else PACKAGING_DAMAGED
+
+
+def fuse(t_score, p_score):
+    """Works on floats and NumPy arrays alike."""
+    return t_score * TIMELINESS_WEIGHT + p_score * PACKAGING_WEIGHT
+
+
+def action_for(final_score):
+    for threshold, action in ACTION_THRESHOLDS:
+        if final_score >= threshold:
+            return action
+    return CRITICAL_ACTION
+
+
+def summary_text(t_status, p_status):
+    return f"Timeliness: {t_status}, Packaging: {p_status}"
+
+
+def score_text(final_score):
+    return f"Score: {final_score:.1f}/5.0. "
+
+
+def reasons_text(damaged, delayed):
+    reasons = []
+    if damaged: reasons.append(REASON_DAMAGE)
+    if delayed: reasons.append(REASON_DELAY)
+    return f"Impacted by {', '.join(reasons)}. " if reasons else ""
+
+
+def context_text(weather, load):
+    context = []
+    if weather in ADVERSE_WEATHER: context.append(f"adverse weather ({weather})")
+    if load == HIGH_LOAD: context.append(CONTEXT_LOAD)
+    return f"Context: {', '.join(context)}." if context else ""
+
+
+def recommendation(final_score, damaged, delayed):
+    if final_score < RECOMMEND_BELOW:
+        if damaged: return REC_DAMAGED
+        if delayed: return REC_DELAYED
+    return REC_STANDARD
+
+
+def generate_insights(final_score, t_status, p_status, weather, load):
+    damaged = p_status == PACKAGING_DAMAGED[1]
+    delayed = t_status in DELAYED_STATUSES
+    text = score_text(final_score) + reasons_text(damaged, delayed) + context_text(weather, load)
+    return text, recommendation(final_score, damaged, delayed)
+
+
+# --- Vectorised rules (NumPy arrays) ---
+def timeliness_arrays(lateness):
+    conditions = [lateness <= limit for limit, _, _ in TIMELINESS_BUCKETS]
+    t_score = np.select(conditions, [score for _, score, _ in TIMELINESS_BUCKETS], LATE_SCORE)
+    t_status = np.select(conditions, [status for _, _, status in TIMELINESS_BUCKETS], LATE_STATUS)
+    return t_score, t_status
+
+
+def action_arrays(final_score):
+    return np.select([final_score >= threshold for threshold, _ in ACTION_THRESHOLDS],
+                     [action for _, action in ACTION_THRESHOLDS], CRITICAL_ACTION)
+
+
+def recommendation_arrays(final_score, damaged, delayed):
+    low = final_score < RECOMMEND_BELOW
+    return np.select([low & damaged, low & delayed], [REC_DAMAGED, REC_DELAYED], REC_STANDARD)
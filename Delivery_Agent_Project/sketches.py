@@ -0,0 +1,193 @@
+import json
+import math
+
+# --- Mergeable Streaming Quantile Sketch ---
+# A DDSketch: values are counted in logarithmically sized buckets, so any
+# quantile is returned within RELATIVE_ACCURACY of the true value (for |x|
+# above MIN_INDEXABLE). Memory is capped at max_bins buckets per sign, and two
+# sketches built with the same parameters merge by adding bucket counts, which
+# makes them safe to combine across batches, segments and backend replicas.
+
+RELATIVE_ACCURACY = 0.01
+MAX_BINS = 2048
+MIN_INDEXABLE = 1e-3
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, max_bins=MAX_BINS):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}    # bucket index -> count, for x > 0
+        self.negative = {}    # bucket index of |x| -> count, for x < 0
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    # --- Updates ---
+    def _index(self, x):
+        return math.ceil(math.log(x) / self._log_gamma)
+
+    def _value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, x, weight=1):
+        if x is None or (isinstance(x, float) and math.isnan(x)):
+            return
+        if x > MIN_INDEXABLE:
+            store = self.positive
+            key = self._index(x)
+        elif x < -MIN_INDEXABLE:
+            store = self.negative
+            key = self._index(-x)
+        else:
+            self.zero_count += weight
+            store = None
+        if store is not None:
+            store[key] = store.get(key, 0) + weight
+            if len(store) > self.max_bins:
+                self._collapse(store)
+        self.count += weight
+        self.sum += x * weight
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def _collapse(self, store):
+        # Fold the buckets closest to zero together; the tails (p90/p99) keep full accuracy.
+        keys = sorted(store)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+        for k in keys[:excess]:
+            store[target] += store.pop(k)
+
+    def merge(self, other):
+        if abs(other.gamma - self.gamma) > 1e-12:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for k, v in theirs.items():
+                mine[k] = mine.get(k, 0) + v
+            if len(mine) > self.max_bins:
+                self._collapse(mine)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    # --- Queries ---
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for k in sorted(self.negative, reverse=True):
+            seen += self.negative[k]
+            if seen > rank:
+                return max(self.min, -self._value(k))
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.positive):
+            seen += self.positive[k]
+            if seen > rank:
+                return min(self.max, self._value(k))
+        return self.max
+
+    def percentiles(self, ps=(50, 90, 99), ndigits=2):
+        out = {}
+        for p in ps:
+            v = self.quantile(p / 100)
+            out[f"p{p}"] = round(v, ndigits) if v is not None else None
+        return out
+
+    # --- Serialisation ---
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "positive": {str(k): v for k, v in self.positive.items()},
+            "negative": {str(k): v for k, v in self.negative.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data.get("relative_accuracy", RELATIVE_ACCURACY), data.get("max_bins", MAX_BINS))
+        sketch.positive = {int(k): v for k, v in data.get("positive", {}).items()}
+        sketch.negative = {int(k): v for k, v in data.get("negative", {}).items()}
+        sketch.zero_count = data.get("zero_count", 0)
+        sketch.count = data.get("count", 0)
+        sketch.sum = data.get("sum", 0.0)
+        sketch.min = data["min"] if data.get("min") is not None else math.inf
+        sketch.max = data["max"] if data.get("max") is not None else -math.inf
+        return sketch
+
+
+# --- Per-Segment Sketches in the Order Store ---
+SKETCH_METRICS = ("lateness_min", "final_score")
+SEGMENT_COLUMNS = ("weather", "restaurant_load")
+
+SKETCH_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS order_sketches (
+        metric TEXT,
+        segment TEXT,
+        sketch TEXT,
+        PRIMARY KEY (metric, segment)
+    )
+'''
+
+
+def segments_for(weather, load):
+    """'all' plus one 'column=value' segment per known dimension value."""
+    segments = ["all"]
+    for column, value in zip(SEGMENT_COLUMNS, (weather, load)):
+        if value:
+            segments.append(f"{column}={value}")
+    return segments
+
+
+class SketchAccumulator:
+    """Builds per-(metric, segment) delta sketches for a batch, then merges them into the store."""
+
+    def __init__(self):
+        self.sketches = {}
+
+    def add(self, final_score, lateness, weather, load):
+        values = {"final_score": final_score, "lateness_min": lateness}
+        for segment in segments_for(weather, load):
+            for metric in SKETCH_METRICS:
+                if values[metric] is None:
+                    continue
+                key = (metric, segment)
+                sketch = self.sketches.get(key)
+                if sketch is None:
+                    sketch = self.sketches[key] = DDSketch()
+                sketch.add(values[metric])
+
+    def apply(self, conn):
+        for (metric, segment), delta in self.sketches.items():
+            row = conn.execute(
+                'SELECT sketch FROM order_sketches WHERE metric = ? AND segment = ?', (metric, segment)
+            ).fetchone()
+            merged = DDSketch.from_dict(json.loads(row[0])).merge(delta) if row else delta
+            conn.execute(
+                'INSERT OR REPLACE INTO order_sketches (metric, segment, sketch) VALUES (?, ?, ?)',
+                (metric, segment, json.dumps(merged.to_dict()))
+            )
+        self.sketches = {}
+
+
+def load_sketches(conn, metric=None):
+    """{(metric, segment): DDSketch} for every stored sketch (optionally one metric)."""
+    sql, params = 'SELECT metric, segment, sketch FROM order_sketches', ()
+    if metric:
+        sql, params = sql + ' WHERE metric = ?', (metric,)
+    return {(m, seg): DDSketch.from_dict(json.loads(raw)) for m, seg, raw in conn.execute(sql, params)}
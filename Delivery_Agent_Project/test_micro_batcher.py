@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+import pytest
+
+from micro_batcher import MicroBatcher
+
+
+def gated_batcher():
+    """A batcher whose first batch waits for `gate`, so waiters can be cancelled while queued."""
+    gate = threading.Event()
+
+    def process(items):
+        gate.wait(5)
+        return [item * 2 for item in items]
+
+    return MicroBatcher(process, max_batch_size=4, max_wait_ms=1), gate
+
+
+def test_cancelled_waiter_does_not_stop_the_worker():
+    batcher, gate = gated_batcher()
+
+    async def scenario():
+        blocker = asyncio.wrap_future(batcher.submit(1))   # occupies the worker
+        await asyncio.sleep(0.05)
+        doomed = asyncio.wrap_future(batcher.submit(2))
+        kept = asyncio.wrap_future(batcher.submit(3))
+        doomed.cancel()   # also cancels the concurrent Future still in the queue
+        gate.set()
+        assert await blocker == 2
+        assert await asyncio.wait_for(kept, 5) == 6
+        # The worker is still alive for later requests.
+        assert await asyncio.wait_for(asyncio.wrap_future(batcher.submit(5)), 5) == 10
+
+    asyncio.run(scenario())
+    assert batcher.cancelled == 1
+
+
+def test_cancelled_while_running_keeps_the_worker():
+    batcher, gate = gated_batcher()
+
+    async def scenario():
+        running = asyncio.wrap_future(batcher.submit(1))
+        await asyncio.sleep(0.05)   # the worker has claimed it
+        running.cancel()
+        gate.set()
+        assert await asyncio.wait_for(asyncio.wrap_future(batcher.submit(4)), 5) == 8
+
+    asyncio.run(scenario())
+
+
+def test_failing_batch_resolves_its_waiters_and_the_worker_survives():
+    calls = []
+
+    def process(items):
+        calls.append(items)
+        if len(calls) == 1:
+            raise ValueError("boom")
+        return items
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher.submit("a").result(5)
+    assert batcher.submit("b").result(5) == "b"
+
+
+def test_wrong_result_count_is_an_error_not_a_hang():
+    batcher = MicroBatcher(lambda items: [], max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.submit("x").result(5)
@@ -0,0 +1,52 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from order_store import OrderStore
+from test_rescoring import live_row
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OrderStore(str(tmp_path / "orders.db"))
+
+
+def test_keyset_pages_cover_every_order_once_despite_id_gaps(store):
+    store.insert_many([live_row(i, 3.0) for i in range(50)])
+    conn = sqlite3.connect(store.db_path)
+    with conn:
+        conn.execute("DELETE FROM orders WHERE order_id % 3 = 0")   # holes in the row ids
+    conn.close()
+    remaining = store.count()
+    assert remaining == 33
+    seen, cursor = [], None
+    while True:
+        page = store.page(7, before_row_id=cursor)
+        if page.empty:
+            break
+        assert list(page["id"]) == sorted(page["id"], reverse=True)
+        seen += list(page["order_id"])
+        cursor = int(page["id"].min())
+    assert len(seen) == len(set(seen)) == remaining
+
+
+def test_full_history_uses_the_finest_rollup_that_fits(store):
+    start = datetime(2025, 1, 1)
+    rows = []
+    for i, minutes in enumerate([0, 30, 60 * 24 * 3, 60 * 24 * 3 + 5]):
+        row = live_row(i, 3.0)
+        row[0] = (start + timedelta(minutes=minutes)).isoformat()
+        rows.append(row)
+    store.insert_many(rows)
+    granularity, series = store.rollup_history(max_points=10_000)
+    assert granularity == "minute" and sum(b["orders"] for b in series) == 4
+    granularity, series = store.rollup_history(max_points=2000)   # 4 days = 5760 minutes
+    assert granularity == "hour" and sum(b["orders"] for b in series) == 4
+    granularity, series = store.rollup_history(max_points=10)
+    assert granularity == "day" and len(series) <= 10
+    assert sum(b["orders"] for b in series) == 4
+
+
+def test_empty_store_has_no_history(store):
+    assert store.rollup_history() == ("day", [])
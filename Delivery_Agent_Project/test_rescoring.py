@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+
+import rescoring
+import scoring_rules as rules
+from order_store import OrderStore
+from prediction_cache import PredictionCache
+
+
+def live_row(order_id, lateness, packaging_cls="ok", weather="Sunny", load="Low"):
+    """The row backend.analyze_order stores for an order (lateness unrounded)."""
+    t_score, t_status = rules.timeliness_status(lateness)
+    p_score, p_status = rules.packaging_status(packaging_cls)
+    final_score = rules.fuse(t_score, p_score)
+    text, recommendation = rules.generate_insights(final_score, t_status, p_status, weather, load)
+    return ["2025-01-01T12:00:00", order_id, round(final_score, 2), rules.summary_text(t_status, p_status),
+            rules.action_for(final_score), 2.5, weather, load, f"img_{order_id}.jpg", text, recommendation,
+            lateness]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OrderStore(str(tmp_path / "orders.db"))
+
+
+def empty_cache():
+    return PredictionCache(persist_path=None)
+
+
+def test_rescore_matches_the_live_bucket_at_a_boundary(store):
+    lateness = [4.99, 5.0, 5.04, 15.01, 30.049, 0.0]
+    store.insert_many([live_row(i, l) for i, l in enumerate(lateness)])
+    summary = store.rescore(empty_cache())
+    assert summary["rows"] == len(lateness)
+    assert summary["score_changed"] == 0 and summary["action_changed"] == 0
+    rescored = store.rescore_results()
+    assert list(rescored["timeliness_status"]) == [rules.timeliness_status(l)[1] for l in lateness]
+
+
+def test_legacy_one_decimal_lateness_rescores_one_bucket_better(store):
+    # Scored live at 5.04 min ("Average"), but a legacy CSV only kept 5.0.
+    row = live_row(1, 5.04)
+    row[-1] = round(row[-1], 1)
+    store.insert_many([row])
+    summary = store.rescore(empty_cache())
+    assert summary["score_changed"] == 1
+    assert store.rescore_results()["timeliness_status"].iloc[0] == "Good"
+
+
+def test_orders_can_be_stored_while_a_rescore_runs(store, monkeypatch):
+    store.insert_many([live_row(i, i % 40) for i in range(200)])
+    original = rescoring.rescore_frame
+
+    def insert_meanwhile(orders, packaging):
+        # A short busy timeout: any write lock held by the run would fail this insert.
+        conn = sqlite3.connect(store.db_path, timeout=0.2)
+        try:
+            with conn:
+                conn.execute("INSERT INTO orders (order_id, lateness_min) VALUES (?, ?)", (10_000, 1.0))
+        finally:
+            conn.close()
+        return original(orders, packaging)
+
+    monkeypatch.setattr(rescoring, "rescore_frame", insert_meanwhile)
+    summary = store.rescore(empty_cache(), chunk_size=50)
+    assert summary["rows"] == 200   # rows added during the run belong to the next one
+    assert store.count() == 204
+
+
+def test_failed_run_leaves_no_partial_version(store, monkeypatch):
+    store.insert_many([live_row(i, 3.0) for i in range(100)])
+    first = store.rescore(empty_cache())["version"]
+    calls = []
+    original = rescoring.rescore_frame
+
+    def fail_second_chunk(orders, packaging):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("boom")
+        return original(orders, packaging)
+
+    monkeypatch.setattr(rescoring, "rescore_frame", fail_second_chunk)
+    with pytest.raises(RuntimeError):
+        store.rescore(empty_cache(), chunk_size=30)
+    assert list(store.rescore_runs()["version"]) == [first]
+    assert len(store.rescore_results()) == 100
@@ -1,8 +1,23 @@
+import os
+import sys
+import asyncio
+from typing import List
+
 import torch
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
 
+import model_backends
+
+# The micro-batcher is shared with the delivery backend (Delivery_Agent_Project/micro_batcher.py);
+# appended, so this folder's own modules (e.g. model_backends) keep precedence.
+DELIVERY_AGENT_DIR = os.path.abspath(os.getenv(
+    "DELIVERY_AGENT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Delivery_Agent_Project")
+))
+sys.path.append(DELIVERY_AGENT_DIR)
+from micro_batcher import MicroBatcher
+
 # =========================
 # APP INIT
 # =========================
@@ -15,17 +30,18 @@ device = "cuda" if torch.cuda.is_available() else "cpu"
 # =========================
 MODEL_PATH = "./food_quality_model"
 
+# FQ_INTRA_OP_THREADS / FQ_INTER_OP_THREADS, applied before the first forward pass
+model_backends.apply_thread_settings()
+
 tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_PATH)
 model = DistilBertForSequenceClassification.from_pretrained(MODEL_PATH)
 model.to(device)
 model.eval()
 
-# =========================
-# OBSERVED RAW RANGE
-# (from your tests)
-# =========================
-RAW_MIN = 0.4629
-RAW_MAX = 0.6905
+# FQ_BACKEND picks eager / int8 / onnx (see model_backends.py)
+model_backend = model_backends.build(model, MODEL_PATH, model_backends.FQ_BACKEND, device)
+# Changes with the weights and the effective backend; consumers key their score caches on it.
+MODEL_ID = model_backends.model_identity(MODEL_PATH, model_backend.name)
 
 # =========================
 # REQUEST SCHEMA
@@ -33,48 +49,74 @@ RAW_MAX = 0.6905
 class ReviewInput(BaseModel):
     review: str
 
+class ReviewBatchInput(BaseModel):
+    reviews: List[str]
+
 # =========================
 # SCALING FUNCTION
 # =========================
-def scale_to_0_1(value: float) -> float:
-    scaled = (value - RAW_MIN) / (RAW_MAX - RAW_MIN)
-    return max(0.0, min(1.0, scaled))  # clamp safely
+# Observed raw range (RAW_MIN / RAW_MAX) and the clamped rescaling live in
+# model_backends.py, shared with the calibration report and embedded consumers.
+scale_to_0_1 = model_backends.scale_to_0_1
 
 # =========================
-# PREDICTION FUNCTION
-# =========================
-def predict_food_quality(review: str):
-    try:
-        inputs = tokenizer(
-            review,
-            return_tensors="pt",
-            truncation=True,
-            padding=True,
-            max_length=128
-        ).to(device)
+# PREDICTION FUNCTIONS
+# =========================
+def score_reviews(reviews: List[str]) -> List[float]:
+    """Scores many reviews with one padded forward pass."""
+    inputs = tokenizer(
+        reviews,
+        return_tensors="pt",
+        truncation=True,
+        padding=True,
+        max_length=128
+    )
 
-        with torch.no_grad():
-            logits = model(**inputs).logits  # shape: [1, 1]
+    # Raw sigmoid scores, rescaled to [0, 1]
+    raw_scores = model_backend(inputs)
+    return [round(scale_to_0_1(raw), 4) for raw in raw_scores]
 
-        # Raw sigmoid score
-        raw_score = torch.sigmoid(logits).item()
+# =========================
+# DYNAMIC BATCHING
+# =========================
+# Concurrent requests are coalesced by one worker thread: it takes the first
+# waiting review, collects more for up to PREDICT_BATCH_MAX_WAIT_MS (or until
+# PREDICT_BATCH_MAX_SIZE) and scores them in a single forward pass. Waiters
+# cancelled while queued are skipped and a failing batch cannot stop the
+# worker (see micro_batcher.py); submit() resolves to one scaled score.
+BATCH_MAX_SIZE = int(os.getenv("PREDICT_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("PREDICT_BATCH_MAX_WAIT_MS", "5"))
 
-        # Rescaled score [0, 1]
-        final_score = scale_to_0_1(raw_score)
+batcher = MicroBatcher(score_reviews, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name="review-batcher")
 
-        return {
-            "score": round(final_score, 4)
-        }
+# =========================
+# API ROUTES
+# =========================
+@app.post("/predict")
+async def predict_quality(data: ReviewInput):
+    try:
+        score = await asyncio.wrap_future(batcher.submit(data.review))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"score": score}
 
+@app.post("/predict_batch")
+async def predict_quality_batch(data: ReviewBatchInput):
+    """Scores a list of reviews; they share batches with concurrent /predict calls."""
+    try:
+        futures = [asyncio.wrap_future(batcher.submit(r)) for r in data.reviews]
+        scores = await asyncio.gather(*futures)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {"scores": list(scores)}
 
-# =========================
-# API ROUTE
-# =========================
-@app.post("/predict")
-def predict_quality(data: ReviewInput):
-    return predict_food_quality(data.review)
+@app.get("/batching")
+def batching_stats():
+    return batcher.stats()
+
+@app.get("/model_info")
+def model_info():
+    return {"model_id": MODEL_ID, "backend": model_backend.name}
 
 # =========================
 # HEALTH CHECK
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+
+import numpy as np
+import torch
+
+# =========================
+# OPTIMISED CPU BACKENDS
+# =========================
+# Selected with FQ_BACKEND:
+#   eager  plain FP32 DistilBERT (reference)
+#   int8   dynamic INT8 quantisation of every Linear layer (weights int8,
+#          activations quantised on the fly); no calibration data needed
+#   onnx   graph exported once to <model>/model.onnx and run with onnxruntime
+# FQ_INTRA_OP_THREADS / FQ_INTER_OP_THREADS size the thread pools of torch and
+# onnxruntime alike (0 keeps the library default).
+
+BACKENDS = ("eager", "int8", "onnx")
+FQ_BACKEND = os.getenv("FQ_BACKEND", "eager")
+INTRA_OP_THREADS = int(os.getenv("FQ_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.getenv("FQ_INTER_OP_THREADS", "0"))
+ONNX_OPSET = 17
+
+# Observed raw sigmoid range of the trained model (from its tests); scores are
+# rescaled to [0, 1] over it. The single definition, used by app.py and the
+# embedded scorer in realtime-fq/consumer.py.
+RAW_MIN = 0.4629
+RAW_MAX = 0.6905
+
+CALIBRATION_REVIEWS = [
+    "Absolutely delicious, the best pizza I have had in years!",
+    "The food was cold and the fries were soggy.",
+    "Decent portion sizes but the curry was a bit bland.",
+    "Terrible. The chicken was undercooked and smelled off.",
+    "Fresh ingredients, fast delivery, will order again.",
+    "It was okay, nothing special.",
+    "The burger was burnt and the bun was stale.",
+    "Lovely flavours, perfectly seasoned and still hot on arrival.",
+    "Way too salty, I could not finish it.",
+    "Great value for money and very friendly driver.",
+    "The sushi tasted fishy and the rice was hard.",
+    "Good food, but the packaging leaked everywhere.",
+]
+
+
+def apply_thread_settings(intra=INTRA_OP_THREADS, inter=INTER_OP_THREADS):
+    """Call before the first forward pass; torch fixes the inter-op pool once it is used."""
+    if intra > 0:
+        torch.set_num_threads(intra)
+    if inter > 0:
+        try:
+            torch.set_num_interop_threads(inter)
+        except RuntimeError:
+            pass  # already started; keep the existing pool
+
+
+def model_identity(model_path, backend=FQ_BACKEND):
+    """Short id that changes when the weights, config or backend change (keys shared score caches)."""
+    digest = hashlib.blake2b(backend.encode("utf-8"), digest_size=8)
+    for name in sorted(os.listdir(model_path)):
+        if name.endswith((".safetensors", ".bin", "config.json")):
+            stat = os.stat(os.path.join(model_path, name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return f"{backend}-{digest.hexdigest()}"
+
+
+def scale_to_0_1(value: float) -> float:
+    scaled = (value - RAW_MIN) / (RAW_MAX - RAW_MIN)
+    return max(0.0, min(1.0, scaled))  # clamp safely
+
+
+# =========================
+# BACKENDS
+# =========================
+class TorchBackend:
+    """Eager or dynamically quantised torch model; returns raw sigmoid scores."""
+
+    def __init__(self, model, device="cpu", name="eager"):
+        self.model = model
+        self.device = device
+        self.name = name
+
+    def __call__(self, inputs):
+        inputs = inputs.to(self.device)
+        with torch.no_grad():
+            logits = self.model(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]).logits
+        return torch.sigmoid(logits).view(-1).tolist()
+
+
+class _LogitsOnly(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+def export_onnx(model, model_path):
+    """Exports <model_path>/model.onnx unless an export newer than the weights exists."""
+    onnx_path = os.path.join(model_path, "model.onnx")
+    weights = [os.path.join(model_path, f) for f in os.listdir(model_path)
+               if f.endswith((".safetensors", ".bin"))]
+    newest_weights = max((os.path.getmtime(w) for w in weights), default=0)
+    if os.path.exists(onnx_path) and os.path.getmtime(onnx_path) >= newest_weights:
+        return onnx_path
+
+    dummy_ids = torch.ones(2, 16, dtype=torch.long)
+    dummy_mask = torch.ones(2, 16, dtype=torch.long)
+    torch.onnx.export(
+        _LogitsOnly(model.cpu().eval()), (dummy_ids, dummy_mask), onnx_path,
+        input_names=["input_ids", "attention_mask"], output_names=["logits"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "seq"}, "attention_mask": {0: "batch", 1: "seq"},
+                      "logits": {0: "batch"}},
+        opset_version=ONNX_OPSET, dynamo=False,
+    )
+    return onnx_path
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, onnx_path, intra=INTRA_OP_THREADS, inter=INTER_OP_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra > 0:
+            options.intra_op_num_threads = intra
+        if inter > 0:
+            options.inter_op_num_threads = inter
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, inputs):
+        feeds = {
+            "input_ids": inputs["input_ids"].cpu().numpy().astype(np.int64),
+            "attention_mask": inputs["attention_mask"].cpu().numpy().astype(np.int64),
+        }
+        logits = self.session.run(["logits"], feeds)[0]
+        return (1.0 / (1.0 + np.exp(-logits.reshape(-1)))).tolist()
+
+
+def build(model, model_path, backend=FQ_BACKEND, device="cpu"):
+    """Returns a callable mapping tokenizer output to raw sigmoid scores."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown FQ_BACKEND '{backend}', expected one of {BACKENDS}")
+    if backend == "eager":
+        return TorchBackend(model, device)
+    if device != "cpu":
+        print(f"⚠️ FQ_BACKEND={backend} targets CPU; using eager on {device}.")
+        return TorchBackend(model, device)
+    if backend == "int8":
+        quantized = torch.ao.quantization.quantize_dynamic(model.cpu().eval(), {torch.nn.Linear}, dtype=torch.qint8)
+        return TorchBackend(quantized, name="int8")
+    return OnnxBackend(export_onnx(model, model_path))
+
+
+# =========================
+# CALIBRATION & LATENCY REPORT
+# =========================
+def report(model_path, backends=BACKENDS, reviews=CALIBRATION_REVIEWS, batch_sizes=(1, 32), repeats=5):
+    """Scaled-score agreement with FP32 eager (after RAW_MIN/RAW_MAX scaling) plus latency per backend.
+
+    The eager reference is always computed, whichever backends are listed.
+    """
+    from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+
+    tokenizer = DistilBertTokenizerFast.from_pretrained(model_path)
+
+    def encode(texts):
+        return tokenizer(texts, return_tensors="pt", truncation=True, padding=True, max_length=128)
+
+    corpus = encode(reviews)
+    results = {
+        "reviews": len(reviews),
+        "intra_op_threads": torch.get_num_threads(),
+        "inter_op_threads": torch.get_num_interop_threads(),
+        "backends": {},
+    }
+    reference_model = DistilBertForSequenceClassification.from_pretrained(model_path).eval()
+    reference_raw = np.array(build(reference_model, model_path, "eager")(corpus))
+    reference = (reference_raw, np.array([scale_to_0_1(v) for v in reference_raw]))
+    for backend in backends:
+        model = DistilBertForSequenceClassification.from_pretrained(model_path).eval()
+        try:
+            scorer = build(model, model_path, backend)
+        except ImportError as e:
+            results["backends"][backend] = {"error": f"unavailable: {e}"}
+            continue
+        raw = np.array(scorer(corpus))
+        scaled = np.array([scale_to_0_1(v) for v in raw])
+        entry = {
+            "max_raw_diff": round(float(np.abs(raw - reference[0]).max()), 5),
+            "max_scaled_diff": round(float(np.abs(scaled - reference[1]).max()), 5),
+            # Scores outside [RAW_MIN, RAW_MAX] clamp to 0/1; a backend must not push more reviews there.
+            "clamped_fraction": round(float(((raw < RAW_MIN) | (raw > RAW_MAX)).mean()), 4),
+        }
+        for bs in batch_sizes:
+            batch = encode((reviews * (bs // len(reviews) + 1))[:bs])
+            scorer(batch)
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                scorer(batch)
+                best = min(best, time.perf_counter() - start)
+            entry[f"ms_per_review_bs{bs}"] = round(best / bs * 1000, 3)
+        results["backends"][backend] = entry
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare food-quality model backends against FP32")
+    parser.add_argument("--model", default="./food_quality_model")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--reviews-file", help="one review per line (default: built-in samples)")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="max allowed scaled-score difference")
+    args = parser.parse_args()
+
+    apply_thread_settings()
+    reviews = CALIBRATION_REVIEWS
+    if args.reviews_file:
+        with open(args.reviews_file, "r", encoding="utf-8") as f:
+            reviews = [line.strip() for line in f if line.strip()]
+
+    result = report(args.model, args.backends.split(","), reviews)
+    print(json.dumps(result, indent=2))
+    for backend, entry in result["backends"].items():
+        if entry.get("max_scaled_diff", 0) > args.tolerance:
+            print(f"⚠️ {backend}: scaled scores drift {entry['max_scaled_diff']} from FP32 (tolerance {args.tolerance})")
@@ -45,43 +45,107 @@
 # if __name__ == "__main__":
 #     app.run(debug=True, port=5000)
 
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, request, Response, stream_with_context
 import redis
 import json
+import time
+import hashlib
+import threading
+
+import dashboard_snapshot
 
 app = Flask(__name__)
 
 r = redis.Redis(host="localhost", port=6379, decode_responses=True)
 
+SSE_HEARTBEAT_S = 15
+
 def fetch_dashboard_data():
-    # ---- Holistic Data ----
-    holistic_score = r.get("holistic_score")
-    holistic_label = r.get("holistic_label")
+    """Builds the dashboard body from the raw keys (before the consumer has written a snapshot).
+
+    Items of latest_reviews that are not valid JSON are skipped (see dashboard_snapshot.decodable).
+    """
+    with r.pipeline(transaction=True) as pipe:
+        pipe.get("holistic_score")
+        pipe.get("holistic_label")
+        pipe.lrange("latest_reviews", 0, -1)
+        holistic_score, holistic_label, raw_reviews = pipe.execute()
 
     if holistic_score:
-        holistic_score = round(float(holistic_score), 3)
+        holistic_score = float(holistic_score)
     else:
-        holistic_score = 0.0
-        holistic_label = "Waiting for data..."
+        holistic_score = None
 
-    # ---- Latest Reviews ----
-    raw_reviews = r.lrange("latest_reviews", 0, -1)
+    return dashboard_snapshot.snapshot_json(holistic_score, holistic_label, raw_reviews)
 
-    parsed_reviews = []
-    for item in raw_reviews:
+
+# ----------------------------
+# SNAPSHOT CACHE
+# ----------------------------
+class SnapshotCache:
+    """Latest dashboard body kept in memory and refreshed from the consumer's pub/sub pushes."""
+
+    def __init__(self, client):
+        self.client = client
+        self.body = None
+        self.etag = None
+        self.version = 0
+        self.changed = threading.Condition()
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def _set(self, body):
+        with self.changed:
+            if body == self.body:
+                return
+            self.body = body
+            self.etag = '"' + hashlib.blake2b(body.encode("utf-8"), digest_size=8).hexdigest() + '"'
+            self.version += 1
+            self.changed.notify_all()
+
+    def _load(self):
+        body = self.client.get(dashboard_snapshot.SNAPSHOT_KEY)
+        self._set(body if body is not None else fetch_dashboard_data())
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(dashboard_snapshot.SNAPSHOT_CHANNEL)
+                # Subscribed first, so an update published during the load is not lost.
+                self._load()
+                for message in pubsub.listen():
+                    self._set(message["data"])
+            except redis.RedisError as e:
+                print(f"Dashboard snapshot: Redis error, reconnecting: {e}")
+                time.sleep(1)
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
         try:
-            parsed_reviews.append(json.loads(item))
-        except json.JSONDecodeError:
-            continue
+            self._load()
+        except redis.RedisError as e:
+            print(f"Dashboard snapshot: initial load failed: {e}")
+        threading.Thread(target=self._listen, daemon=True).start()
 
-    parsed_reviews.reverse()
+    def current(self):
+        """(body, etag, version); loads on first use."""
+        self.start()
+        with self.changed:
+            if self.body is None:
+                self.changed.wait(timeout=5)
+            return self.body, self.etag, self.version
 
-    return {
-        "holisticScore": holistic_score,
-        "holisticLabel": holistic_label,
-        "totalReviews": len(parsed_reviews),
-        "reviews": parsed_reviews
-    }
+    def wait_for_change(self, version, timeout):
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.body, self.etag, self.version
+
+
+snapshots = SnapshotCache(r)
 
 
 # ----------------------------
@@ -89,14 +153,17 @@ def fetch_dashboard_data():
 # ----------------------------
 @app.route("/")
 def dashboard():
-    data = fetch_dashboard_data()
+    body, _, _ = snapshots.current()
+    # Redis unreachable and nothing loaded yet: render the empty page, flagged as unavailable.
+    status = 200 if body is not None else 503
+    data = json.loads(body if body is not None else dashboard_snapshot.EMPTY_SNAPSHOT)
 
     return render_template(
         "dashboard.html",
         score=data["holisticScore"],
         label=data["holisticLabel"],
         reviews=data["reviews"]
-    )
+    ), status
 
 
 # ----------------------------
@@ -104,9 +171,37 @@ def dashboard():
 # ----------------------------
 @app.route("/api/dashboard")
 def dashboard_api():
-    data = fetch_dashboard_data()
-    return jsonify(data)
+    body, etag, _ = snapshots.current()
+    if body is None:
+        return Response('{"error": "dashboard data unavailable"}', status=503, mimetype="application/json")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("If-None-Match", ""):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
+
+
+# ----------------------------
+# PUSH ROUTE (Server-Sent Events)
+# ----------------------------
+@app.route("/api/dashboard/stream")
+def dashboard_stream():
+    body, etag, version = snapshots.current()
+    last_seen = request.headers.get("Last-Event-ID")
+
+    def events(body, etag, version):
+        if body is not None and etag != last_seen:
+            yield f"id: {etag}\nevent: dashboard\ndata: {body}\n\n"
+        while True:
+            new_body, new_etag, new_version = snapshots.wait_for_change(version, SSE_HEARTBEAT_S)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            body, etag, version = new_body, new_etag, new_version
+            yield f"id: {etag}\nevent: dashboard\ndata: {body}\n\n"
+
+    return Response(stream_with_context(events(body, etag, version)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 if __name__ == "__main__":
-    app.run(debug=True, port=4782)
+    app.run(debug=True, port=4782, threaded=True)
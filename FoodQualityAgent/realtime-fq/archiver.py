@@ -0,0 +1,203 @@
+# archiver.py
+import os
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+
+import redis
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import review_scores
+from stream_config import STREAM
+
+# =========================
+# Stream archiver
+# =========================
+# Moves reviews that every consumer group has finished with out of Redis and
+# into zstd-compressed Parquet files, one directory per day:
+#   <ARCHIVE_DIR>/date=YYYY-MM-DD/reviews_<first id>.parquet
+# An entry is safe to archive once it is below every group's oldest pending
+# entry (or its last-delivered id when nothing is pending). Each chunk is
+# written to disk first, then removed from the stream (exact XTRIM MINID) and
+# from the hourly review_scores hashes in one transaction. Archiving always
+# resumes at the first entry left in the stream, so after a crash in between
+# the next run writes a file under the same first-id name, replacing the
+# earlier one (a superset of it) instead of adding overlapping rows. Redis
+# memory stays flat while historical analysis reads the files (see load_archive).
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+ARCHIVE_CHUNK = int(os.getenv("ARCHIVE_CHUNK", "10000"))
+ARCHIVE_INTERVAL_S = int(os.getenv("ARCHIVE_INTERVAL_S", "60"))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+SCHEMA = pa.schema([
+    ("entry_id", pa.string()),
+    ("created_at", pa.timestamp("ms", tz="UTC")),
+    ("review", pa.string()),
+    ("score", pa.float64()),
+    ("type", pa.string()),
+    ("fields", pa.string()),   # any other stream fields, as JSON
+])
+
+
+def parse_id(entry_id):
+    ms, seq = entry_id.split("-")
+    return int(ms), int(seq)
+
+
+def next_id(entry_id):
+    ms, seq = parse_id(entry_id)
+    return f"{ms}-{seq + 1}"
+
+
+# =========================
+# What is safe to archive
+# =========================
+def consumed_bound(client=r, stream=STREAM):
+    """Upper bound of fully consumed entries as an XRANGE max ('id' or '(id'), or None.
+
+    With no consumer group nothing counts as consumed.
+    """
+    try:
+        groups = client.xinfo_groups(stream)
+    except redis.exceptions.ResponseError:
+        return None   # no stream yet
+    if not groups:
+        return None
+    bounds = []
+    for group in groups:
+        if group["pending"]:
+            oldest_pending = client.xpending(stream, group["name"])["min"]
+            bounds.append((parse_id(oldest_pending), 0, "(" + oldest_pending))
+        else:
+            last = group["last-delivered-id"]
+            bounds.append((parse_id(last), 1, last))
+    return min(bounds)[2]
+
+
+# =========================
+# Archive
+# =========================
+def to_table(entries, scores):
+    columns = {name: [] for name in SCHEMA.names}
+    for (entry_id, data), score in zip(entries, scores):
+        data = dict(data)
+        columns["entry_id"].append(entry_id)
+        columns["created_at"].append(parse_id(entry_id)[0])
+        columns["review"].append(data.pop("review", None))
+        columns["score"].append(float(score) if score is not None else None)
+        columns["type"].append(data.pop("type", None))
+        columns["fields"].append(json.dumps(data) if data else None)
+    return pa.table(columns, schema=SCHEMA)
+
+
+def write_chunk(table, archive_dir=ARCHIVE_DIR, compression=ARCHIVE_COMPRESSION):
+    """Writes one file per day in the chunk; returns the paths."""
+    days = {}
+    for i, entry_id in enumerate(table.column("entry_id").to_pylist()):
+        day = datetime.fromtimestamp(parse_id(entry_id)[0] / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+        days.setdefault(day, []).append(i)
+    paths = []
+    for day, rows in days.items():
+        part = table.take(rows)
+        directory = os.path.join(archive_dir, f"date={day}")
+        os.makedirs(directory, exist_ok=True)
+        name = f"reviews_{part.column('entry_id')[0].as_py()}.parquet"
+        path = os.path.join(directory, name)
+        tmp_path = os.path.join(directory, f".{name}.tmp")   # dot files are skipped by dataset readers
+        try:
+            pq.write_table(part, tmp_path, compression=compression)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        paths.append(path)
+    return paths
+
+
+def archive_once(client=r, archive_dir=ARCHIVE_DIR, chunk=ARCHIVE_CHUNK, stream=STREAM):
+    """Archives every fully consumed entry. Returns (entries archived, files written)."""
+    bound = consumed_bound(client, stream)
+    if bound is None:
+        return 0, 0
+    archived, files = 0, 0
+    while True:
+        # Archived entries are trimmed, so the stream always starts at the next unarchived one.
+        entries = client.xrange(stream, min="-", max=bound, count=chunk)
+        if not entries:
+            break
+        ids = [entry_id for entry_id, _ in entries]
+        scores = review_scores.lookup(client, ids)
+        files += len(write_chunk(to_table(entries, scores), archive_dir))
+
+        with client.pipeline(transaction=True) as pipe:
+            pipe.xtrim(stream, minid=next_id(ids[-1]), approximate=False)
+            review_scores.forget(pipe, ids)
+            pipe.execute()
+        archived += len(entries)
+        if len(entries) < chunk:
+            break
+    return archived, files
+
+
+# =========================
+# Reading the archive
+# =========================
+def load_archive(archive_dir=ARCHIVE_DIR, columns=None, filters=None):
+    """The archived reviews as one pyarrow Table (date is a partition column).
+
+    e.g. load_archive(filters=[("date", ">=", "2025-01-01")]).to_pandas()
+    """
+    return pq.read_table(archive_dir, columns=columns, filters=filters, partitioning="hive")
+
+
+def archive_stats(client=r, archive_dir=ARCHIVE_DIR, stream=STREAM):
+    files, size, rows = 0, 0, 0
+    for root, _, names in os.walk(archive_dir):
+        for name in names:
+            if name.endswith(".parquet"):
+                path = os.path.join(root, name)
+                files += 1
+                size += os.path.getsize(path)
+                rows += pq.ParquetFile(path).metadata.num_rows
+    return {
+        "archived_rows": rows,
+        "archive_files": files,
+        "archive_mb": round(size / 1e6, 3),
+        "stream_length": client.xlen(stream),
+        "scores_in_redis": review_scores.stored_count(client),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Moves consumed reviews_stream entries into Parquet files")
+    parser.add_argument("--dir", default=ARCHIVE_DIR)
+    parser.add_argument("--interval", type=int, default=ARCHIVE_INTERVAL_S, help="seconds between runs")
+    parser.add_argument("--once", action="store_true", help="archive once and exit")
+    parser.add_argument("--stats", action="store_true", help="print archive and stream sizes and exit")
+    args = parser.parse_args()
+
+    if args.stats:
+        print(json.dumps(archive_stats(r, args.dir), indent=2))
+        raise SystemExit(0)
+
+    print(f"Archiving consumed entries of '{STREAM}' to {args.dir} every {args.interval}s...")
+    while True:
+        try:
+            archived, files = archive_once(r, args.dir)
+            if archived:
+                print(f"📦 Archived {archived} reviews into {files} file(s).")
+        except redis.RedisError as e:
+            print(f"Archiver: Redis error: {e}")
+        except Exception as e:
+            # Disk full, unwritable directory, Parquet errors...: nothing was trimmed, retry next run.
+            print(f"Archiver: run failed: {e}")
+        if args.once:
+            break
+        time.sleep(args.interval)
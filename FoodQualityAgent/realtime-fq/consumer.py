@@ -1,16 +1,53 @@
 # consumer.py
+import os
+import sys
+import socket
+import argparse
 import redis
 import requests
-import numpy as np
-import time
 import json
 
-REDIS_HOST = "localhost"
-REDIS_PORT = 6379
+import holistic
+import dashboard_snapshot
+import review_scores
+from stream_config import STREAM, DEAD_LETTER_STREAM
+from score_cache import CachedScorer, ScoreCache, TokenizerKeys, exact_keys, SCORE_CACHE_NAMESPACE
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 API_URL = "http://127.0.0.1:9850/predict"
+API_BATCH_URL = "http://127.0.0.1:9850/predict_batch"
+API_INFO_URL = "http://127.0.0.1:9850/model_info"
+# Seconds to wait for a scoring call. A hung API then fails the call like any
+# other API error: the reviews stay pending and are reclaimed later.
+API_TIMEOUT_S = float(os.getenv("API_TIMEOUT_S", "30"))
+
+# "http" calls the model API; "embedded" loads the model into this process
+# and skips the HTTP hop (one model copy per consumer process).
+SCORING_MODE = os.getenv("SCORING_MODE", "http")
+FQ_AGENT_DIR = os.path.abspath(os.getenv(
+    "FQ_AGENT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "food-quality-agent")
+))
+EMBEDDED_MODEL_PATH = os.getenv("FQ_MODEL_PATH", os.path.join(FQ_AGENT_DIR, "food_quality_model"))
+EMBEDDED_BATCH_SIZE = int(os.getenv("EMBEDDED_BATCH_SIZE", "64"))
+SCORE_CACHE = os.getenv("SCORE_CACHE", "1") == "1"   # see score_cache.py
+
+# Reviews are read through a Redis consumer group: the group remembers which
+# entries were delivered, every consumer acknowledges (XACK) a review only
+# after its score is stored, and entries left pending by a consumer that died
+# are claimed by another one (XAUTOCLAIM). Progress therefore survives
+# restarts, and several consumers can share the stream.
+GROUP = os.getenv("CONSUMER_GROUP", "fq-scorers")
+CONSUMER_NAME = os.getenv("CONSUMER_NAME", f"{socket.gethostname()}-{os.getpid()}")
+READ_COUNT = int(os.getenv("CONSUMER_READ_COUNT", "256"))
+BLOCK_MS = int(os.getenv("CONSUMER_BLOCK_MS", "5000"))
+CLAIM_IDLE_MS = int(os.getenv("CONSUMER_CLAIM_IDLE_MS", "60000"))   # pending this long = owner presumed dead
+MAX_DELIVERIES = int(os.getenv("CONSUMER_MAX_DELIVERIES", "5"))
+LATEST_REVIEWS_SIZE = holistic.LATEST_REVIEWS_SIZE
+
+session = requests.Session()
 
 r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-last_id = "0-0"
 
 def get_quality_label(score):
     if score < 0.125:
@@ -30,50 +67,292 @@ def get_quality_label(score):
     else:
         return "Excellent"
 
-def process_new_reviews():
-    global last_id
+# --- Consumer Group Plumbing ---
+def ensure_group(client=r, group=GROUP):
+    """Creates the consumer group (and stream) if needed, starting from the oldest entry."""
+    try:
+        client.xgroup_create(STREAM, group, id="0", mkstream=True)
+    except redis.exceptions.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
 
-    entries = r.xread({"reviews_stream": last_id}, block=5000, count=10)
-    if not entries:
-        return None
+def read_own_pending(client=r, consumer=CONSUMER_NAME, group=GROUP, count=READ_COUNT, after="0"):
+    """Entries delivered to this consumer name (e.g. before a restart) but never acknowledged."""
+    while True:
+        entries = client.xreadgroup(group, consumer, {STREAM: after}, count=count)
+        entries = entries[0][1] if entries else []
+        # Pending entries trimmed from the stream come back without data; ack them and read on.
+        gone = [entry_id for entry_id, data in entries if data is None]
+        if not gone:
+            return entries
+        client.xack(STREAM, group, *gone)
+        live = [(entry_id, data) for entry_id, data in entries if data is not None]
+        if live:
+            return live
+
+def read_new(client=r, consumer=CONSUMER_NAME, group=GROUP, count=READ_COUNT, block=BLOCK_MS):
+    entries = client.xreadgroup(group, consumer, {STREAM: ">"}, count=count, block=block)
+    return entries[0][1] if entries else []
+
+def dead_letter_exhausted(client=r, group=GROUP, max_deliveries=MAX_DELIVERIES, min_idle=CLAIM_IDLE_MS):
+    """Moves entries that failed max_deliveries times to the dead-letter stream and acks them."""
+    moved = 0
+    for p in client.xpending_range(STREAM, group, min="-", max="+", count=100, idle=min_idle):
+        if p["times_delivered"] < max_deliveries:
+            continue
+        entry_id = p["message_id"]
+        entries = client.xrange(STREAM, min=entry_id, max=entry_id)
+        if entries:
+            client.xadd(DEAD_LETTER_STREAM, dict(entries[0][1], source_id=entry_id, group=group))
+        client.xack(STREAM, group, entry_id)
+        moved += 1
+    return moved
+
+def claim_stale(client=r, consumer=CONSUMER_NAME, group=GROUP, count=READ_COUNT, min_idle=CLAIM_IDLE_MS):
+    """Takes over entries another consumer left pending for longer than min_idle ms."""
+    dead_letter_exhausted(client, group, min_idle=min_idle)
+    result = client.xautoclaim(STREAM, group, consumer, min_idle_time=min_idle, start_id="0-0", count=count)
+    claimed = result[1]
+    deleted = result[2] if len(result) > 2 else []
+    # Entries trimmed from the stream while pending can never be scored; drop them.
+    gone = list(deleted) + [entry_id for entry_id, data in claimed if data is None]
+    if gone:
+        client.xack(STREAM, group, *gone)
+    return [(entry_id, data) for entry_id, data in claimed if data is not None]
 
-    stream_name, new_entries = entries[0]
-    latest_reviews_with_scores = []
+# --- Scoring ---
+def score_review(review_text):
+    """Returns the model score, or None if the API call failed (the entry stays pending)."""
+    try:
+        response = session.post(API_URL, json={"review": review_text}, timeout=API_TIMEOUT_S)
+        if response.status_code == 200:
+            return response.json()["score"]
+        print(f"API error for review: {review_text}")
+    except Exception as e:
+        print(f"Error calling API: {e}")
+    return None
 
-    for entry_id, data in new_entries:
-        last_id = entry_id
-        review_text = data["review"]
+def score_reviews(reviews):
+    """Scores a whole block with one /predict_batch call; returns a score (or None) per review.
+
+    If the batch call fails, reviews are retried one by one so a single bad
+    review cannot hold back the rest of its block.
+    """
+    try:
+        response = session.post(API_BATCH_URL, json={"reviews": reviews}, timeout=API_TIMEOUT_S)
+        if response.status_code == 200:
+            return response.json()["scores"]
+        print(f"Batch API error ({response.status_code}) for {len(reviews)} reviews; scoring one by one")
+    except Exception as e:
+        print(f"Error calling batch API: {e}")
+        return [None] * len(reviews)
+    return [score_review(review) for review in reviews]
+
+def import_model_backends():
+    """food-quality-agent/model_backends.py: backends, scaling constants and model identity."""
+    if FQ_AGENT_DIR not in sys.path:
+        sys.path.insert(0, FQ_AGENT_DIR)
+    import model_backends
+    return model_backends
+
+class EmbeddedScorer:
+    """Scores review batches with the DistilBERT model loaded in-process.
+
+    The backend (FQ_BACKEND), sigmoid and RAW_MIN/RAW_MAX rescaling come from
+    food-quality-agent/model_backends.py, the same code the HTTP API runs,
+    so scores match it.
+    """
+
+    def __init__(self, model_path=EMBEDDED_MODEL_PATH, batch_size=EMBEDDED_BATCH_SIZE):
+        import torch
+        from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+
+        self.model_backends = import_model_backends()
+        self.model_backends.apply_thread_settings()
+        self.batch_size = max(1, batch_size)
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.tokenizer = DistilBertTokenizerFast.from_pretrained(model_path)
+        model = DistilBertForSequenceClassification.from_pretrained(model_path)
+        model.to(device)
+        model.eval()
+        self.backend = self.model_backends.build(model, model_path, self.model_backends.FQ_BACKEND, device)
+        self.backend_name = self.backend.name
+
+    def __call__(self, reviews):
+        scores = []
+        for start in range(0, len(reviews), self.batch_size):
+            chunk = reviews[start:start + self.batch_size]
+            try:
+                inputs = self.tokenizer(
+                    chunk, return_tensors="pt", truncation=True, padding=True, max_length=128
+                )
+                raw_scores = self.backend(inputs)
+                scores.extend(round(self.model_backends.scale_to_0_1(raw), 4) for raw in raw_scores)
+            except Exception as e:
+                print(f"Error scoring {len(chunk)} reviews in-process: {e}")
+                scores.extend([None] * len(chunk))
+        return scores
+
+def model_id(mode, scorer):
+    """Identity of the model behind the scores: asked from the API, else computed from the local files."""
+    if mode == "http":
+        try:
+            response = session.get(API_INFO_URL, timeout=5)
+            response.raise_for_status()
+            return response.json()["model_id"]
+        except (requests.RequestException, KeyError, ValueError) as e:
+            print(f"Model API identity unavailable ({e}); using the local model files.")
+        backend = os.getenv("FQ_BACKEND", "eager")
+    else:
+        backend = scorer.backend_name
+    return import_model_backends().model_identity(EMBEDDED_MODEL_PATH, backend)
 
-        # Call ML API
+def cache_keys(scorer):
+    """Score cache keys from the model's tokenizer: the same input_ids always get the same score."""
+    tokenizer = getattr(scorer, "tokenizer", None)
+    if tokenizer is None:
         try:
-            response = requests.post(API_URL, json={"review": review_text})
-            if response.status_code == 200:
-                score = response.json()["score"]
-            else:
-                print(f"API error for review: {review_text}")
+            from transformers import DistilBertTokenizerFast
+            tokenizer = DistilBertTokenizerFast.from_pretrained(EMBEDDED_MODEL_PATH)
+        except (ImportError, OSError) as e:
+            print(f"Model tokenizer unavailable ({e}); score cache keyed on the exact review text.")
+            return exact_keys
+    return TokenizerKeys(tokenizer)
+
+def make_scorer(mode=SCORING_MODE, cache=SCORE_CACHE, client=r):
+    """The batch scorer for a mode, wrapped in a Redis-shared score cache unless cache=False.
+
+    The cache namespace includes the model identity, so a retrained model or
+    another backend never reuses scores from the previous one.
+    """
+    if mode == "http":
+        scorer = score_reviews
+    elif mode == "embedded":
+        scorer = EmbeddedScorer()
+    else:
+        raise ValueError(f"Unknown SCORING_MODE '{mode}', expected 'http' or 'embedded'")
+    if not cache:
+        return scorer
+    namespace = f"{SCORE_CACHE_NAMESPACE}:{model_id(mode, scorer)}"
+    return CachedScorer(scorer, ScoreCache(redis_client=client, namespace=namespace, keys=cache_keys(scorer)))
+
+# --- Storing Results ---
+class LatestReviewsCopy:
+    """This process's copy of latest_reviews, for building the dashboard snapshot without LRANGE 0 -1.
+
+    The list only grows at the tail and is trimmed at the head, and every item
+    carries its unique stream entry id, so an unchanged length and last item
+    mean the copy is current. When another consumer has committed in between,
+    the list is read in full once and the copy follows it again.
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def sync(self, pipe, current_len):
+        """Called under WATCH."""
+        tail = pipe.lindex("latest_reviews", -1) if current_len else None
+        if len(self.items) != current_len or (self.items[-1] if self.items else None) != tail:
+            self.items = pipe.lrange("latest_reviews", 0, -1)
+        return self.items
+
+latest_copy = LatestReviewsCopy()
+
+def commit_scores(client, group, scored, ack_only=(), latest=latest_copy):
+    """Appends scored reviews, trims, acks and updates the holistic index in one MULTI/EXEC.
+
+    The last-100 index is maintained incrementally (see holistic.py): the
+    scores about to be evicted are read under WATCH, so a concurrent commit
+    from another consumer makes EXEC fail and the step is retried. The
+    pre-serialised dashboard snapshot (see dashboard_snapshot.py) is built
+    from `latest`, moved forward by the same pushed and evicted items.
+    """
+    ids = [entry_id for entry_id, _, _ in scored] + list(ack_only)
+    payloads = [json.dumps({"id": entry_id, "review": review, "score": score}) for entry_id, review, score in scored]
+    incoming = [score for _, _, score in scored]
+    with client.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                pipe.watch("latest_reviews", holistic.SUM_KEY, holistic.COUNT_KEY)
+                current_len = pipe.llen("latest_reviews")
+                total, count = pipe.mget(holistic.SUM_KEY, holistic.COUNT_KEY)
+                if count is None or int(count) != current_len:
+                    # First run (or the list was changed behind our back): rebuild the totals once.
+                    existing = pipe.lrange("latest_reviews", 0, -1)
+                    total = sum(holistic.to_units(json.loads(e)["score"]) for e in existing)
+                    count = len(existing)
+                k = holistic.evicted_count(current_len, len(incoming))
+                evicted = pipe.lrange("latest_reviews", 0, k - 1) if k else []
+                delta_sum, delta_count = holistic.count_window_delta(evicted, incoming, current_len)
+                total, count = int(total) + delta_sum, int(count) + delta_count
+                if scored:
+                    kept = (latest.sync(pipe, current_len)[len(evicted):] + payloads)[-LATEST_REVIEWS_SIZE:]
+
+                pipe.multi()
+                if payloads:
+                    pipe.rpush("latest_reviews", *payloads)
+                    pipe.ltrim("latest_reviews", -LATEST_REVIEWS_SIZE, -1)  # keep latest 100 reviews
+                if scored:
+                    # Score per stream entry id for the archiver; expires on its own (see review_scores.py).
+                    review_scores.record(pipe, [(entry_id, score) for entry_id, _, score in scored])
+                if ids:
+                    pipe.xack(STREAM, group, *ids)
+                holistic_score = total / holistic.SCALE / count if count else None
+                holistic_label = get_quality_label(holistic_score) if count else None
+                if scored and holistic_score is not None:
+                    pipe.set(holistic.SUM_KEY, total)
+                    pipe.set(holistic.COUNT_KEY, count)
+                    pipe.set("holistic_score", holistic_score)
+                    pipe.set("holistic_label", holistic_label)
+                    holistic.record_time_windows(pipe, [(entry_id, score) for entry_id, _, score in scored])
+                    snapshot = dashboard_snapshot.snapshot_json(holistic_score, holistic_label, kept)
+                    pipe.set(dashboard_snapshot.SNAPSHOT_KEY, snapshot)
+                    pipe.publish(dashboard_snapshot.SNAPSHOT_CHANNEL, snapshot)
+                pipe.execute()
+                if scored:
+                    latest.items = kept
+                return holistic_score, holistic_label
+            except redis.WatchError:
                 continue
-        except Exception as e:
-            print(f"Error calling API: {e}")
-            continue
 
-        # Store as JSON in Redis list for latest 100 reviews
-        review_entry = json.dumps({"review": review_text, "score": score})
-        r.rpush("latest_reviews", review_entry)
-        r.ltrim("latest_reviews", -100, -1)  # keep latest 100 reviews
+def process_entries(entries, client=r, group=GROUP, scorer=score_reviews):
+    """Scores a block of stream entries with one batch call and commits them in one transaction."""
+    malformed = [entry_id for entry_id, data in entries if data.get("review") is None]
+    valid = [(entry_id, data["review"]) for entry_id, data in entries if data.get("review") is not None]
+
+    scores = scorer([review for _, review in valid]) if valid else []
+    # Entries whose score is missing stay pending and are reclaimed later.
+    scored = [(entry_id, review, score) for (entry_id, review), score in zip(valid, scores) if score is not None]
+
+    holistic = commit_scores(client, group, scored, malformed) if scored or malformed else (None, None)
+    return [(review, score) for _, review, score in scored], holistic
+
+def resume_pending(client=r, consumer=CONSUMER_NAME, group=GROUP, scorer=score_reviews):
+    """Retries, once, every entry this consumer name left unacknowledged. Returns how many were scored."""
+    scored = 0
+    after = "0"
+    while True:
+        entries = read_own_pending(client, consumer, group, after=after)
+        if not entries:
+            break
+        after = entries[-1][0]
+        scored += len(process_entries(entries, client, group, scorer)[0])
+    return scored
 
-        latest_reviews_with_scores.append((review_text, score))
+def process_new_reviews(client=r, consumer=CONSUMER_NAME, group=GROUP, block=BLOCK_MS, scorer=score_reviews):
+    """One consumer step: stale entries (from any consumer) first, then new ones.
 
-    # Compute holistic score & label
-    all_entries = r.lrange("latest_reviews", 0, -1)
-    all_scores = [json.loads(e)["score"] for e in all_entries]
-    holistic_score = np.mean(all_scores) if all_scores else None
-    holistic_label = get_quality_label(holistic_score) if all_scores else None
+    Entries whose scoring fails are simply left pending; once idle for
+    CLAIM_IDLE_MS they are reclaimed, and after MAX_DELIVERIES attempts moved
+    to the dead-letter stream.
+    """
+    entries = claim_stale(client, consumer, group)
+    if not entries:
+        entries = read_new(client, consumer, group, block=block)
+    if not entries:
+        return None
 
-    # Store for dashboard
-    if holistic_score is not None:
-        # CONVERT TO PYTHON FLOAT HERE
-        r.set("holistic_score", float(holistic_score)) 
-        r.set("holistic_label", holistic_label)
+    latest_reviews_with_scores, (holistic_score, holistic_label) = process_entries(entries, client, group, scorer)
 
     return {
         "latest_reviews": latest_reviews_with_scores,
@@ -82,12 +361,29 @@ def process_new_reviews():
     }
 
 if __name__ == "__main__":
-    print("Consumer started. Waiting for new reviews...")
+    parser = argparse.ArgumentParser(description="Scores reviews from reviews_stream as part of a consumer group")
+    parser.add_argument("--consumer", default=CONSUMER_NAME,
+                        help="stable name per consumer process (reuse it to resume its pending entries)")
+    parser.add_argument("--group", default=GROUP)
+    parser.add_argument("--mode", choices=("http", "embedded"), default=SCORING_MODE,
+                        help="score via the model API or with the model loaded in this process")
+    args = parser.parse_args()
+
+    scorer = make_scorer(args.mode)
+    if isinstance(scorer, CachedScorer):
+        print(f"Score cache keys: {scorer.cache.prefix}*")
+    ensure_group(r, args.group)
+    print(f"Consumer '{args.consumer}' started in group '{args.group}' ({args.mode} scoring). Waiting for new reviews...")
+    resumed = resume_pending(r, args.consumer, args.group, scorer)
+    if resumed:
+        print(f"Resumed {resumed} reviews left pending by a previous run.")
+    # No sleep between steps: XREADGROUP already blocks for up to BLOCK_MS when idle.
     while True:
-        result = process_new_reviews()
+        result = process_new_reviews(r, args.consumer, args.group, scorer=scorer)
         if result and result["latest_reviews"]:
-            print("Processed new reviews:")
-            for review, score in result["latest_reviews"]:
+            print(f"Processed {len(result['latest_reviews'])} new reviews:")
+            for review, score in result["latest_reviews"][-5:]:
                 print(f"- {review[:50]}... | Score: {round(score,3)}")
             print(f"Holistic Score: {round(result['holistic_score'],3)} | Label: {result['holistic_label']}")
-        time.sleep(1)
+            if isinstance(scorer, CachedScorer):
+                print(f"Score cache: {scorer.cache.stats()}")
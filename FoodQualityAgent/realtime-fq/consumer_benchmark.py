@@ -0,0 +1,183 @@
+# consumer_benchmark.py
+import json
+import time
+import socket
+import argparse
+import threading
+import redis
+import numpy as np
+
+import consumer
+
+# Measures how fast the consumer drains a backlog of reviews_stream, comparing
+# the original loop (XREAD 10 at a time, one API call and three Redis writes
+# per review, LRANGE + two SETs per block) with the pipelined batch loop in
+# consumer.py. By default it runs against fakeredis' TCP server, so every
+# command pays a real socket round trip; point --redis-url at a real Redis to
+# measure that instead; it must be an empty database (e.g. redis://host:6379/15),
+# since the benchmark writes the same keys the live consumer does. The model API is replaced by a stub whose latency is
+# a fixed per-call overhead plus a per-review cost, unless --api is given.
+# --compare-scoring instead drains the same backlog twice with the real
+# model: over HTTP (the API must be running) and embedded in-process.
+
+SAMPLE_REVIEWS = [
+    "The pizza arrived hot and the crust was perfect.",
+    "Cold fries and a soggy burger, very disappointing.",
+    "Decent food but the delivery took forever.",
+    "Absolutely delicious, will order again!",
+    "The curry was bland and the rice was undercooked.",
+]
+
+
+def start_fake_server():
+    from fakeredis import TcpFakeServer
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    server.daemon_threads = True   # connection handlers must not keep the benchmark alive
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}"
+
+
+def stub_scorers(call_overhead_ms, per_review_ms):
+    def single(review):
+        time.sleep((call_overhead_ms + per_review_ms) / 1000.0)
+        return 0.5 + (hash(review) % 100) / 1000.0
+
+    def batch(reviews):
+        time.sleep((call_overhead_ms + per_review_ms * len(reviews)) / 1000.0)
+        return [0.5 + (hash(review) % 100) / 1000.0 for review in reviews]
+
+    return single, batch
+
+
+RESULT_KEYS = ("latest_reviews", "holistic_score", "holistic_label", "holistic_sum", "holistic_count",
+               "dashboard_snapshot")
+BUCKET_PATTERNS = ("holistic:*", "review_scores:*")
+
+
+def require_empty_database(client):
+    """Refuses to run against a database that already holds data (e.g. the live reviews_stream)."""
+    keys = client.dbsize()
+    if keys:
+        raise SystemExit(
+            f"Refusing to benchmark: the target Redis database already holds {keys} keys and the "
+            f"benchmark overwrites {consumer.STREAM}, latest_reviews and the holistic keys. "
+            "Point --redis-url at an empty database, e.g. redis://localhost:6379/15."
+        )
+
+
+def cleanup(client):
+    client.delete(consumer.STREAM, *RESULT_KEYS)
+    buckets = [key for pattern in BUCKET_PATTERNS for key in client.scan_iter(pattern, count=1000)]
+    if buckets:
+        client.delete(*buckets)
+
+
+def fill_stream(client, n):
+    cleanup(client)
+    with client.pipeline(transaction=False) as pipe:
+        for i in range(n):
+            pipe.xadd(consumer.STREAM, {"review": f"{SAMPLE_REVIEWS[i % len(SAMPLE_REVIEWS)]} #{i}"})
+        pipe.execute()
+
+
+def run_legacy(client, n, score_one):
+    """The pre-consumer-group loop, minus its 1s sleep."""
+    last_id = "0-0"
+    done = 0
+    while done < n:
+        entries = client.xread({consumer.STREAM: last_id}, count=10)
+        if not entries:
+            break
+        for entry_id, data in entries[0][1]:
+            last_id = entry_id
+            score = score_one(data["review"])
+            client.rpush("latest_reviews", json.dumps({"review": data["review"], "score": score}))
+            client.ltrim("latest_reviews", -100, -1)
+            done += 1
+        all_scores = [json.loads(e)["score"] for e in client.lrange("latest_reviews", 0, -1)]
+        client.set("holistic_score", float(np.mean(all_scores)))
+        client.set("holistic_label", consumer.get_quality_label(np.mean(all_scores)))
+    return done
+
+
+def run_pipelined(client, n, score_many, read_count):
+    consumer.ensure_group(client, "bench")
+    done = 0
+    while done < n:
+        entries = consumer.read_new(client, "bench-1", "bench", count=read_count, block=None)
+        if not entries:
+            break
+        scored, _ = consumer.process_entries(entries, client, "bench", score_many)
+        done += len(scored)
+    client.xgroup_destroy(consumer.STREAM, "bench")
+    return done
+
+
+def measure(label, fn, client, n):
+    start = time.perf_counter()
+    done = fn()
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": label,
+        "reviews": done,
+        "seconds": round(elapsed, 3),
+        "reviews_per_s": round(done / elapsed, 1) if elapsed else None,
+        "holistic_score": round(float(client.get("holistic_score")), 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of the legacy vs pipelined review consumer")
+    parser.add_argument("--reviews", type=int, default=2000)
+    parser.add_argument("--read-count", type=int, default=consumer.READ_COUNT)
+    parser.add_argument("--redis-url", help="real Redis to use, must be an empty database "
+                                             "(default: in-process fakeredis TCP server)")
+    parser.add_argument("--api", action="store_true", help="call the running model API instead of the stub")
+    parser.add_argument("--call-overhead-ms", type=float, default=2.0, help="stub: fixed cost per API call")
+    parser.add_argument("--per-review-ms", type=float, default=0.3, help="stub: model cost per review")
+    parser.add_argument("--compare-scoring", action="store_true",
+                        help="compare HTTP and embedded model scoring instead of legacy vs pipelined")
+    args = parser.parse_args()
+
+    client = redis.Redis.from_url(args.redis_url or start_fake_server(), decode_responses=True)
+    require_empty_database(client)
+    if args.compare_scoring:
+        embedded = consumer.EmbeddedScorer()
+        sample = [f"{SAMPLE_REVIEWS[i % len(SAMPLE_REVIEWS)]} #{i}" for i in range(64)]
+        http_scores, embedded_scores = consumer.score_reviews(sample), embedded(sample)
+        if None in http_scores:
+            raise SystemExit(f"Model API not reachable at {consumer.API_BATCH_URL}")
+
+        results = []
+        for mode, scorer in (("http", consumer.score_reviews), ("embedded", embedded)):
+            fill_stream(client, args.reviews)
+            results.append(measure(mode, lambda: run_pipelined(client, args.reviews, scorer, args.read_count),
+                                   client, args.reviews))
+        cleanup(client)
+
+        print(json.dumps({
+            "results": results,
+            "speedup": round(results[1]["reviews_per_s"] / results[0]["reviews_per_s"], 2),
+            "max_score_diff": max(abs(a - b) for a, b in zip(http_scores, embedded_scores)),
+        }, indent=2))
+        raise SystemExit(0)
+
+    if args.api:
+        score_one, score_many = consumer.score_review, consumer.score_reviews
+    else:
+        score_one, score_many = stub_scorers(args.call_overhead_ms, args.per_review_ms)
+
+    results = []
+    fill_stream(client, args.reviews)
+    results.append(measure("legacy", lambda: run_legacy(client, args.reviews, score_one), client, args.reviews))
+    fill_stream(client, args.reviews)
+    results.append(measure("pipelined", lambda: run_pipelined(client, args.reviews, score_many, args.read_count),
+                           client, args.reviews))
+    cleanup(client)
+
+    speedup = results[1]["reviews_per_s"] / results[0]["reviews_per_s"]
+    print(json.dumps({"results": results, "speedup": round(speedup, 1)}, indent=2))
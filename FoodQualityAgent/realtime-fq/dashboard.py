@@ -1,14 +1,21 @@
 # dashboard.py
+import os
+import json
 import streamlit as st
+import time
 import redis
-import numpy as np
 from streamlit_autorefresh import st_autorefresh
 
+import holistic
+
 # =========================
 # Redis setup
 # =========================
 r = redis.Redis(host='localhost', port=6379, decode_responses=True)
 
+# Shared by every rerun and browser session; keep it below the refresh interval.
+DASHBOARD_CACHE_TTL_S = float(os.getenv("DASHBOARD_CACHE_TTL_S", "2"))
+
 # =========================
 # Labeling function (8 levels)
 # =========================
@@ -43,35 +50,62 @@ st.markdown("Latest 10 reviews & Holistic food quality index for the last 100 re
 st_autorefresh(interval=3000, key="fqi_refresh")
 
 # =========================
-# Fetch latest 10 reviews
+# One snapshot per refresh
 # =========================
-def get_latest_10_reviews():
-    scores = r.lrange("review_scores", -10, -1)  # last 10 scores
-    reviews_entries = r.xrevrange("reviews_stream", max="+", min="-", count=10)
-    reviews_entries.reverse()  # oldest first
+# Everything the page shows is read in a single MULTI: the consumer updates
+# latest_reviews (each item carries its review, score and stream entry id)
+# and the holistic keys in one transaction, so the values always agree.
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL_S, show_spinner=False)
+def read_snapshot():
+    now = time.time()
+    window_keys = {window: holistic.time_window_keys(window, now) for window in holistic.TIME_WINDOWS}
+    with r.pipeline(transaction=True) as pipe:
+        pipe.lrange("latest_reviews", -10, -1)
+        pipe.mget(holistic.SUM_KEY, holistic.COUNT_KEY)
+        for keys in window_keys.values():
+            pipe.mget(keys)
+        latest, totals, *window_values = pipe.execute()
+    return {
+        "latest": latest,
+        "totals": totals,
+        "windows": dict(zip(window_keys, window_values)),
+    }
 
+# =========================
+# Fetch latest 10 reviews
+# =========================
+def get_latest_10_reviews(snapshot):
     reviews_with_scores = []
-    for (entry_id, data), score in zip(reviews_entries, scores):
-        reviews_with_scores.append((data["review"], float(score)))
+    for item in snapshot["latest"]:   # oldest first
+        entry = json.loads(item)
+        reviews_with_scores.append((entry["review"], float(entry["score"])))
     return reviews_with_scores
 
 # =========================
 # Holistic score for last 100
 # =========================
-def get_holistic_score():
-    scores = r.lrange("review_scores", -100, -1)
-    scores = [float(s) for s in scores]
-    if scores:
-        score = np.mean(scores)
-        label = get_quality_label(score)
-        return round(score, 3), label, len(scores)
+# Running totals kept by the consumer (see holistic.py): two keys, no LRANGE.
+def get_holistic_score(snapshot):
+    score, n = holistic.count_window_mean(*snapshot["totals"])
+    if n:
+        return round(score, 3), get_quality_label(score), n
     return None, None, 0
 
+def get_windowed_scores(snapshot):
+    """{window: (score, label, count)} for the 5 min and 1 h windows."""
+    windows = {}
+    for window, values in snapshot["windows"].items():
+        score, n = holistic.time_window_mean(values)
+        windows[window] = (round(score, 3), get_quality_label(score), n) if n else (None, None, 0)
+    return windows
+
 # =========================
 # Display
 # =========================
+snapshot = read_snapshot()
+
 # Latest 10 reviews
-latest_reviews = get_latest_10_reviews()
+latest_reviews = get_latest_10_reviews(snapshot)
 if latest_reviews:
     st.subheader("Latest 10 Reviews")
     st.table([
@@ -82,7 +116,7 @@ else:
     st.markdown("No reviews yet.")
 
 # Holistic index
-holistic_score, holistic_label, n_reviews = get_holistic_score()
+holistic_score, holistic_label, n_reviews = get_holistic_score(snapshot)
 if holistic_score is not None:
     st.subheader(f"Holistic Food Quality Index (last {n_reviews} reviews)")
     st.markdown(
@@ -91,3 +125,11 @@ if holistic_score is not None:
     )
 else:
     st.markdown("No holistic score yet.")
+
+# Time-windowed indices
+windows = get_windowed_scores(snapshot)
+columns = st.columns(len(windows))
+for column, (window, (score, label, n)) in zip(columns, windows.items()):
+    column.metric(f"Last {window} ({n} reviews)", score if score is not None else "—")
+    if label:
+        column.caption(f"Overall Quality: {label}")
@@ -0,0 +1,41 @@
+# dashboard_snapshot.py
+import json
+
+# =========================
+# Pre-serialised dashboard snapshot
+# =========================
+# The consumer rebuilds the /api/dashboard body in the same MULTI that
+# updates latest_reviews, stores it under SNAPSHOT_KEY and publishes it on
+# SNAPSHOT_CHANNEL. app.py keeps the latest body in memory, so a poll costs
+# no Redis round trip and no JSON work. latest_reviews items are already
+# JSON objects, so every item that decodes is spliced into the body as-is;
+# one that does not is skipped, as the dashboard always did.
+
+SNAPSHOT_KEY = "dashboard_snapshot"
+SNAPSHOT_CHANNEL = "dashboard_updates"
+
+
+def decodable(entries):
+    """The raw latest_reviews items that are valid JSON, in order."""
+    valid = []
+    for item in entries:
+        try:
+            json.loads(item)
+        except (TypeError, json.JSONDecodeError):
+            continue
+        valid.append(item)
+    return valid
+
+
+def snapshot_json(holistic_score, holistic_label, latest_entries):
+    """/api/dashboard body; latest_entries are raw latest_reviews items, oldest first."""
+    if holistic_score is None:
+        score, label = 0.0, "Waiting for data..."
+    else:
+        score, label = round(float(holistic_score), 3), holistic_label
+    reviews = decodable(latest_entries)
+    head = json.dumps({"holisticScore": score, "holisticLabel": label, "totalReviews": len(reviews)})
+    return head[:-1] + ', "reviews": [' + ", ".join(reversed(reviews)) + "]}"
+
+
+EMPTY_SNAPSHOT = snapshot_json(None, None, [])
@@ -0,0 +1,116 @@
+# holistic.py
+import json
+
+# =========================
+# Rolling holistic index
+# =========================
+# The consumer keeps running totals instead of re-reading the last 100
+# reviews on every update:
+#   * count window: holistic_sum / holistic_count over latest_reviews. Each
+#     commit adds the incoming scores and subtracts the ones LTRIM evicts, so
+#     the cost depends on the batch size, not on the window size.
+#   * time windows: per-bucket sum/count keys stamped with the stream entry
+#     time (10 s buckets for 5 min, 1 min buckets for 1 h) that expire on
+#     their own; a window is read as one MGET over its buckets.
+# Sums are stored as integer millionths so INCRBY keeps them exact forever.
+
+LATEST_REVIEWS_SIZE = 100
+SCALE = 1_000_000
+
+SUM_KEY = "holistic_sum"
+COUNT_KEY = "holistic_count"
+
+# name -> (window seconds, bucket seconds)
+TIME_WINDOWS = {
+    "5m": (300, 10),
+    "1h": (3600, 60),
+}
+
+
+def to_units(score):
+    return int(round(float(score) * SCALE))
+
+
+def entry_seconds(entry_id):
+    """Stream entry ids start with the XADD time in milliseconds."""
+    return int(entry_id.split("-", 1)[0]) // 1000
+
+
+def _bucket_keys(window, bucket_start):
+    prefix = f"holistic:{window}:{bucket_start}"
+    return prefix + ":sum", prefix + ":count"
+
+
+# =========================
+# Writes (inside the consumer's MULTI)
+# =========================
+def evicted_count(current_len, n_incoming, size=LATEST_REVIEWS_SIZE):
+    """How many existing list entries an RPUSH of n_incoming + LTRIM to size drops."""
+    return min(current_len, max(0, current_len + n_incoming - size))
+
+
+def count_window_delta(evicted, incoming_scores, current_len, size=LATEST_REVIEWS_SIZE):
+    """(sum delta in units, count delta) for pushing incoming_scores onto a list of current_len.
+
+    `evicted` holds the JSON entries the push will trim, i.e. the first
+    evicted_count(...) entries of the list.
+    """
+    added = incoming_scores[-size:]   # anything older is pushed and trimmed in the same step
+    removed = [json.loads(e)["score"] for e in evicted]
+    delta_sum = sum(to_units(s) for s in added) - sum(to_units(s) for s in removed)
+    new_len = min(size, current_len + len(incoming_scores))
+    return delta_sum, new_len - current_len
+
+
+def record_time_windows(pipe, timed_scores):
+    """Adds (entry_id, score) pairs to their 5 min / 1 h buckets."""
+    buckets = {}
+    for entry_id, score in timed_scores:
+        t = entry_seconds(entry_id)
+        for window, (span, step) in TIME_WINDOWS.items():
+            key = (window, t - t % step, span + step)
+            total, n = buckets.get(key, (0, 0))
+            buckets[key] = (total + to_units(score), n + 1)
+    for (window, bucket_start, ttl), (total, n) in buckets.items():
+        sum_key, count_key = _bucket_keys(window, bucket_start)
+        pipe.incrby(sum_key, total)
+        pipe.incrby(count_key, n)
+        pipe.expire(sum_key, ttl)
+        pipe.expire(count_key, ttl)
+
+
+# =========================
+# Reads
+# =========================
+def count_window_mean(total, n):
+    """(mean score, count) from the raw SUM_KEY / COUNT_KEY values, or (None, 0)."""
+    n = int(n or 0)
+    if not n:
+        return None, 0
+    return int(total) / SCALE / n, n
+
+
+def read_count_window(client):
+    """(mean score, count) of the last-100 window from two keys, or (None, 0)."""
+    return count_window_mean(*client.mget(SUM_KEY, COUNT_KEY))
+
+
+def time_window_keys(window, now):
+    span, step = TIME_WINDOWS[window]
+    end = int(now) - int(now) % step
+    keys = []
+    for bucket_start in range(end - span + step, end + step, step):
+        keys.extend(_bucket_keys(window, bucket_start))
+    return keys
+
+
+def time_window_mean(values):
+    """(mean score, count) from the MGET of time_window_keys(...), or (None, 0)."""
+    total = sum(int(v) for v in values[0::2] if v)
+    n = sum(int(v) for v in values[1::2] if v)
+    return (total / SCALE / n, n) if n else (None, 0)
+
+
+def read_time_window(client, window, now):
+    """(mean score, count) of reviews added in the last 5m/1h (to bucket resolution)."""
+    return time_window_mean(client.mget(time_window_keys(window, now)))
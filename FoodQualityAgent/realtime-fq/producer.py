@@ -1,6 +1,8 @@
 # producer.py
 import redis
 
+from stream_config import STREAM, trim_args
+
 # Connect to Redis
 r = redis.Redis(host='localhost', port=6379, decode_responses=True)
 
@@ -8,7 +10,8 @@ def add_review(review_text: str):
     """
     Add a review to the Redis stream.
     """
-    r.xadd("reviews_stream", {"review": review_text})
+    # Trimmed approximately on every XADD (see stream_config.py)
+    r.xadd(STREAM, {"review": review_text}, **trim_args())
     print(f"Review added: {review_text}")
 
 # Example usage
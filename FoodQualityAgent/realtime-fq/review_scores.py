@@ -0,0 +1,79 @@
+# review_scores.py
+import os
+
+# =========================
+# Per-entry review scores
+# =========================
+# The consumer records every score by stream entry id so the archiver can
+# store it next to its review. Scores are kept in one hash per hour of entry
+# time, review_scores:<hour start>, which expires SCORES_RETENTION_S after
+# its hour ends. Redis memory is therefore bounded by the retention whatever
+# trims the stream (the archiver, the producer's approximate MAXLEN/MINID, or
+# nothing at all): fields of trimmed entries go away with their hash. The
+# retention must cover the archiver's lag; the archiver also deletes the
+# fields it has archived.
+
+SCORES_PREFIX = "review_scores"
+BUCKET_S = 3600
+SCORES_RETENTION_S = int(os.getenv("SCORES_RETENTION_S", "86400"))
+
+
+def bucket_start(entry_id):
+    """Stream entry ids start with the XADD time in milliseconds."""
+    t = int(entry_id.split("-", 1)[0]) // 1000
+    return t - t % BUCKET_S
+
+
+def bucket_key(start):
+    return f"{SCORES_PREFIX}:{start}"
+
+
+def _by_bucket(entry_ids):
+    buckets = {}
+    for i, entry_id in enumerate(entry_ids):
+        buckets.setdefault(bucket_start(entry_id), []).append(i)
+    return buckets
+
+
+# =========================
+# Writes (inside the consumer's MULTI)
+# =========================
+def record(pipe, scored):
+    """Adds (entry_id, score) pairs to their hourly hashes."""
+    scored = list(scored)
+    for start, rows in _by_bucket([entry_id for entry_id, _ in scored]).items():
+        key = bucket_key(start)
+        pipe.hset(key, mapping={scored[i][0]: scored[i][1] for i in rows})
+        pipe.expireat(key, start + BUCKET_S + SCORES_RETENTION_S)
+
+
+def forget(pipe, entry_ids):
+    for start, rows in _by_bucket(entry_ids).items():
+        pipe.hdel(bucket_key(start), *[entry_ids[i] for i in rows])
+
+
+# =========================
+# Reads
+# =========================
+def lookup(client, entry_ids):
+    """Score (as stored, or None) per entry id; one pipelined HMGET per hour."""
+    buckets = _by_bucket(entry_ids)
+    with client.pipeline(transaction=False) as pipe:
+        for start, rows in buckets.items():
+            pipe.hmget(bucket_key(start), [entry_ids[i] for i in rows])
+        results = pipe.execute()
+    scores = [None] * len(entry_ids)
+    for rows, values in zip(buckets.values(), results):
+        for i, value in zip(rows, values):
+            scores[i] = value
+    return scores
+
+
+def stored_count(client):
+    keys = list(client.scan_iter(f"{SCORES_PREFIX}:*", count=1000))
+    if not keys:
+        return 0
+    with client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hlen(key)
+        return sum(pipe.execute())
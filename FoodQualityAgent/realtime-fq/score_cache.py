@@ -0,0 +1,260 @@
+# score_cache.py
+import os
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# =========================
+# Review score cache
+# =========================
+# Reviews are keyed by a hash of the input_ids the model's own tokenizer
+# produces (its normalisation, pre-tokenisation and truncation), so two
+# reviews share a cached score exactly when the model sees the same input:
+# "great  pizza" and "great pizza" are scored once, while "Great" and "great"
+# only share a score if the tokenizer lowercases. Without a tokenizer the key
+# is the exact text. Each consumer keeps a bounded LRU with a TTL in memory;
+# with a Redis client the entries are also shared (SET ... EX) so one
+# consumer's scores serve the others. Optionally, a MinHash/LSH index finds
+# near-duplicate reviews (copy-pasted templates, a changed emoji) and reuses
+# their score when the estimated Jaccard similarity is high enough; that reuse
+# is approximate by design, which is why it is off by default.
+
+SCORE_CACHE_SIZE = int(os.getenv("SCORE_CACHE_SIZE", "10000"))
+SCORE_CACHE_TTL_S = int(os.getenv("SCORE_CACHE_TTL_S", str(24 * 3600)))
+# Manual prefix; consumer.make_scorer appends the model identity (weights +
+# backend), so a retrained model never reuses old scores.
+SCORE_CACHE_NAMESPACE = os.getenv("SCORE_CACHE_NAMESPACE", "v1")
+SCORE_CACHE_NEAR_DUP = os.getenv("SCORE_CACHE_NEAR_DUP", "0") == "1"
+NEAR_DUP_THRESHOLD = float(os.getenv("SCORE_CACHE_NEAR_DUP_THRESHOLD", "0.9"))
+
+_WHITESPACE = re.compile(r"\s+")
+_WORD = re.compile(r"\w+")
+
+
+def normalise(text):
+    """Loose form for near-duplicate shingles only; never a cache key."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text).casefold()).strip()
+
+
+def text_key(text):
+    return "text:" + hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def exact_keys(texts):
+    """Fallback keys: only identical reviews share a score."""
+    return [text_key(t) for t in texts]
+
+
+class TokenizerKeys:
+    """Keys reviews by their input_ids, as tokenized for the model (same settings as the API)."""
+
+    def __init__(self, tokenizer, max_length=128):
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+
+    def __call__(self, texts):
+        rows = self.tokenizer(list(texts), truncation=True, max_length=self.max_length)["input_ids"]
+        return ["ids:" + hashlib.blake2b(",".join(map(str, row)).encode("ascii"), digest_size=16).hexdigest()
+                for row in rows]
+
+
+# =========================
+# MinHash near-duplicate index
+# =========================
+class MinHashIndex:
+    """LSH over MinHash signatures of word 3-gram shingles (bands x rows hashes)."""
+
+    def __init__(self, bands=16, rows=4):
+        self.bands = bands
+        self.rows = rows
+        self.num_perm = bands * rows
+        self._signatures = {}   # key -> signature tuple
+        self._buckets = {}      # (band, band hash) -> set of keys
+
+    def signature(self, text):
+        words = _WORD.findall(normalise(text))
+        shingles = {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+                  for s in shingles]
+        # Permutation i: h XOR seed_i, then mixed; min over shingles.
+        return tuple(
+            min(((h ^ seed) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF for h in hashes)
+            for seed in _PERM_SEEDS[:self.num_perm]
+        )
+
+    def _band_keys(self, signature):
+        for b in range(self.bands):
+            yield b, hash(signature[b * self.rows:(b + 1) * self.rows])
+
+    def add(self, key, text):
+        if key in self._signatures:
+            return
+        signature = self.signature(text)
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def query(self, text, threshold=NEAR_DUP_THRESHOLD):
+        """Key of the most similar indexed text if its estimated Jaccard >= threshold, else None."""
+        signature = self.signature(text)
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates |= self._buckets.get(band_key, set())
+        best, best_sim = None, threshold
+        for key in candidates:
+            other = self._signatures[key]
+            sim = sum(a == b for a, b in zip(signature, other)) / self.num_perm
+            if sim >= best_sim:
+                best, best_sim = key, sim
+        return best
+
+
+_PERM_SEEDS = [int.from_bytes(hashlib.blake2b(str(i).encode(), digest_size=8).digest(), "big") for i in range(256)]
+
+
+# =========================
+# Cache
+# =========================
+class ScoreCache:
+    """Bounded LRU + TTL cache of review scores, optionally shared through Redis."""
+
+    def __init__(self, max_entries=SCORE_CACHE_SIZE, ttl_s=SCORE_CACHE_TTL_S, redis_client=None,
+                 namespace=SCORE_CACHE_NAMESPACE, near_duplicates=SCORE_CACHE_NEAR_DUP, keys=exact_keys):
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self.redis = redis_client
+        self.prefix = f"score_cache:{namespace}:"
+        self.near_dup = MinHashIndex() if near_duplicates else None
+        self.keys = keys   # texts -> cache keys (TokenizerKeys or exact_keys)
+        self._entries = OrderedDict()   # key -> (score, expires_at)
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.near_dup_hits = 0
+        self.misses = 0
+
+    def _get_local(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        score, expires_at = entry
+        if expires_at <= now:
+            del self._entries[key]
+            if self.near_dup is not None:
+                self.near_dup.remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return score
+
+    def _put_local(self, key, score, now, text=None):
+        self._entries[key] = (score, now + self.ttl_s)
+        self._entries.move_to_end(key)
+        if self.near_dup is not None and text is not None:
+            self.near_dup.add(key, text)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            if self.near_dup is not None:
+                self.near_dup.remove(evicted)
+
+    def get_many(self, texts, keys=None):
+        """Cached score (or None) per text: local LRU, then one Redis MGET, then near-duplicates."""
+        now = time.time()
+        keys = self.keys(texts) if keys is None else keys
+        with self._lock:
+            scores = [self._get_local(k, now) for k in keys]
+            self.local_hits += sum(s is not None for s in scores)
+
+        missing = [i for i, s in enumerate(scores) if s is None]
+        if missing and self.redis is not None:
+            try:
+                shared = self.redis.mget([self.prefix + keys[i] for i in missing])
+            except Exception as e:
+                print(f"Score cache: Redis lookup failed: {e}")
+                shared = [None] * len(missing)
+            with self._lock:
+                for i, value in zip(missing, shared):
+                    if value is not None:
+                        scores[i] = float(value)
+                        self.shared_hits += 1
+                        self._put_local(keys[i], scores[i], now, texts[i])
+
+        if self.near_dup is not None:
+            with self._lock:
+                for i in missing:
+                    if scores[i] is None:
+                        match = self.near_dup.query(texts[i])
+                        if match is not None:
+                            scores[i] = self._get_local(match, now)
+                            self.near_dup_hits += scores[i] is not None
+
+        with self._lock:
+            self.misses += sum(s is None for s in scores)
+        return scores
+
+    def put_many(self, texts, scores, keys=None):
+        now = time.time()
+        keys = self.keys(texts) if keys is None else keys
+        pairs = [(k, t, s) for k, t, s in zip(keys, texts, scores) if s is not None]
+        with self._lock:
+            for key, text, score in pairs:
+                self._put_local(key, score, now, text)
+        if pairs and self.redis is not None:
+            try:
+                with self.redis.pipeline(transaction=False) as pipe:
+                    for key, _, score in pairs:
+                        pipe.set(self.prefix + key, score, ex=self.ttl_s)
+                    pipe.execute()
+            except Exception as e:
+                print(f"Score cache: Redis write failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            hits = self.local_hits + self.shared_hits + self.near_dup_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "local_hits": self.local_hits,
+                "shared_hits": self.shared_hits,
+                "near_dup_hits": self.near_dup_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class CachedScorer:
+    """Wraps a batch scorer: cached reviews are answered directly, the rest (deduplicated) scored in one call."""
+
+    def __init__(self, scorer, cache):
+        self.scorer = scorer
+        self.cache = cache
+
+    def __call__(self, reviews):
+        keys = self.cache.keys(reviews)
+        scores = self.cache.get_many(reviews, keys)
+        pending = {}
+        for i, score in enumerate(scores):
+            if score is None:
+                pending.setdefault(keys[i], []).append(i)
+        if pending:
+            unique = [reviews[positions[0]] for positions in pending.values()]
+            fresh = self.scorer(unique)
+            self.cache.put_many(unique, fresh, list(pending))
+            for positions, score in zip(pending.values(), fresh):
+                for i in positions:
+                    scores[i] = score
+        return scores
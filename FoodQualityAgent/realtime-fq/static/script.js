@@ -0,0 +1,69 @@
+// Live updates for the Food Quality dashboard. The server pushes a new
+// snapshot over Server-Sent Events whenever the consumer writes one, so the
+// page no longer reloads on a timer. EventSource reconnects on its own and
+// sends Last-Event-ID, so an unchanged snapshot is not sent twice.
+
+function scoreColour(score) {
+    if (score >= 0.75) return "green";
+    if (score >= 0.5) return "blue";
+    return "red";
+}
+
+const BADGE_CLASSES = {
+    green: "brutal-badge bg-green-500 text-white",
+    blue: "brutal-badge bg-blue-600 text-white",
+    red: "brutal-badge bg-red-500 text-white",
+};
+const VERDICTS = {
+    green: ["text-green-600", "Good"],
+    blue: ["text-blue-600", "Average"],
+    red: ["text-red-600", "Bad"],
+};
+
+function setTextColour(el, colour) {
+    el.classList.remove("text-green-600", "text-blue-600", "text-red-600");
+    el.classList.add(`text-${colour}-600`);
+}
+
+function renderRow(review) {
+    const colour = scoreColour(review.score);
+    const row = document.createElement("tr");
+
+    const text = document.createElement("td");
+    text.className = "font-medium text-gray-800";
+    text.textContent = review.review;
+
+    const score = document.createElement("td");
+    score.className = "text-center";
+    const badge = document.createElement("span");
+    badge.className = BADGE_CLASSES[colour];
+    badge.textContent = Math.round(review.score * 1000) / 1000;
+    score.appendChild(badge);
+
+    const verdict = document.createElement("td");
+    verdict.className = "text-center font-black uppercase text-xs tracking-wider";
+    const verdictText = document.createElement("span");
+    [verdictText.className, verdictText.textContent] = VERDICTS[colour];
+    verdict.appendChild(verdictText);
+
+    row.append(text, score, verdict);
+    return row;
+}
+
+function render(data) {
+    const colour = scoreColour(data.holisticScore);
+    const score = document.getElementById("holistic-score");
+    const label = document.getElementById("holistic-label");
+    score.textContent = data.holisticScore;
+    label.textContent = data.holisticLabel;
+    setTextColour(score, colour);
+    setTextColour(label, colour);
+
+    const table = document.getElementById("history-table");
+    if (data.reviews.length) {
+        table.replaceChildren(...data.reviews.map(renderRow));
+    }
+}
+
+const source = new EventSource("/api/dashboard/stream");
+source.addEventListener("dashboard", (event) => render(JSON.parse(event.data)));
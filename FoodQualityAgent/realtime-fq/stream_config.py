@@ -0,0 +1,28 @@
+# stream_config.py
+import os
+import time
+
+# =========================
+# Shared stream names and retention
+# =========================
+# Imported by the producers (producer.py and review submission/
+# producer_interface.py), the consumer and the archiver, so none of them has
+# to import another one's module just for a key name.
+
+STREAM = "reviews_stream"
+DEAD_LETTER_STREAM = "reviews_dead_letter"
+
+# Retention: every XADD trims the stream approximately (whole macro nodes, so
+# it stays cheap). By default it keeps about STREAM_MAXLEN entries; with
+# STREAM_RETENTION_S set it drops entries older than that instead. This is a
+# memory cap: archiver.py normally moves consumed entries out long before.
+# Scores of trimmed entries expire on their own (see review_scores.py).
+STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", "100000"))
+STREAM_RETENTION_S = int(os.getenv("STREAM_RETENTION_S", "0"))
+
+
+def trim_args():
+    """Keyword arguments for XADD."""
+    if STREAM_RETENTION_S > 0:
+        return {"minid": int((time.time() - STREAM_RETENTION_S) * 1000), "approximate": True}
+    return {"maxlen": STREAM_MAXLEN, "approximate": True}
@@ -0,0 +1,79 @@
+import hashlib
+import itertools
+
+import pytest
+
+from score_cache import CachedScorer, ScoreCache, TokenizerKeys, exact_keys
+
+tokenizers = pytest.importorskip("tokenizers")
+transformers = pytest.importorskip("transformers")
+
+# Pairs a text-level normaliser (NFKC + casefold) would merge but a cased,
+# NFKC-free tokenizer keeps apart: case, full-width forms, a ligature, a circled digit.
+TRICKY = [
+    "Great pizza", "great pizza", "GREAT PIZZA",
+    "ｇｒｅａｔ pizza", "The ﬁsh was fine", "The fish was fine",
+    "① star", "1 star", "great  pizza", " great pizza ",
+]
+
+
+def make_tokenizer(lowercase):
+    words = sorted({w for text in TRICKY for w in text.split()} | {w.lower() for text in TRICKY for w in text.split()})
+    vocab = {token: i for i, token in enumerate(["[PAD]", "[UNK]", "[CLS]", "[SEP]"] + words)}
+    tok = tokenizers.Tokenizer(tokenizers.models.WordPiece(vocab, unk_token="[UNK]"))
+    tok.normalizer = tokenizers.normalizers.BertNormalizer(lowercase=lowercase, strip_accents=False)
+    tok.pre_tokenizer = tokenizers.pre_tokenizers.BertPreTokenizer()
+    tok.post_processor = tokenizers.processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", vocab["[CLS]"]), ("[SEP]", vocab["[SEP]"])]
+    )
+    return transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tok, unk_token="[UNK]", pad_token="[PAD]", cls_token="[CLS]", sep_token="[SEP]"
+    )
+
+
+def model_scores(tokenizer):
+    """A stand-in model: a deterministic function of exactly the input_ids it is given."""
+    def score(texts):
+        rows = tokenizer(list(texts), truncation=True, max_length=128)["input_ids"]
+        return [int.from_bytes(hashlib.blake2b(str(row).encode(), digest_size=4).digest(), "big") / 2**32
+                for row in rows]
+    return score
+
+
+@pytest.mark.parametrize("lowercase", [False, True])
+def test_texts_with_different_model_scores_never_share_a_key(lowercase):
+    tokenizer = make_tokenizer(lowercase)
+    keys = dict(zip(TRICKY, TokenizerKeys(tokenizer)(TRICKY)))
+    scores = dict(zip(TRICKY, model_scores(tokenizer)(TRICKY)))
+    for a, b in itertools.combinations(TRICKY, 2):
+        if scores[a] != scores[b]:
+            assert keys[a] != keys[b], (a, b)
+        else:
+            assert keys[a] == keys[b], (a, b)   # the cache still merges what the model cannot tell apart
+
+
+def test_cased_tokenizer_keeps_case_and_compatibility_forms_apart():
+    keys = TokenizerKeys(make_tokenizer(lowercase=False))
+    great, lower, wide, circled, digit = keys(["Great pizza", "great pizza", "ｇｒｅａｔ pizza", "① star", "1 star"])
+    assert len({great, lower, wide}) == 3
+    assert circled != digit
+    assert keys(["great  pizza"]) == [lower]
+
+
+def test_cached_scorer_serves_each_text_its_own_model_score():
+    tokenizer = make_tokenizer(lowercase=False)
+    score = model_scores(tokenizer)
+    calls = []
+
+    def scorer(texts):
+        calls.append(list(texts))
+        return score(texts)
+
+    cached = CachedScorer(scorer, ScoreCache(keys=TokenizerKeys(tokenizer)))
+    assert cached(["Great pizza"]) == score(["Great pizza"])
+    assert cached(["great pizza", "Great pizza"]) == score(["great pizza", "Great pizza"])
+    assert calls == [["Great pizza"], ["great pizza"]]
+
+
+def test_exact_keys_only_merge_identical_text():
+    assert len(set(exact_keys(["Great pizza", "great pizza", "great  pizza"]))) == 3
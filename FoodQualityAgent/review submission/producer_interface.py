@@ -3,6 +3,15 @@ import redis
 import time
 import threading
 import random
+import os
+import sys
+
+# Stream name and trimming are shared with realtime-fq (stream_config.py).
+REALTIME_FQ_DIR = os.path.abspath(os.getenv(
+    "REALTIME_FQ_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "realtime-fq")
+))
+sys.path.insert(0, REALTIME_FQ_DIR)
+from stream_config import STREAM, trim_args
 
 app = Flask(__name__)
 app.secret_key = "super_secret_key"
@@ -52,11 +61,11 @@ def generate_auto_reviews():
                 review_text = f"I didn't like the {item}, it was {opinion}. {rating} stars."
 
             # Add to Redis Stream
-            entry_id = r.xadd("reviews_stream", {
+            entry_id = r.xadd(STREAM, {
                 "review": review_text,
                 "timestamp": time.time(),
                 "type": "auto-generated"
-            })
+            }, **trim_args())
 
             print(f"[Auto-Gen] Sent: {review_text} (ID: {entry_id})")
             
@@ -73,11 +82,11 @@ def index():
     if request.method == "POST":
         review_text = request.form.get("review")
         if review_text:
-            r.xadd("reviews_stream", {
+            r.xadd(STREAM, {
                 "review": review_text,
                 "timestamp": time.time(),
                 "type": "manual"
-            })
+            }, **trim_args())
             flash("Review submitted manually!", "success")
             return redirect(url_for("index"))
         else:
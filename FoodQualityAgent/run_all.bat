@@ -13,4 +13,7 @@ start cmd /k "cd realtime-fq && python app.py"
 :: Start Consumer
 start cmd /k "cd realtime-fq && python consumer.py"
 
+:: Start Stream Archiver (consumed reviews -> Parquet)
+start cmd /k "cd realtime-fq && python archiver.py"
+
 echo All services started!